@@ -4,7 +4,60 @@
 import threading
 import time
 from typing import List, NamedTuple, Tuple, Optional
-from dataclasses import dataclass
+
+# NumPy 可选依赖：深档位订单簿的深度统计可走向量化路径
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:
+    np = None
+    HAVE_NUMPY = False
+
+# Numba 可选依赖：批量回放历史 tick 时 JIT 编译价差计算
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Numba 未安装时的空装饰器，保持纯 Python 路径可用"""
+        if args and callable(args[0]):
+            return args[0]
+        def wrapper(func):
+            return func
+        return wrapper
+
+
+@njit(cache=True, fastmath=True)
+def _compute_net_spreads(bid_bin, ask_bin, bid_hyp, ask_hyp,
+                         bin_taker_mul, hyp_maker_mul, hyp_taker_mul, bin_maker_mul,
+                         out_a, out_b):
+    """
+    批量计算扣除手续费后的净价差（逐元素，供回测使用）
+
+    与 get_spread_with_fees 的标量逻辑一致：
+        out_a[i]: Binance 买 (taker) -> Hyper 卖 (maker)
+        out_b[i]: Hyper 买 (taker) -> Binance 卖 (maker)
+    """
+    for i in range(len(bid_bin)):
+        out_a[i] = bid_hyp[i] * hyp_maker_mul - ask_bin[i] * bin_taker_mul
+        out_b[i] = bid_bin[i] * bin_maker_mul - ask_hyp[i] * hyp_taker_mul
+
+# 单调时钟：避免 NTP 校时导致过期检查出错，绑定为模块级名字减少一次属性查找
+_now = time.monotonic
+
+# 最小价差阈值：模块导入时读取一次，避免每个 tick 重复 import/getattr
+try:
+    import config as _cfg
+    _MIN_THRESHOLD = getattr(_cfg, 'MIN_SPREAD_THRESHOLD', 0.0)
+except ImportError:
+    _MIN_THRESHOLD = 0.0
+
+# 交易所整数编号：热路径上用数组下标替代字符串 dict 查找
+EX_BIN = 0  # Binance
+EX_HYP = 1  # Hyperliquid
+_EXCHANGE_IDS = {"Binance": EX_BIN, "Hyperliquid": EX_HYP}
 
 
 # ==================== 数据结构 ====================
@@ -15,34 +68,111 @@ class Level(NamedTuple):
 
 
 class L2Book:
-    def __init__(self, coin: str, bids: List[Level], asks: List[Level], timestamp: int):
+    """
+    L2 订单簿
+
+    bids/asks 支持两种存储：List[Level]（无 NumPy 时的回退），
+    或 (n, 3) float64 ndarray，列布局 [price, size, orders]——
+    后者由 parse_l2book 直接生成，省掉每个 tick 的 NamedTuple 分配。
+    单侧一块 (n, 3) 连续内存而非三个独立数组：每帧少两次数组分配，
+    列式访问通过下面的零拷贝列视图属性（bid_prices 等）提供。
+    """
+    __slots__ = ('coin', 'bids', 'asks', 'timestamp')
+
+    def __init__(self, coin: str, bids, asks, timestamp: int):
         self.coin = coin
         self.bids = bids
         self.asks = asks
         self.timestamp = timestamp
 
+    def best_bid(self) -> float:
+        """买一价（无数据返回 0.0）"""
+        if len(self.bids) == 0:
+            return 0.0
+        first = self.bids[0]
+        if HAVE_NUMPY and isinstance(first, np.ndarray):
+            return float(first[0])
+        return first.price
+
+    def best_ask(self) -> float:
+        """卖一价（无数据返回 0.0）"""
+        if len(self.asks) == 0:
+            return 0.0
+        first = self.asks[0]
+        if HAVE_NUMPY and isinstance(first, np.ndarray):
+            return float(first[0])
+        return first.price
+
     def mid_price(self) -> float:
         """中间价"""
-        if self.bids and self.asks:
-            return (self.bids[0].price + self.asks[0].price) / 2
+        if len(self.bids) and len(self.asks):
+            return (self.best_bid() + self.best_ask()) / 2
         return 0.0
 
     def spread(self) -> float:
         """买卖价差"""
-        if self.bids and self.asks:
-            return self.asks[0].price - self.bids[0].price
+        if len(self.bids) and len(self.asks):
+            return self.best_ask() - self.best_bid()
         return 0.0
 
-    def depth(self, side: str, levels: int = 5) -> float:
-        """累计深度（前 N 档总挂单量）"""
-        side_list = self.bids if side.lower() == "buy" else self.asks
+    # ---- 列式（SoA）访问：向量化价差/VWAP 运算入口 ----
+    # ndarray 路径返回列视图（零拷贝），可直接参与
+    # book.bid_prices @ book.bid_sizes 这类向量运算；
+    # List[Level] 回退路径构造普通 list，语义一致但逐元素
+
+    @staticmethod
+    def _column(side_list, col: int):
+        if HAVE_NUMPY and isinstance(side_list, np.ndarray):
+            return side_list[:, col]
+        return [lvl[col] for lvl in side_list]
+
+    @property
+    def bid_prices(self):
+        """买盘价格列"""
+        return self._column(self.bids, 0)
+
+    @property
+    def bid_sizes(self):
+        """买盘挂单量列"""
+        return self._column(self.bids, 1)
+
+    @property
+    def ask_prices(self):
+        """卖盘价格列"""
+        return self._column(self.asks, 0)
+
+    @property
+    def ask_sizes(self):
+        """卖盘挂单量列"""
+        return self._column(self.asks, 1)
+
+    @staticmethod
+    def _side_depth(side_list, levels: int) -> float:
+        # (n, 3) ndarray 布局 [price, size, orders]：size 列原生求和，
+        # 深档位（50+）下避免逐个 NamedTuple 解包
+        if HAVE_NUMPY and isinstance(side_list, np.ndarray):
+            return float(side_list[:levels, 1].sum())
         return sum(l.size for l in side_list[:levels])
 
+    def bid_depth(self, levels: int = 5) -> float:
+        """买盘累计深度（前 N 档总挂单量）"""
+        return self._side_depth(self.bids, levels)
+
+    def ask_depth(self, levels: int = 5) -> float:
+        """卖盘累计深度（前 N 档总挂单量）"""
+        return self._side_depth(self.asks, levels)
+
+    def depth(self, side: str, levels: int = 5) -> float:
+        """累计深度（兼容旧接口；新代码请直接用 bid_depth/ask_depth）"""
+        if side.lower() == "buy":
+            return self.bid_depth(levels)
+        return self.ask_depth(levels)
+
     def __str__(self):
         return (f"L2Book[{self.coin}] mid={self.mid_price():.6f} "
                 f"spread={self.spread():.6f} "
-                f"bid_depth5={self.depth('buy', 5):.1f} "
-                f"ask_depth5={self.depth('ask', 5):.1f}")
+                f"bid_depth5={self.bid_depth(5):.1f} "
+                f"ask_depth5={self.ask_depth(5):.1f}")
 
 
 # ==================== 数据存储 ====================
@@ -51,22 +181,37 @@ class L2Book:
 
 
 # ==================== 轻量级价差计算容器 ====================
-@dataclass
 class Ticker:
-    """单个交易所的价格快照"""
-    bid_price: float = 0.0
-    ask_price: float = 0.0
-    timestamp: float = 0.0
+    """单个交易所的价格快照（__slots__ 省掉实例 __dict__，属性访问更快）"""
+    __slots__ = ('bid_price', 'ask_price', 'timestamp')
+
+    def __init__(self, bid_price: float = 0.0, ask_price: float = 0.0, timestamp: float = 0.0):
+        self.bid_price = bid_price
+        self.ask_price = ask_price
+        self.timestamp = timestamp
 
 
 class PriceBoard:
-    """轻量级价格板，用于实时价差计算"""
+    """
+    轻量级价格板，用于实时价差计算
+
+    并发模型（RCU 风格）：写入方在锁内构造一个新的不可变快照元组，
+    然后一次性替换 self._snap（GIL 下属性赋值是原子的）；
+    读取方只做一次 snap = self._snap，完全不加锁，读写互不阻塞。
+    快照布局: (bin_bid, bin_ask, bin_ts, hyp_bid, hyp_ask, hyp_ts)
+    """
     def __init__(self):
-        self.lock = threading.Lock()  # 线程锁
-        self.prices = {
-            "Binance": Ticker(),
-            "Hyperliquid": Ticker()
-        }
+        self.lock = threading.Lock()  # 写锁：只用于序列化并发写入
+        # 写入侧状态：交易所固定只有两个，直接展开成六个浮点属性，
+        # 免去 Ticker 容器与下标间接层
+        self._bin_bid = 0.0
+        self._bin_ask = 0.0
+        self._bin_ts = 0.0
+        self._hyp_bid = 0.0
+        self._hyp_ask = 0.0
+        self._hyp_ts = 0.0
+        # 不可变快照，读路径唯一入口
+        self._snap = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
         self.max_delay_seconds = 1.0
         # 手续费配置（从 config 导入，避免循环依赖）
         try:
@@ -82,41 +227,75 @@ class PriceBoard:
             self.hyper_maker_fee = 0.0002
             self.hyper_taker_fee = 0.0004
 
-    def update(self, exchange: str, bid: float, ask: float):
-        """收到WebSocket推送时更新（静默更新，不计算）"""
-        with self.lock:  # 写操作加锁
-            ticker = self.prices[exchange]
-            ticker.bid_price = bid
-            ticker.ask_price = ask
-            ticker.timestamp = time.time()
+        # 预计算手续费乘数，避免每个 tick 重复做 (1 +/- fee) 运算
+        self._bin_taker_mul = 1 + self.binance_taker_fee
+        self._bin_maker_mul = 1 - self.binance_maker_fee
+        self._hyp_taker_mul = 1 + self.hyper_taker_fee
+        self._hyp_maker_mul = 1 - self.hyper_maker_fee
+
+    def update(self, ex_id: int, bid: float, ask: float):
+        """
+        收到WebSocket推送时更新（静默更新，不计算）
+
+        参数:
+            ex_id: 交易所整数编号（EX_BIN / EX_HYP），避免字符串 dict 查找
+        """
+        ts = _now()  # 在临界区外取时间戳，减少锁内开销
+        with self.lock:  # 写操作加锁（只序列化写入方）
+            if ex_id == EX_BIN:
+                self._bin_bid = bid
+                self._bin_ask = ask
+                self._bin_ts = ts
+            else:
+                self._hyp_bid = bid
+                self._hyp_ask = ask
+                self._hyp_ts = ts
+            # 发布新快照：构造新元组后原子替换引用，读取方无需加锁
+            self._snap = (self._bin_bid, self._bin_ask, self._bin_ts,
+                          self._hyp_bid, self._hyp_ask, self._hyp_ts)
+
+    def get_bid(self, ex_id: int) -> Optional[float]:
+        """获取指定交易所的买一价（无效或过期返回 None）"""
+        snap = self._snap  # 无锁读：一次引用读取拿到一致快照
+        base = ex_id * 3
+        bid = snap[base]
+        if bid == 0.0 or (_now() - snap[base + 2]) > self.max_delay_seconds:
+            return None
+        return bid
+
+    def get_ask(self, ex_id: int) -> Optional[float]:
+        """获取指定交易所的卖一价（无效或过期返回 None）"""
+        snap = self._snap
+        base = ex_id * 3
+        if snap[base] == 0.0 or (_now() - snap[base + 2]) > self.max_delay_seconds:
+            return None
+        return snap[base + 1]
 
     def get_price(self, exchange: str, side: str) -> Optional[float]:
         """
-        获取指定交易所和方向的价格
-        
+        获取指定交易所和方向的价格（兼容旧接口）
+
+        热路径请直接用 get_bid/get_ask(ex_id)，这里保留字符串分发
+        仅供下单等冷路径调用。
+
         参数:
             exchange: 交易所名称 ("Binance" 或 "Hyperliquid")
             side: 方向 ("bid" 或 "ask")
-        
+
         返回:
             价格值，如果数据无效或过期返回 None
         """
-        with self.lock:
-            if exchange not in self.prices:
-                return None
-            ticker = self.prices[exchange]
-            
-            now = time.time()
-            # 检查数据有效性
-            if ticker.bid_price == 0 or (now - ticker.timestamp) > self.max_delay_seconds:
-                return None
-            
-            if side.lower() == "bid":
-                return ticker.bid_price
-            elif side.lower() == "ask":
-                return ticker.ask_price
-            else:
-                return None
+        ex_id = _EXCHANGE_IDS.get(exchange)
+        if ex_id is None:
+            return None
+
+        side = side.lower()
+        if side == "bid":
+            return self.get_bid(ex_id)
+        elif side == "ask":
+            return self.get_ask(ex_id)
+        else:
+            return None
 
     def get_spread(self) -> Tuple[Optional[float], Optional[float]]:
         """
@@ -128,31 +307,25 @@ class PriceBoard:
             - spread_buy_hyp: Hyper 买 (Ask) -> Binance 卖 (Bid) 的价差
             如果数据无效或过期，返回 (None, None)
         """
-        with self.lock:  # 读操作加锁，保证读取的一瞬间数据是一致的
-            binance = self.prices["Binance"]
-            hyper = self.prices["Hyperliquid"]
-            
-            now = time.time()
-
-            # 初始化检查：防止刚启动时价格为 0
-            if binance.bid_price == 0 or hyper.bid_price == 0:
-                return None, None
-
-            # 风控：过期检查
-            if (now - binance.timestamp) > self.max_delay_seconds:
-                return None, None
-            
-            if (now - hyper.timestamp) > self.max_delay_seconds:
-                return None, None
-
-            # 计算价差
-            # 方向 A: Binance 买 (Ask) -> Hyper 卖 (Bid)
-            spread_buy_bin = hyper.bid_price - binance.ask_price
-            
-            # 方向 B: Hyper 买 (Ask) -> Binance 卖 (Bid)
-            spread_buy_hyp = binance.bid_price - hyper.ask_price
-
-            return spread_buy_bin, spread_buy_hyp
+        # 无锁读：快照元组不可变，读取的一瞬间数据天然一致
+        bin_bid, bin_ask, bin_ts, hyp_bid, hyp_ask, hyp_ts = self._snap
+        now = _now()
+
+        # 初始化检查 + 过期风控：年龄只算一次，合并为单分支
+        bin_age = now - bin_ts
+        hyp_age = now - hyp_ts
+        if (bin_bid == 0.0 or hyp_bid == 0.0 or
+                bin_age > self.max_delay_seconds or hyp_age > self.max_delay_seconds):
+            return None, None
+
+        # 计算价差
+        # 方向 A: Binance 买 (Ask) -> Hyper 卖 (Bid)
+        spread_buy_bin = hyp_bid - bin_ask
+
+        # 方向 B: Hyper 买 (Ask) -> Binance 卖 (Bid)
+        spread_buy_hyp = bin_bid - hyp_ask
+
+        return spread_buy_bin, spread_buy_hyp
     
     def get_spread_with_fees(self) -> Tuple[Optional[float], Optional[float]]:
         """
@@ -168,34 +341,77 @@ class PriceBoard:
             - 开仓：Binance 买入（taker）+ Hyper 卖出（maker）
             - 平仓：Binance 卖出（maker）+ Hyper 买入（taker）
         """
-        with self.lock:
-            binance = self.prices["Binance"]
-            hyper = self.prices["Hyperliquid"]
-            
-            now = time.time()
-            
-            # 数据有效性检查
-            if (binance.bid_price == 0 or hyper.bid_price == 0 or
-                (now - binance.timestamp) > self.max_delay_seconds or
-                (now - hyper.timestamp) > self.max_delay_seconds):
-                return None, None
-            
-            # 计算考虑手续费后的净价差
-            # 方向 A: Binance 买 (taker) -> Hyper 卖 (maker)
-            # 成本：Binance ask * (1 + taker_fee)
-            # 收入：Hyper bid * (1 - maker_fee)
-            cost_buy_bin = binance.ask_price * (1 + self.binance_taker_fee)
-            revenue_sell_hyper = hyper.bid_price * (1 - self.hyper_maker_fee)
-            net_spread_buy_bin = revenue_sell_hyper - cost_buy_bin
-            
-            # 方向 B: Hyper 买 (taker) -> Binance 卖 (maker)
-            # 成本：Hyper ask * (1 + taker_fee)
-            # 收入：Binance bid * (1 - maker_fee)
-            cost_buy_hyper = hyper.ask_price * (1 + self.hyper_taker_fee)
-            revenue_sell_bin = binance.bid_price * (1 - self.binance_maker_fee)
-            net_spread_buy_hyp = revenue_sell_bin - cost_buy_hyper
-            
-            return net_spread_buy_bin, net_spread_buy_hyp
+        return self._net_spreads_unlocked()
+
+    def _net_spreads_unlocked(self) -> Tuple[Optional[float], Optional[float]]:
+        """
+        无锁计算净价差的共享实现
+
+        get_spread_with_fees 与 evaluate_signals 都走这里：
+        一次快照读 + 预计算乘数，全程不加锁、不可重入任何锁。
+        """
+        bin_bid, bin_ask, bin_ts, hyp_bid, hyp_ask, hyp_ts = self._snap
+        now = _now()
+
+        # 数据有效性检查：年龄只算一次，单分支合并（正常情况下不跳转）
+        bin_age = now - bin_ts
+        hyp_age = now - hyp_ts
+        if (bin_bid == 0.0 or hyp_bid == 0.0 or
+                bin_age > self.max_delay_seconds or hyp_age > self.max_delay_seconds):
+            return None, None
+
+        # 计算考虑手续费后的净价差（乘数已在 __init__ 预计算）
+        # 方向 A: Binance 买 (taker) -> Hyper 卖 (maker)
+        net_spread_buy_bin = hyp_bid * self._hyp_maker_mul - bin_ask * self._bin_taker_mul
+
+        # 方向 B: Hyper 买 (taker) -> Binance 卖 (maker)
+        net_spread_buy_hyp = bin_bid * self._bin_maker_mul - hyp_ask * self._hyp_taker_mul
+
+        return net_spread_buy_bin, net_spread_buy_hyp
+
+    def evaluate_signals(self, threshold: float = None) -> Tuple[bool, bool]:
+        """
+        一次快照读同时评估开仓与平仓信号
+
+        相比分别调用 open_signal/close_signal（各自再走一遍
+        get_spread_with_fees），这里只读一次快照、只算一遍净价差。
+
+        返回:
+            (open_ok, close_ok)
+            - open_ok: Binance 买 (taker) -> Hyper 卖 (maker) 净价差超过阈值
+            - close_ok: Hyper 买 (taker) -> Binance 卖 (maker) 净价差超过阈值
+            数据无效或过期时返回 (False, False)
+        """
+        if threshold is None:
+            threshold = _MIN_THRESHOLD
+
+        net_spread_buy_bin, net_spread_buy_hyp = self._net_spreads_unlocked()
+        if net_spread_buy_bin is None:
+            return False, False
+
+        return net_spread_buy_bin > threshold, net_spread_buy_hyp > threshold
+
+    def compute_batch(self, bid_bin, ask_bin, bid_hyp, ask_hyp):
+        """
+        批量计算净价差（回测用）
+
+        参数为四个等长 float64 数组；返回 (net_a, net_b) 两个数组，
+        含义与 get_spread_with_fees 的两个方向一致。
+        安装了 Numba 时内层循环走 JIT 编译，否则退回纯 Python。
+        """
+        if not HAVE_NUMPY:
+            raise RuntimeError("compute_batch 需要安装 numpy")
+        bid_bin = np.ascontiguousarray(bid_bin, dtype=np.float64)
+        ask_bin = np.ascontiguousarray(ask_bin, dtype=np.float64)
+        bid_hyp = np.ascontiguousarray(bid_hyp, dtype=np.float64)
+        ask_hyp = np.ascontiguousarray(ask_hyp, dtype=np.float64)
+        out_a = np.empty_like(bid_bin)
+        out_b = np.empty_like(bid_bin)
+        _compute_net_spreads(bid_bin, ask_bin, bid_hyp, ask_hyp,
+                             self._bin_taker_mul, self._hyp_maker_mul,
+                             self._hyp_taker_mul, self._bin_maker_mul,
+                             out_a, out_b)
+        return out_a, out_b
 
 
 # 全局价格板实例
@@ -217,16 +433,10 @@ class DataBuffer:
         net_spread_buy_bin, _ = price_board.get_spread_with_fees()
         if net_spread_buy_bin is None:
             return False
-        
-        # 获取最小价差阈值
-        try:
-            import config as cfg
-            min_threshold = cfg.MIN_SPREAD_THRESHOLD
-        except (ImportError, AttributeError):
-            min_threshold = 0.0
-        
+
         # 只有当净价差（扣除手续费后）大于阈值时，才触发开仓
-        return net_spread_buy_bin > min_threshold
+        # 阈值已在模块导入时缓存为 _MIN_THRESHOLD，无需每次 import/getattr
+        return net_spread_buy_bin > _MIN_THRESHOLD
 
     @classmethod
     def close_signal(cls, coin: str) -> bool:
@@ -239,26 +449,17 @@ class DataBuffer:
         _, net_spread_buy_hyp = price_board.get_spread_with_fees()
         if net_spread_buy_hyp is None:
             return False
-        
-        # 获取最小价差阈值
-        try:
-            import config as cfg
-            min_threshold = cfg.MIN_SPREAD_THRESHOLD
-        except (ImportError, AttributeError):
-            min_threshold = 0.0
-        
+
         # 只有当净价差（扣除手续费后）大于阈值时，才触发平仓
-        return net_spread_buy_hyp > min_threshold
+        return net_spread_buy_hyp > _MIN_THRESHOLD
 
     @classmethod
     def push_neworder_book(cls, exchange: str, book: L2Book):
         """
         更新订单簿数据到价格板
-        
-        注意：不再存储历史数据，只更新实时价格板用于价差计算
-        实时交易系统只需要最新价格，不需要历史数据存储
+
+        已废弃：行情回调现在直接调用 price_board.update(EX_*, ...)，
+        少一层函数调用；保留此方法仅为兼容旧调用方。
         """
-        if book.bids and book.asks:
-            bid1 = book.bids[0].price
-            ask1 = book.asks[0].price
-            price_board.update(exchange, bid1, ask1)
+        if len(book.bids) and len(book.asks):
+            price_board.update(_EXCHANGE_IDS[exchange], book.best_bid(), book.best_ask())
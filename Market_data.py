@@ -2,74 +2,90 @@
 行情数据处理模块：处理深度行情数据回调
 """
 import logging
-from DataBuffer import L2Book, DataBuffer, price_board
+from DataBuffer import L2Book, DataBuffer, price_board, EX_BIN, EX_HYP
+
+logger = logging.getLogger(__name__)
 from websocket_cex_dex import HyperliquidWebSocket
 import config as cfg
 
 
 class Depth_Marketdata:
     """深度行情数据处理类"""
-    
+
+    # 启动时通过 bind_strategy 绑定一次，避免每个 tick 查 sys.modules/getattr
+    _strategy = None
+    _states = None
+
+    @classmethod
+    def bind_strategy(cls, strategy_machine, strategy_states):
+        """
+        绑定策略状态机（启动时调用一次）
+
+        参数:
+            strategy_machine: StrategyStateMachine 实例
+            strategy_states: StrategyState 类（状态常量）
+        """
+        cls._strategy = strategy_machine
+        cls._states = strategy_states
+        logger.info("[Depth_Marketdata] 策略状态机已绑定")
+
     @classmethod
     def on_hyperliquid_l2book(cls, book: L2Book):
         """Hyperliquid订单簿回调 - 静默更新，不计算价差"""
-        # 更新价格板（内部已处理）
-        DataBuffer.push_neworder_book("Hyperliquid", book)
-        
-        # 可选：调试日志（生产环境可以关闭）
-        print(f"[HYPELIQUID] 价格更新: bid={book.bids[0].price if book.bids else 0:.6f}, ask={book.asks[0].price if book.asks else 0:.6f}")
+        # 直接更新价格板（内联，省掉 push_neworder_book 一层调用栈）
+        if len(book.bids) and len(book.asks):
+            price_board.update(EX_HYP, book.best_bid(), book.best_ask())
+
+        # 调试日志：级别预检 + %-延迟格式化，未开 DEBUG 时零格式化开销
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[HYPERLIQUID] 价格更新: bid=%.6f, ask=%.6f",
+                         book.best_bid(), book.best_ask())
     
     @classmethod
     def on_binance_l2book(cls, book: L2Book):
-        """Binance订单簿回调 - 更新数据并立即计算价差"""
-        # 更新价格板（内部已处理）
-        DataBuffer.push_neworder_book("Binance", book)
-        
-        # 立即计算价差
-        if book.bids and book.asks:
+        """Binance订单簿回调 - 更新数据并按需计算价差"""
+        # 直接更新价格板（内联，省掉 push_neworder_book 一层调用栈）
+        if len(book.bids) and len(book.asks):
+            price_board.update(EX_BIN, book.best_bid(), book.best_ask())
+
+        # 调试日志：级别预检 + %-延迟格式化，替代每个 tick 的 print
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[BINANCE] 价格更新: bid=%.6f, ask=%.6f",
+                         book.best_bid(), book.best_ask())
+
+        # 先看状态：只有 OpenCondition / CloseCondition 需要价差计算，
+        # 其他状态（挂单/追单/撤单中）直接返回，省掉全部信号相关计算
+        strategy_machine = cls._strategy
+        if strategy_machine is None:
+            return
+        states = cls._states
+
+        current_state = strategy_machine.get_state()
+        if current_state != states.OpenCondition and current_state != states.CloseCondition:
+            return
+
+        # 一次快照读同时拿到开仓/平仓信号，避免重复计算净价差
+        open_ok, close_ok = price_board.evaluate_signals()
+
+        if logger.isEnabledFor(logging.INFO):
             spread_buy_bin, spread_buy_hyp = price_board.get_spread()
-            
-            if spread_buy_bin is not None and spread_buy_hyp is not None:
-                # 价差计算成功，可以触发交易信号
-                logging.info(f"[价差] Binance买->Hyper卖: {spread_buy_bin:.6f}, Hyper买->Binance卖: {spread_buy_hyp:.6f}")
-                
-                # 触发策略信号检查（使用延迟导入避免循环依赖）
-                try:
-                    from Simple_strategy import StrategyState
-                    import sys
-                    # 获取正在运行的脚本模块（而不是导入的 main 模块）
-                    main_module = sys.modules.get('__main__')
-                    
-                    # 获取全局策略状态机实例
-                    strategy_machine = getattr(main_module, 'strategy_machine', None) if main_module else None
-                    
-                    if strategy_machine is None:
-                        logging.debug("[Depth_Marketdata] 策略状态机未初始化，跳过信号检查")
-                        return
-                    
-                    current_state = strategy_machine.get_state()
-                    
-                    # 检查开仓信号
-                    if current_state == StrategyState.OpenCondition:
-                        if DataBuffer.open_signal(cfg.HYPER_SYMBOL):
-                            strategy_machine.check_and_execute_open(
-                                lambda: DataBuffer.open_signal(cfg.HYPER_SYMBOL)
-                            )
-                    
-                    # 检查平仓信号
-                    elif current_state == StrategyState.CloseCondition:
-                        if DataBuffer.close_signal(cfg.HYPER_SYMBOL):
-                            strategy_machine.check_and_execute_close(
-                                lambda: DataBuffer.close_signal(cfg.HYPER_SYMBOL)
-                            )
-                except (ImportError, AttributeError) as e:
-                    # 如果模块未找到或属性不存在，记录警告但不中断运行
-                    logging.debug(f"[Depth_Marketdata] 策略信号检查跳过: {e}")
-            else:
-                logging.debug("[价差] 数据不足或过期，跳过计算")
-        
-        # 可选：调试日志
-        print(f"[BINANCE] 价格更新: bid={book.bids[0].price if book.bids else 0:.6f}, ask={book.asks[0].price if book.asks else 0:.6f}")
+            if spread_buy_bin is not None:
+                logger.info("[价差] Binance买->Hyper卖: %.6f, Hyper买->Binance卖: %.6f",
+                            spread_buy_bin, spread_buy_hyp)
+
+        # 检查开仓信号
+        if current_state == states.OpenCondition:
+            if open_ok:
+                strategy_machine.check_and_execute_open(
+                    lambda: price_board.evaluate_signals()[0]
+                )
+
+        # 检查平仓信号
+        else:
+            if close_ok:
+                strategy_machine.check_and_execute_close(
+                    lambda: price_board.evaluate_signals()[1]
+                )
     
     @classmethod
     def on_hyperliquid_raw(cls, raw_data):
@@ -80,6 +96,9 @@ class Depth_Marketdata:
     @classmethod
     def on_trades(cls, data):
         """处理交易数据"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
         for trade in data.get("data", []):
             side = "buy" if trade["side"] == "B" else "sell"
-            logging.info(f"[TRADE] {trade['coin']} {side} {trade['sz']} @ {trade['price']} (t={trade['time']})")
+            logger.info("[TRADE] %s %s %s @ %s (t=%s)",
+                        trade['coin'], side, trade['sz'], trade['price'], trade['time'])
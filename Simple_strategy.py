@@ -1,546 +1,884 @@
-"""
-Simple Strategy 模块 (修正版 - Leg1 始终为 Hyperliquid)
-逻辑：
-    不管是开仓还是平仓，永远先在 Hyperliquid (流动性差) 挂单。
-    成交后，去 Binance (流动性好) 吃单对冲。
-"""
-import logging
-import threading
-import time
-import config as cfg
-from DataBuffer import DataBuffer, price_board
-
-class StrategyState:
-    # --- 待机状态 ---
-    OpenCondition      = "OpenCondition"      # 空仓，扫描开仓机会
-    CloseCondition     = "CloseCondition"     # 持仓，扫描平仓机会
-    
-    # --- 开仓流程 (Leg1=Hyper Buy, Leg2=Binance Sell) ---
-    OpenLeg1Waiting    = "OpenLeg1Waiting"    # Hyper 挂单中 (买)
-    OpenLeg1Canceling  = "OpenLeg1Canceling"  # Hyper 撤单中
-    OpenLeg2Waiting    = "OpenLeg2Waiting"    # Binance 对冲中 (卖)
-    OpenLeg2Chasing    = "OpenLeg2Chasing"    # Binance 追单中
-    
-    # --- 平仓流程 (Leg1=Hyper Sell, Leg2=Binance Buy) ---
-    CloseLeg1Waiting   = "CloseLeg1Waiting"   # Hyper 挂单中 (卖)  <-- 修正: Leg1 是 Hyper
-    CloseLeg1Canceling = "CloseLeg1Canceling" # Hyper 撤单中
-    CloseLeg2Waiting   = "CloseLeg2Waiting"   # Binance 平仓中 (买)  <-- 修正: Leg2 是 Binance
-    CloseLeg2Chasing   = "CloseLeg2Chasing"   # Binance 追单中
-
-class StrategyStateMachine:
-    def __init__(self, trade_executor):
-        self.executor = trade_executor
-        self.lock = threading.Lock()
-        
-        # --- 状态管理 ---
-        self.current_state = StrategyState.OpenCondition
-        
-        # --- 交易配置 ---
-        self.base_quantity = 0.001       # 目标开仓数量
-        self.order_timeout_sec = 5.0     # 超时时间
-        self.max_chase_retries = 3       # 最大限价追单次数（前3次限价，第4次市价）
-        
-        # --- 精度配置（根据实际交易对调整）---
-        # Binance BTCUSDT: 价格2位小数，数量3位小数
-        self.binance_price_precision = 2  # 价格精度（小数位数）
-        self.binance_qty_precision = 3    # 数量精度（小数位数）
-        # Hyperliquid BTC: 价格通常2位小数，数量3位小数（根据实际调整）
-        self.hyper_price_precision = 2
-        self.hyper_qty_precision = 3
-        
-        # --- 运行时数据 ---
-        self.leg1_filled_qty = 0.0       # Leg1 已成交数量 (累计量，作为 Leg2 的目标)
-        self.leg2_filled_qty = 0.0       # Leg2 已成交数量（累计量）
-        self.current_position = 0.0      # 总净持仓 (Hyper方向: 正为多, 负为空)
-        
-        # --- 订单追踪 ---
-        self.active_order_id = None      # 当前活跃订单 ID（统一为字符串）
-        self.active_order_time = 0       # 当前活跃订单发送时间
-        self.chase_retry_count = 0       # 追单计数器
-        self.last_cum_filled_qty = {}    # 记录每个订单ID的上一次累计成交量（用于计算增量）
-
-    # ==================== 辅助函数 ====================
-    @staticmethod
-    def _round_precision(value, decimals):
-        """精度处理：四舍五入到指定小数位数"""
-        if value is None:
-            return None
-        return round(float(value), decimals)
-    
-    def _round_price(self, price, exchange):
-        """价格精度处理"""
-        if price is None:
-            return None
-        precision = self.binance_price_precision if exchange.lower() == "binance" else self.hyper_price_precision
-        return self._round_precision(price, precision)
-    
-    def _round_qty(self, qty, exchange):
-        """数量精度处理"""
-        if qty is None:
-            return None
-        precision = self.binance_qty_precision if exchange.lower() == "binance" else self.hyper_qty_precision
-        return self._round_precision(qty, precision)
-    
-    def _extract_order_id(self, response, exchange):
-        """
-        从下单响应中提取订单ID，统一转换为字符串
-        
-        返回: (order_id: str, success: bool)
-        """
-        if not response:
-            return None, False
-        
-        if "error" in response:
-            logging.error(f"[下单响应] {exchange} 错误: {response['error']}")
-            return None, False
-        
-        exchange_lower = exchange.lower()
-        
-        # Binance: 直接有 orderId 字段
-        if exchange_lower == "binance":
-            if "orderId" in response:
-                order_id = str(response["orderId"])  # 统一转为字符串
-                return order_id, True
-            else:
-                logging.error(f"[下单响应] Binance 响应中未找到 orderId: {response}")
-                return None, False
-        
-        # Hyperliquid: 深层嵌套结构
-        elif exchange_lower == "hyperliquid":
-            # 尝试多种可能的格式
-            if "orderId" in response:
-                return str(response["orderId"]), True
-            
-            # 格式1: {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': ...}}]}}}
-            if "response" in response:
-                resp_data = response.get("response", {})
-                if isinstance(resp_data, dict):
-                    data = resp_data.get("data", {})
-                    if isinstance(data, dict):
-                        statuses = data.get("statuses", [])
-                        if statuses and isinstance(statuses, list) and len(statuses) > 0:
-                            first_status = statuses[0]
-                            if "resting" in first_status:
-                                oid = first_status["resting"].get("oid")
-                                if oid:
-                                    return str(oid), True
-                            # 也可能直接有 oid
-                            if "oid" in first_status:
-                                return str(first_status["oid"]), True
-            
-            # 格式2: 直接返回的列表格式（某些SDK可能这样）
-            if isinstance(response, list) and len(response) > 0:
-                first_item = response[0]
-                if isinstance(first_item, dict):
-                    if "orderId" in first_item:
-                        return str(first_item["orderId"]), True
-                    resp = first_item.get("response", {})
-                    if isinstance(resp, dict):
-                        data = resp.get("data", {})
-                        if isinstance(data, dict):
-                            statuses = data.get("statuses", [])
-                            if statuses and len(statuses) > 0 and "resting" in statuses[0]:
-                                oid = statuses[0]["resting"].get("oid")
-                                if oid:
-                                    return str(oid), True
-            
-            logging.error(f"[下单响应] Hyperliquid 响应格式无法解析: {response}")
-            return None, False
-        
-        else:
-            logging.error(f"[下单响应] 不支持的交易所: {exchange}")
-            return None, False
-
-    # ==================== 状态变更 ====================
-    def update_state(self, new_state):
-        self.current_state = new_state
-        logging.info(f"[状态变更] >>> {new_state}")
-
-    def get_state(self):
-        with self.lock:
-            return self.current_state
-
-    # ==================== 核心：主循环超时检查 (on_tick) ====================
-    def on_tick_check(self):
-        """每秒执行：处理超时和追单间隔"""
-        with self.lock:
-            now = time.time()
-            state = self.current_state
-            
-            if self.active_order_id is None:
-                return
-
-            # --- 1. Leg 1 (Hyperliquid) 挂单超时检查 ---
-            # 无论是开仓买入，还是平仓卖出，Leg1 都是 Hyperliquid
-            if state in [StrategyState.OpenLeg1Waiting, StrategyState.CloseLeg1Waiting]:
-                if now - self.active_order_time > self.order_timeout_sec:
-                    logging.warning(f"[超时] Hyper Leg1 订单 {self.active_order_id} 超时，执行撤单")
-                    
-                    next_state = StrategyState.OpenLeg1Canceling if state == StrategyState.OpenLeg1Waiting else StrategyState.CloseLeg1Canceling
-                    self.update_state(next_state)
-                    
-                    # 始终撤 Hyperliquid 的单
-                    threading.Thread(target=self._send_cancel, args=("Hyperliquid", self.active_order_id)).start()
-
-            # --- 2. Leg 2 (Binance) 及追单超时检查 ---
-            elif state in [StrategyState.OpenLeg2Waiting, StrategyState.OpenLeg2Chasing, 
-                           StrategyState.CloseLeg2Waiting, StrategyState.CloseLeg2Chasing]:
-                
-                if now - self.active_order_time > self.order_timeout_sec:
-                    logging.warning(f"[超时] Binance Leg2/追单 {self.active_order_id} 超时，取消并触发重试")
-                    # 始终撤 Binance 的单
-                    threading.Thread(target=self._send_cancel, args=("Binance", self.active_order_id)).start()
-
-    # ==================== 核心：订单回调处理 ====================
-    def on_order_update_logic(self, exchange, event_type, order_id, filled_qty=0.0):
-        """
-        处理 WS 回报。
-        filled_qty: main.py传入的是累计成交量（cum_filled_qty），需要计算增量
-        event_type: "ALL_traded", "PARTIAL_filled_canceled", "ALL_canceled"
-        """
-        with self.lock:
-            # 订单ID验证：统一转为字符串比较（确保类型一致）
-            if order_id is None or self.active_order_id is None:
-                return
-            
-            order_id_str = str(order_id)
-            active_order_id_str = str(self.active_order_id)
-            
-            if order_id_str != active_order_id_str:
-                logging.debug(f"[回调] 订单ID不匹配，忽略: 收到={order_id_str}, 当前={active_order_id_str}")
-                return
-            
-            # 计算增量成交量（使用字符串ID作为key）
-            last_cum = self.last_cum_filled_qty.get(order_id_str, 0.0)
-            incremental_qty = filled_qty - last_cum
-            if incremental_qty < 0:  # 防止累计量异常
-                incremental_qty = 0.0
-            self.last_cum_filled_qty[order_id_str] = filled_qty
-
-            logging.info(f"[回调] State:{self.current_state}, Event:{event_type}, CumQty:{filled_qty}, IncQty:{incremental_qty}")
-
-            # ------------------------------------------------------------
-            # 一、开仓流程 (Hyper Buy -> Binance Sell)
-            # ------------------------------------------------------------
-            
-            # [Leg 1] Hyper 挂单中
-            if self.current_state == StrategyState.OpenLeg1Waiting:
-                if event_type == "ALL_traded":
-                    # 完全成交
-                    self.leg1_filled_qty = filled_qty  # 使用累计量
-                    self.current_position += incremental_qty  # 持仓增加 (Hyper Long)
-                    self._start_leg2_open(initial=True, qty=self.leg1_filled_qty)
-                    self.active_order_id = None
-                    
-                elif event_type == "PARTIAL_filled_canceled":
-                    # 部分成交且撤单：立即对冲已成交部分
-                    self.leg1_filled_qty = filled_qty  # 使用累计量
-                    self.current_position += incremental_qty
-                    self.update_state(StrategyState.OpenLeg1Canceling)
-                    threading.Thread(target=self._send_cancel, args=("Hyperliquid", order_id)).start()
-                    self._start_leg2_open(initial=True, qty=filled_qty)
-                    self.active_order_id = None
-
-            # [Leg 1] Hyper 撤单中
-            elif self.current_state == StrategyState.OpenLeg1Canceling:
-                if event_type == "ALL_canceled":
-                    # 撤单成功，无成交
-                    if self.leg1_filled_qty == 0:
-                        self.update_state(StrategyState.OpenCondition)
-                    self.active_order_id = None
-                elif event_type == "ALL_traded":
-                    # 撤单失败，全成了（2秒窗口内收到FILLED）
-                    self.leg1_filled_qty = filled_qty
-                    self.current_position += incremental_qty
-                    self._start_leg2_open(initial=False, qty=filled_qty)
-                    self.active_order_id = None
-
-            # [Leg 2] Binance 对冲/追单中 (Sell)
-            elif self.current_state in [StrategyState.OpenLeg2Waiting, StrategyState.OpenLeg2Chasing]:
-                target = self.leg1_filled_qty
-                
-                if event_type == "ALL_traded":
-                    # 完全成交
-                    self.leg2_filled_qty = filled_qty
-                    if abs(target - self.leg2_filled_qty) <= 1e-6:
-                        logging.info("开仓对冲完成！")
-                        self.active_order_id = None
-                        self.leg1_filled_qty = 0.0
-                        self.leg2_filled_qty = 0.0
-                        self.chase_retry_count = 0
-                        self.update_state(StrategyState.CloseCondition)
-                elif event_type == "PARTIAL_filled_canceled":
-                    # 部分成交且撤单：继续追单
-                    self.leg2_filled_qty = filled_qty
-                    remaining = target - self.leg2_filled_qty
-                    self.update_state(StrategyState.OpenLeg2Chasing)
-                    if remaining > 1e-6:
-                        self._execute_leg2_chase_step(exchange="Binance", side="SELL", qty=remaining)
-                elif event_type == "ALL_canceled":
-                    # 被撤销或被拒，继续追
-                    self.update_state(StrategyState.OpenLeg2Chasing)
-                    remaining = target - self.leg2_filled_qty
-                    if remaining > 1e-6:
-                        self._execute_leg2_chase_step(exchange="Binance", side="SELL", qty=remaining)
-
-            # ------------------------------------------------------------
-            # 二、平仓流程 (Hyper Sell -> Binance Buy) [修正后]
-            # ------------------------------------------------------------
-
-            # [Leg 1] Hyper 挂单中 (Sell)
-            elif self.current_state == StrategyState.CloseLeg1Waiting:
-                if event_type == "ALL_traded":
-                    # 完全成交
-                    self.leg1_filled_qty = filled_qty  # 使用累计量
-                    self.current_position -= incremental_qty  # 持仓减少
-                    self._start_leg2_close(initial=True, qty=self.leg1_filled_qty)
-                    self.active_order_id = None
-                elif event_type == "PARTIAL_filled_canceled":
-                    # 部分成交且撤单：立即平掉已成交部分
-                    self.leg1_filled_qty = filled_qty  # 使用累计量
-                    self.current_position -= incremental_qty
-                    self.update_state(StrategyState.CloseLeg1Canceling)
-                    threading.Thread(target=self._send_cancel, args=("Hyperliquid", order_id)).start()
-                    self._start_leg2_close(initial=True, qty=filled_qty)
-                    self.active_order_id = None
-
-            # [Leg 1] Hyper 撤单中
-            elif self.current_state == StrategyState.CloseLeg1Canceling:
-                if event_type == "ALL_canceled":
-                    # 撤单成功
-                    if self.current_position <= 1e-5:
-                        # 已经平完了
-                        self.update_state(StrategyState.OpenCondition)
-                    else:
-                        # 没平完，回到 CloseCondition 继续等待
-                        self.update_state(StrategyState.CloseCondition)
-                    self.active_order_id = None
-                elif event_type == "ALL_traded":
-                    # 撤单失败，全成了（2秒窗口内收到FILLED）
-                    self.leg1_filled_qty = filled_qty
-                    self.current_position -= incremental_qty
-                    self._start_leg2_close(initial=False, qty=filled_qty)
-                    self.active_order_id = None
-
-            # [Leg 2] Binance 平仓/追单中 (Buy)
-            elif self.current_state in [StrategyState.CloseLeg2Waiting, StrategyState.CloseLeg2Chasing]:
-                target = self.leg1_filled_qty
-                
-                if event_type == "ALL_traded":
-                    # 完全成交
-                    self.leg2_filled_qty = filled_qty
-                    if abs(target - self.leg2_filled_qty) <= 1e-6:
-                        logging.info("平仓对冲完成！")
-                        self.active_order_id = None
-                        self.leg1_filled_qty = 0.0
-                        self.leg2_filled_qty = 0.0
-                        self.chase_retry_count = 0
-                        # 检查总仓位
-                        if self.current_position <= 1e-5:
-                            self.update_state(StrategyState.OpenCondition)
-                        else:
-                            # 极少情况：分批平仓中
-                            self.update_state(StrategyState.CloseCondition)
-                elif event_type == "PARTIAL_filled_canceled":
-                    # 部分成交且撤单：继续追单
-                    self.leg2_filled_qty = filled_qty
-                    remaining = target - self.leg2_filled_qty
-                    self.update_state(StrategyState.CloseLeg2Chasing)
-                    if remaining > 1e-6:
-                        self._execute_leg2_chase_step(exchange="Binance", side="BUY", qty=remaining)
-                elif event_type == "ALL_canceled":
-                    # 被撤销或被拒，继续追
-                    self.update_state(StrategyState.CloseLeg2Chasing)
-                    remaining = target - self.leg2_filled_qty
-                    if remaining > 1e-6:
-                        self._execute_leg2_chase_step(exchange="Binance", side="BUY", qty=remaining)
-
-
-    # ==================== 动作执行：追单逻辑 ====================
-
-    def _start_leg2_open(self, initial, qty):
-        """开始 Leg 2 开仓 (Binance Sell)"""
-        if initial:
-            self.chase_retry_count = 0
-            self.leg2_filled_qty = 0 
-            self.update_state(StrategyState.OpenLeg2Waiting)
-        else:
-            self.update_state(StrategyState.OpenLeg2Chasing)
-        
-        self._execute_leg2_chase_step("Binance", "SELL", qty)
-
-    def _start_leg2_close(self, initial, qty):
-        """开始 Leg 2 平仓 (Binance Buy)"""
-        if initial:
-            self.chase_retry_count = 0
-            self.leg2_filled_qty = 0 # 重置 Leg2 进度
-            self.update_state(StrategyState.CloseLeg2Waiting)
-        else:
-            self.update_state(StrategyState.CloseLeg2Chasing)
-            
-        self._execute_leg2_chase_step("Binance", "BUY", qty)
-
-    def _execute_leg2_chase_step(self, exchange, side, qty):
-        """通用追单 (针对 Binance) - 前3次限价单，第4次市价单"""
-        price = None
-        
-        # 每次追单前重新获取当前订单簿价格
-        ticker_side = "bid" if side == "SELL" else "ask" 
-        market_price = price_board.get_price(exchange, ticker_side)
-        
-        # 精度处理：数量和价格
-        qty_rounded = self._round_qty(qty, exchange)
-        if qty_rounded is None or qty_rounded <= 0:
-            logging.error(f"[追单] 数量无效: {qty}")
-            return
-        
-        if market_price is None:
-            logging.error(f"[追单] 无法获取 {exchange} {ticker_side} 价格，使用市价单")
-            price = None  # 市价单
-        elif self.chase_retry_count < self.max_chase_retries:
-            # 前3次：限价单，每次价格调整 0.1%
-            adj = (self.chase_retry_count + 1) * 0.001
-            if side == "SELL": 
-                price_raw = market_price * (1 - adj)  # 卖盘降低价格
-            else:              
-                price_raw = market_price * (1 + adj)  # 买盘提高价格
-            price = self._round_price(price_raw, exchange)  # 精度处理
-            logging.info(f"[追单] {exchange} {side} Limit 第{self.chase_retry_count+1}次 | 价格: {price} (基准: {market_price:.4f}), 数量: {qty_rounded}")
-        else:
-            # 第4次及以后：市价单
-            price = None
-            logging.info(f"[追单] {exchange} {side} Market (第{self.chase_retry_count+1}次), 数量: {qty_rounded}")
-
-        # 同步下单（async_exec=False），因为需要立即获取订单ID
-        raw_res = self.executor.place_order(
-            exchange=exchange,
-            symbol=cfg.BINANCE_SYMBOL,
-            side=side,
-            quantity=qty_rounded,  # 使用精度处理后的数量
-            price=price,  # price=None 表示市价单，已做精度处理
-            async_exec=False  # ✅ 同步执行，确保立即获取响应
-        )
-        
-        # 使用统一的方法提取订单ID
-        order_id, success = self._extract_order_id(raw_res, exchange)
-        if success and order_id:
-            self.active_order_id = order_id  # 已经是字符串
-            self.active_order_time = time.time()
-            self.chase_retry_count += 1
-            self.last_cum_filled_qty[order_id] = 0.0  # 初始化累计量
-            logging.info(f"[追单] 下单成功，订单ID: {order_id}")
-        else:
-            error_msg = raw_res.get("error", "未知错误") if raw_res else "无响应"
-            logging.error(f"[追单] 下单失败或无法提取订单ID: {error_msg}")
-
-    def _send_cancel(self, exchange, order_id):
-        """撤单（根据交易所类型传递正确参数）"""
-        if exchange.lower() == "binance":
-            self.executor.cancel_order(
-                exchange=exchange,
-                symbol=cfg.BINANCE_SYMBOL,
-                order_id=order_id,
-                async_exec=False
-            )
-        elif exchange.lower() == "hyperliquid":
-            self.executor.cancel_order(
-                exchange=exchange,
-                order_ids=[order_id],
-                async_exec=False
-            )
-
-    # ==================== 外部接口 ====================
-    def check_and_execute_open(self, signal_func):
-        if self.get_state() != StrategyState.OpenCondition: 
-            return
-        if signal_func():
-            with self.lock:
-                if self.current_state != StrategyState.OpenCondition: 
-                    return
-                logging.info(">>> 触发开仓信号 (Hyper Long) <<<")
-                
-                # Leg 1: Hyper Buy (Maker) - 限价单
-                price_raw = price_board.get_price("Hyperliquid", "bid")
-                if price_raw is None:
-                    logging.error("[开仓] 无法获取 Hyperliquid bid 价格，取消开仓")
-                    return
-                
-                # 精度处理
-                price = self._round_price(price_raw, "Hyperliquid")
-                qty = self._round_qty(self.base_quantity, "Hyperliquid")
-                
-                if qty is None or qty <= 0:
-                    logging.error(f"[开仓] 数量无效: {self.base_quantity}")
-                    return
-                
-                # 同步下单，获取订单ID（async_exec=False）
-                raw_res = self.executor.place_order(
-                    exchange="Hyperliquid",
-                    symbol=cfg.HYPER_SYMBOL,
-                    side="BUY",
-                    quantity=qty,  # 精度处理后的数量
-                    price=price,   # 精度处理后的价格
-                    async_exec=False  # ✅ 同步执行
-                )
-                
-                # 使用统一的方法提取订单ID
-                order_id, success = self._extract_order_id(raw_res, "Hyperliquid")
-                if success and order_id:
-                    self.active_order_id = order_id  # 已经是字符串
-                    self.active_order_time = time.time()
-                    self.leg1_filled_qty = 0.0
-                    self.last_cum_filled_qty[order_id] = 0.0
-                    self.update_state(StrategyState.OpenLeg1Waiting)
-                    logging.info(f"[开仓] Leg1 下单成功，订单ID: {order_id}, 价格: {price}, 数量: {qty}")
-                else:
-                    error_msg = raw_res.get("error", "未知错误") if raw_res else "无响应"
-                    logging.error(f"[开仓] 下单失败或无法提取订单ID: {error_msg}")
-
-    def check_and_execute_close(self, signal_func):
-        if self.get_state() != StrategyState.CloseCondition: 
-            return
-        if signal_func():
-            with self.lock:
-                if self.current_state != StrategyState.CloseCondition: 
-                    return
-                if self.current_position <= 1e-5: 
-                    return
-
-                logging.info(">>> 触发平仓信号 (Hyper Short) <<<")
-                
-                # Leg 1: Hyper Sell (Maker) - 限价单
-                price_raw = price_board.get_price("Hyperliquid", "ask")
-                if price_raw is None:
-                    logging.error("[平仓] 无法获取 Hyperliquid ask 价格，取消平仓")
-                    return
-                
-                # 精度处理
-                price = self._round_price(price_raw, "Hyperliquid")
-                qty = self._round_qty(self.current_position, "Hyperliquid")  # 平掉所有
-                
-                if qty is None or qty <= 0:
-                    logging.error(f"[平仓] 数量无效: {self.current_position}")
-                    return
-                
-                # 同步下单，获取订单ID（async_exec=False）
-                raw_res = self.executor.place_order(
-                    exchange="Hyperliquid",
-                    symbol=cfg.HYPER_SYMBOL,
-                    side="SELL",
-                    quantity=qty,  # 精度处理后的数量
-                    price=price,   # 精度处理后的价格
-                    async_exec=False  # ✅ 同步执行
-                )
-                
-                # 使用统一的方法提取订单ID
-                order_id, success = self._extract_order_id(raw_res, "Hyperliquid")
-                if success and order_id:
-                    self.active_order_id = order_id  # 已经是字符串
-                    self.active_order_time = time.time()
-                    self.leg1_filled_qty = 0.0  # 重置，成交回调时累加
-                    self.last_cum_filled_qty[order_id] = 0.0
-                    self.update_state(StrategyState.CloseLeg1Waiting)
-                    logging.info(f"[平仓] Leg1 下单成功，订单ID: {order_id}, 价格: {price}, 数量: {qty}")
-                else:
-                    error_msg = raw_res.get("error", "未知错误") if raw_res else "无响应"
-                    logging.error(f"[平仓] 下单失败或无法提取订单ID: {error_msg}")
\ No newline at end of file
+"""
+Simple Strategy 模块 (修正版 - Leg1 始终为 Hyperliquid)
+逻辑：
+    不管是开仓还是平仓，永远先在 Hyperliquid (流动性差) 挂单。
+    成交后，去 Binance (流动性好) 吃单对冲。
+"""
+import heapq
+import logging
+import math
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as _FutureTimeout
+from enum import IntEnum
+import config as cfg
+from DataBuffer import DataBuffer, price_board, EX_BIN, EX_HYP
+
+# fastrlock 可选依赖：C 实现的可重入锁，低竞争下 acquire/release 开销
+# 远小于标准库的纯 Python 簿记；接口兼容 with 语句。
+# 退回 RLock（而非 Lock）：下单 Future 偶尔在提交线程内联完成回调，
+# 可重入才不会自锁
+try:
+    from fastrlock.rlock import FastRLock as _StrategyLock
+    HAVE_FASTRLOCK = True
+except ImportError:
+    _StrategyLock = threading.RLock
+    HAVE_FASTRLOCK = False
+
+# 模块级 logger：省掉每次经根 logger 的查找，且支持 %-延迟格式化
+log = logging.getLogger(__name__)
+
+# 单调时钟一次绑定：超时/截止比较不受 NTP 校时跳变影响，
+# 且省每次 time.time 的模块属性查找（与 DataBuffer 同一做法）
+_now = time.monotonic
+
+class StrategyState(IntEnum):
+    """策略状态（IntEnum：整数比较/哈希比字符串便宜，且日志可用 .name）"""
+    # --- 待机状态 ---
+    OpenCondition      = 0   # 空仓，扫描开仓机会
+    CloseCondition     = 1   # 持仓，扫描平仓机会
+
+    # --- 开仓流程 (Leg1=Hyper Buy, Leg2=Binance Sell) ---
+    OpenLeg1Waiting    = 2   # Hyper 挂单中 (买)
+    OpenLeg1Canceling  = 3   # Hyper 撤单中
+    OpenLeg2Waiting    = 4   # Binance 对冲中 (卖)
+    OpenLeg2Chasing    = 5   # Binance 追单中
+
+    # --- 平仓流程 (Leg1=Hyper Sell, Leg2=Binance Buy) ---
+    CloseLeg1Waiting   = 6   # Hyper 挂单中 (卖)  <-- 修正: Leg1 是 Hyper
+    CloseLeg1Canceling = 7   # Hyper 撤单中
+    CloseLeg2Waiting   = 8   # Binance 平仓中 (买)  <-- 修正: Leg2 是 Binance
+    CloseLeg2Chasing   = 9   # Binance 追单中
+
+
+# 状态集合：构建一次，成员测试用 frozenset 替代每次的列表字面量
+LEG1_WAITING = frozenset({StrategyState.OpenLeg1Waiting, StrategyState.CloseLeg1Waiting})
+LEG2_ACTIVE = frozenset({StrategyState.OpenLeg2Waiting, StrategyState.OpenLeg2Chasing,
+                         StrategyState.CloseLeg2Waiting, StrategyState.CloseLeg2Chasing})
+
+# 终态事件集合：这些事件即使成交增量为 0 也必须进状态机分发；
+# 其余（NEW/WORKING 等状态回显）增量为 0 时直接丢弃
+_TERMINAL_EVENTS = frozenset({"ALL_traded", "PARTIAL_filled_canceled", "ALL_canceled"})
+
+# 交易所名规范常量：内部统一用这两个拼写传递与比较，
+# 热路径不再靠 exchange.lower() 规范化（每次都分配新串）
+EXCHANGE_BINANCE = "Binance"
+EXCHANGE_HYPER = "Hyperliquid"
+
+class StrategyStateMachine:
+    # __slots__：热读属性（状态、持仓量、精度表等）从实例 __dict__ 查找
+    # 变为 C 层固定偏移访问，每次省 ~20ns 且对象内存减半；
+    # 代价是不能再随手外挂新属性
+    __slots__ = (
+        "executor", "lock", "current_state",
+        "base_quantity", "order_timeout_sec", "place_order_timeout_sec",
+        "max_chase_retries",
+        "binance_price_precision", "binance_qty_precision",
+        "hyper_price_precision", "hyper_qty_precision",
+        "_price_round", "_qty_round", "_chase_factors",
+        "leg1_filled_qty", "leg2_filled_qty", "current_position",
+        "active_order_id", "active_order_time", "chase_retry_count",
+        "last_cum_filled_qty", "_order_inflight", "_pending_events",
+        "_dispatch",
+        "_cancel_q", "_cancel_thread",
+        "_deadlines", "_deadline_cv", "_timeout_thread",
+    )
+
+    def __init__(self, trade_executor):
+        self.executor = trade_executor
+        self.lock = _StrategyLock()
+        
+        # --- 状态管理 ---
+        self.current_state = StrategyState.OpenCondition
+        
+        # --- 交易配置 ---
+        self.base_quantity = 0.001       # 目标开仓数量
+        self.order_timeout_sec = 5.0     # 超时时间
+        self.place_order_timeout_sec = 2.0  # Leg1 下单响应等待上限（秒）
+        self.max_chase_retries = 3       # 最大限价追单次数（前3次限价，第4次市价）
+        
+        # --- 精度配置（根据实际交易对调整）---
+        # Binance BTCUSDT: 价格2位小数，数量3位小数
+        self.binance_price_precision = 2  # 价格精度（小数位数）
+        self.binance_qty_precision = 3    # 数量精度（小数位数）
+        # Hyperliquid BTC: 价格通常2位小数，数量3位小数（根据实际调整）
+        self.hyper_price_precision = 2
+        self.hyper_qty_precision = 3
+
+        # --- 精度量化函数表 ---
+        # 启动时按精度配置绑定逆向最小变动单位，调用处一次 dict 查找直达，
+        # 免去每次的 exchange.lower() 新串分配与精度属性分支；
+        # 大小写键都注册，调用方传 "Binance" / "binance" 均命中。
+        # 量化用 floor(v*inv+0.5)/inv 定点乘加：round() 为保证银行家舍入
+        # 要走 C 层十进制转换，单次数百 ns，这里快 ~5 倍且价格/数量恒为正
+        _floor = math.floor
+        _bin_price = lambda v, _inv=10.0 ** self.binance_price_precision: _floor(v * _inv + 0.5) / _inv
+        _bin_qty   = lambda v, _inv=10.0 ** self.binance_qty_precision:   _floor(v * _inv + 0.5) / _inv
+        _hyp_price = lambda v, _inv=10.0 ** self.hyper_price_precision:   _floor(v * _inv + 0.5) / _inv
+        _hyp_qty   = lambda v, _inv=10.0 ** self.hyper_qty_precision:     _floor(v * _inv + 0.5) / _inv
+        self._price_round = {"binance": _bin_price, "Binance": _bin_price,
+                             "hyperliquid": _hyp_price, "Hyperliquid": _hyp_price}
+        self._qty_round = {"binance": _bin_qty, "Binance": _bin_qty,
+                           "hyperliquid": _hyp_qty, "Hyperliquid": _hyp_qty}
+
+        # --- 追单价格调整因子表 ---
+        # 第 i 次限价追单的乘数（买单上调 / 卖单下调 0.1%*(i+1)），
+        # 每次追单一次查表，省掉乘加运算和方向分支
+        self._chase_factors = {
+            "BUY":  tuple(1 + (i + 1) * 0.001 for i in range(self.max_chase_retries)),
+            "SELL": tuple(1 - (i + 1) * 0.001 for i in range(self.max_chase_retries)),
+        }
+
+        # --- 运行时数据 ---
+        self.leg1_filled_qty = 0.0       # Leg1 已成交数量 (累计量，作为 Leg2 的目标)
+        self.leg2_filled_qty = 0.0       # Leg2 已成交数量（累计量）
+        self.current_position = 0.0      # 总净持仓 (Hyper方向: 正为多, 负为空)
+        
+        # --- 订单追踪 ---
+        self.active_order_id = None      # 当前活跃订单 ID（统一为字符串）
+        self.active_order_time = 0       # 当前活跃订单发送时间（monotonic 时基）
+        self.chase_retry_count = 0       # 追单计数器
+        # 每个订单ID的上一次累计成交量（用于计算增量）；OrderedDict + 上限淘汰，
+        # 防止长会话中每单一条记录地无界增长
+        self.last_cum_filled_qty = OrderedDict()
+        self._order_inflight = False     # 新单已提交线程池、订单ID尚未登记
+        self._pending_events = []        # 在途期间暂存的 WS 回报，登记ID后重放
+
+        # --- 回报分发表 ---
+        # (状态, 事件) -> 处理函数，一次 dict 查找替代逐条 if/elif 比较
+        self._dispatch = {
+            (StrategyState.OpenLeg1Waiting,    "ALL_traded"):              self._h_open_leg1_traded,
+            (StrategyState.OpenLeg1Waiting,    "PARTIAL_filled_canceled"): self._h_open_leg1_partial,
+            (StrategyState.OpenLeg1Canceling,  "ALL_canceled"):            self._h_open_leg1_cancel_done,
+            (StrategyState.OpenLeg1Canceling,  "ALL_traded"):              self._h_open_leg1_cancel_traded,
+            (StrategyState.OpenLeg2Waiting,    "ALL_traded"):              self._h_open_leg2_traded,
+            (StrategyState.OpenLeg2Waiting,    "PARTIAL_filled_canceled"): self._h_open_leg2_partial,
+            (StrategyState.OpenLeg2Waiting,    "ALL_canceled"):            self._h_open_leg2_canceled,
+            (StrategyState.OpenLeg2Chasing,    "ALL_traded"):              self._h_open_leg2_traded,
+            (StrategyState.OpenLeg2Chasing,    "PARTIAL_filled_canceled"): self._h_open_leg2_partial,
+            (StrategyState.OpenLeg2Chasing,    "ALL_canceled"):            self._h_open_leg2_canceled,
+            (StrategyState.CloseLeg1Waiting,   "ALL_traded"):              self._h_close_leg1_traded,
+            (StrategyState.CloseLeg1Waiting,   "PARTIAL_filled_canceled"): self._h_close_leg1_partial,
+            (StrategyState.CloseLeg1Canceling, "ALL_canceled"):            self._h_close_leg1_cancel_done,
+            (StrategyState.CloseLeg1Canceling, "ALL_traded"):              self._h_close_leg1_cancel_traded,
+            (StrategyState.CloseLeg2Waiting,   "ALL_traded"):              self._h_close_leg2_traded,
+            (StrategyState.CloseLeg2Waiting,   "PARTIAL_filled_canceled"): self._h_close_leg2_partial,
+            (StrategyState.CloseLeg2Waiting,   "ALL_canceled"):            self._h_close_leg2_canceled,
+            (StrategyState.CloseLeg2Chasing,   "ALL_traded"):              self._h_close_leg2_traded,
+            (StrategyState.CloseLeg2Chasing,   "PARTIAL_filled_canceled"): self._h_close_leg2_partial,
+            (StrategyState.CloseLeg2Chasing,   "ALL_canceled"):            self._h_close_leg2_canceled,
+        }
+
+        # --- 撤单工作线程 ---
+        # 常驻线程消费撤单任务，免去每次撤单 ~50-100us 的线程创建开销，
+        # 同时保证撤单按入队顺序串行执行
+        self._cancel_q = queue.SimpleQueue()
+        self._cancel_thread = threading.Thread(target=self._cancel_worker, daemon=True)
+        self._cancel_thread.start()
+
+        # --- 超时调度线程 ---
+        # 事件驱动的订单超时：下单时把 (截止时间, 订单ID) 压入小根堆并唤醒
+        # 调度线程，线程只睡到最近的截止时间，到期即触发超时处理；
+        # 替代固定 1s 轮询 on_tick_check（每天省 ~86400 次空转加锁，
+        # 且超时触发不再受轮询粒度限制）
+        self._deadlines = []
+        self._deadline_cv = threading.Condition(self.lock)
+        self._timeout_thread = threading.Thread(target=self._timeout_worker, daemon=True)
+        self._timeout_thread.start()
+
+    # ==================== 辅助函数 ====================
+    @staticmethod
+    def _round_precision(value, decimals):
+        """精度处理：四舍五入到指定小数位数"""
+        if value is None:
+            return None
+        return round(float(value), decimals)
+    
+    def _round_price(self, price, exchange):
+        """价格精度处理（预绑定量化函数，一次 dict 查找）"""
+        if price is None:
+            return None
+        quant = self._price_round.get(exchange) or self._price_round[exchange.lower()]
+        return quant(float(price))
+
+    def _round_qty(self, qty, exchange):
+        """数量精度处理（预绑定量化函数，一次 dict 查找）"""
+        if qty is None:
+            return None
+        quant = self._qty_round.get(exchange) or self._qty_round[exchange.lower()]
+        return quant(float(qty))
+    
+    _LAST_CUM_MAX = 256  # 累计量记录条数上限
+
+    def _track_order(self, order_id):
+        """登记订单累计量记录，超限时淘汰最老条目（须持锁调用）"""
+        self.last_cum_filled_qty.setdefault(order_id, 0.0)
+        if len(self.last_cum_filled_qty) > self._LAST_CUM_MAX:
+            self.last_cum_filled_qty.popitem(last=False)
+
+    @staticmethod
+    def _extract_binance_id(response):
+        """Binance 下单响应：直接取 orderId 字段"""
+        if "orderId" in response:
+            return str(response["orderId"]), True  # 统一转为字符串
+        log.error("[下单响应] Binance 响应中未找到 orderId: %s", response)
+        return None, False
+
+    @staticmethod
+    def _extract_hyper_id(response):
+        """Hyperliquid 下单响应：快路径直取嵌套 oid，失败再走慢速遍历"""
+        # 快路径：成功挂单时固定为
+        # {'status': 'ok', 'response': {'data': {'statuses': [{'resting': {'oid': ...}}]}}}
+        # 直接链式索引，3 次 dict 取值；中间层不是 dict 时 __getitem__
+        # 抛 TypeError，与 KeyError/IndexError 一并落入慢路径
+        try:
+            return str(response["response"]["data"]["statuses"][0]["resting"]["oid"]), True
+        except (KeyError, TypeError, IndexError):
+            pass
+
+        # 慢路径：兼容其他可能的格式
+        if "orderId" in response:
+            return str(response["orderId"]), True
+
+        if "response" in response:
+            resp_data = response.get("response", {})
+            if isinstance(resp_data, dict):
+                data = resp_data.get("data", {})
+                if isinstance(data, dict):
+                    statuses = data.get("statuses", [])
+                    if statuses and isinstance(statuses, list) and len(statuses) > 0:
+                        first_status = statuses[0]
+                        if "resting" in first_status:
+                            oid = first_status["resting"].get("oid")
+                            if oid:
+                                return str(oid), True
+                        # 也可能直接有 oid
+                        if "oid" in first_status:
+                            return str(first_status["oid"]), True
+
+        # 列表格式（某些SDK可能这样）
+        if isinstance(response, list) and len(response) > 0:
+            first_item = response[0]
+            if isinstance(first_item, dict):
+                if "orderId" in first_item:
+                    return str(first_item["orderId"]), True
+                resp = first_item.get("response", {})
+                if isinstance(resp, dict):
+                    data = resp.get("data", {})
+                    if isinstance(data, dict):
+                        statuses = data.get("statuses", [])
+                        if statuses and len(statuses) > 0 and "resting" in statuses[0]:
+                            oid = statuses[0]["resting"].get("oid")
+                            if oid:
+                                return str(oid), True
+
+        log.error("[下单响应] Hyperliquid 响应格式无法解析: %s", response)
+        return None, False
+
+    # 交易所名 -> 解析函数，一次 dict 查找选定解析路径（大小写键都注册）
+    _ID_EXTRACTORS = {
+        "binance": _extract_binance_id.__func__,
+        "Binance": _extract_binance_id.__func__,
+        "hyperliquid": _extract_hyper_id.__func__,
+        "Hyperliquid": _extract_hyper_id.__func__,
+    }
+
+    def _extract_order_id(self, response, exchange):
+        """
+        从下单响应中提取订单ID，统一转换为字符串
+
+        返回: (order_id: str, success: bool)
+        """
+        if not response:
+            return None, False
+
+        if "error" in response:
+            log.error("[下单响应] %s 错误: %s", exchange, response['error'])
+            return None, False
+
+        extractor = self._ID_EXTRACTORS.get(exchange) or self._ID_EXTRACTORS.get(exchange.lower())
+        if extractor is None:
+            log.error("[下单响应] 不支持的交易所: %s", exchange)
+            return None, False
+        order_id, success = extractor(response)
+        if success and order_id is not None:
+            # 驻留字符串：active_order_id 与回报 ID 相等比较可走指针快速路径
+            order_id = sys.intern(order_id)
+        return order_id, success
+
+    # ==================== 状态变更 ====================
+    def update_state(self, new_state):
+        self.current_state = new_state
+        log.info("[状态变更] >>> %s", new_state.name)
+
+    def get_state(self):
+        # current_state 是单一属性读，GIL 下天然原子，无需加锁
+        return self.current_state
+
+    # ==================== 核心：事件驱动超时调度 ====================
+    def _arm_deadline(self, order_id):
+        """登记当前活跃订单的超时截止点并唤醒调度线程（须持锁调用）"""
+        heapq.heappush(self._deadlines, (self.active_order_time + self.order_timeout_sec, order_id))
+        self._deadline_cv.notify()
+
+    def _timeout_worker(self):
+        """常驻调度线程：睡到最近的订单截止时间，到期触发超时处理"""
+        heap = self._deadlines
+        with self._deadline_cv:
+            while True:
+                if not heap:
+                    self._deadline_cv.wait()
+                    continue
+                remaining = heap[0][0] - _now()
+                if remaining > 0:
+                    self._deadline_cv.wait(timeout=remaining)
+                    continue
+                _, order_id = heapq.heappop(heap)
+                # 堆中可能残留已完结/已替换订单的条目，仅当仍是活跃订单才算超时
+                if order_id == self.active_order_id:
+                    self._handle_order_timeout()
+
+    def _handle_order_timeout(self):
+        """订单超时处理（持锁状态下由调度线程调用）"""
+        state = self.current_state
+
+        # --- 1. Leg 1 (Hyperliquid) 挂单超时 ---
+        # 无论是开仓买入，还是平仓卖出，Leg1 都是 Hyperliquid
+        if state in LEG1_WAITING:
+            log.warning("[超时] Hyper Leg1 订单 %s 超时，执行撤单", self.active_order_id)
+
+            next_state = StrategyState.OpenLeg1Canceling if state == StrategyState.OpenLeg1Waiting else StrategyState.CloseLeg1Canceling
+            self.update_state(next_state)
+
+            # 始终撤 Hyperliquid 的单
+            self._cancel_q.put((EXCHANGE_HYPER, self.active_order_id))
+
+        # --- 2. Leg 2 (Binance) 及追单超时 ---
+        elif state in LEG2_ACTIVE:
+            log.warning("[超时] Binance Leg2/追单 %s 超时，取消并触发重试", self.active_order_id)
+
+            # 旧单无已知成交时走 cancelReplace：一次往返撤旧挂新，
+            # 免去「撤单 → 等 WS 撤销回报 → 再下单」的两段链路
+            if self.last_cum_filled_qty.get(self.active_order_id, 0.0) == 0.0:
+                remaining = self.leg1_filled_qty - self.leg2_filled_qty
+                if remaining > 1e-6:
+                    old_order_id = self.active_order_id
+                    if state == StrategyState.OpenLeg2Waiting or state == StrategyState.OpenLeg2Chasing:
+                        self.update_state(StrategyState.OpenLeg2Chasing)
+                        side = "SELL"
+                    else:
+                        self.update_state(StrategyState.CloseLeg2Chasing)
+                        side = "BUY"
+                    self._execute_leg2_chase_step(EXCHANGE_BINANCE, side, remaining,
+                                                  replace_order_id=old_order_id)
+                    return
+
+            # 已有部分成交：仍走「撤单 → 回报 → 追单」，保证成交量正确入账
+            self._cancel_q.put((EXCHANGE_BINANCE, self.active_order_id))
+
+    def on_tick_check(self):
+        """[已废弃] 超时改由 _timeout_worker 事件驱动处理，保留接口仅做一次唤醒"""
+        # 无锁快路径：无活跃订单时直接返回（单属性读，GIL 下原子），
+        # 最常见的空闲情形不再为一次空唤醒抢锁
+        if self.active_order_id is None:
+            return
+        with self._deadline_cv:
+            self._deadline_cv.notify()
+
+    # ==================== 核心：订单回调处理 ====================
+    def on_order_update_logic(self, exchange, event_type, order_id, filled_qty=0.0):
+        """
+        处理 WS 回报。
+        filled_qty: main.py传入的是累计成交量（cum_filled_qty），需要计算增量
+        event_type: "ALL_traded", "PARTIAL_filled_canceled", "ALL_canceled"
+        """
+        with self.lock:
+            self._on_order_update_locked(exchange, event_type, order_id, filled_qty)
+
+    def on_order_update_batch(self, exchange, events):
+        """
+        批量回报入口：整帧事件一次持锁回放，N 次锁获取降为 1 次
+        events: [(event_type, filled_qty, order_id), ...]（保持帧内顺序）
+        """
+        with self.lock:
+            for event_type, filled_qty, order_id in events:
+                self._on_order_update_locked(exchange, event_type, order_id, filled_qty)
+
+    def _on_order_update_locked(self, exchange, event_type, order_id, filled_qty):
+        """单条回报的实际处理（持锁状态下调用）"""
+        # 订单ID验证：入口约定 main.py 已转为字符串，存储侧经 sys.intern，
+        # 此处直接比较（相同 ID 可走指针快速路径），不再重复 str()
+        if order_id is None:
+            return
+
+        if order_id != self.active_order_id:
+            if self._order_inflight:
+                # 新单在途、订单ID尚未登记：可能是新单的回报抢先到达，
+                # 暂存起来，下单完成回调登记ID后重放
+                self._pending_events.append((exchange, event_type, order_id, filled_qty))
+                return
+            if self.active_order_id is not None:
+                log.debug("[回调] 订单ID不匹配，忽略: 收到=%s, 当前=%s", order_id, self.active_order_id)
+            return
+
+        # 计算增量成交量（字符串ID作为key）
+        last_cum = self.last_cum_filled_qty.get(order_id, 0.0)
+        incremental_qty = filled_qty - last_cum
+        if incremental_qty < 0:  # 防止累计量异常
+            incremental_qty = 0.0
+        self.last_cum_filled_qty[order_id] = filled_qty
+
+        # 去重：无成交增量的非终态回报（用户流的状态回显/心跳）
+        # 不进状态机，省掉整次分发和日志格式化
+        if incremental_qty == 0.0 and event_type not in _TERMINAL_EVENTS:
+            return
+
+        if log.isEnabledFor(logging.INFO):
+            log.info("[回调] State:%s, Event:%s, CumQty:%s, IncQty:%s",
+                     self.current_state.name, event_type, filled_qty, incremental_qty)
+
+        # O(1) 分发：用 (状态, 事件) 查表，替代原来的长 if/elif 链
+        handler = self._dispatch.get((self.current_state, event_type))
+        if handler is not None:
+            handler(order_id, filled_qty, incremental_qty)
+
+        # 三类事件对该订单都是终态（成交/撤销/部成撤销），
+        # 回收其累计量记录，避免字典随历史订单数增长
+        self.last_cum_filled_qty.pop(order_id, None)
+
+    # ==================== 回报处理函数（持锁状态下调用）====================
+    # 一、开仓流程 (Hyper Buy -> Binance Sell)
+
+    def _h_open_leg1_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 挂单中，完全成交"""
+        self.leg1_filled_qty = filled_qty  # 使用累计量
+        self.current_position += incremental_qty  # 持仓增加 (Hyper Long)
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2（下单回调可能立刻登记新ID）
+        self._start_leg2_open(initial=True, qty=self.leg1_filled_qty)
+
+    def _h_open_leg1_partial(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 挂单中，部分成交且撤单：立即对冲已成交部分"""
+        self.leg1_filled_qty = filled_qty  # 使用累计量
+        self.current_position += incremental_qty
+        self.update_state(StrategyState.OpenLeg1Canceling)
+        self._cancel_q.put((EXCHANGE_HYPER, order_id))
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2
+        self._start_leg2_open(initial=True, qty=filled_qty)
+
+    def _h_open_leg1_cancel_done(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 撤单中，撤单成功（无成交）"""
+        if self.leg1_filled_qty == 0:
+            self.update_state(StrategyState.OpenCondition)
+        self.active_order_id = None
+
+    def _h_open_leg1_cancel_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 撤单中，撤单失败全成了（2秒窗口内收到FILLED）"""
+        self.leg1_filled_qty = filled_qty
+        self.current_position += incremental_qty
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2
+        self._start_leg2_open(initial=False, qty=filled_qty)
+
+    def _h_open_leg2_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 对冲/追单中 (Sell)，完全成交"""
+        self.leg2_filled_qty = filled_qty
+        if abs(self.leg1_filled_qty - self.leg2_filled_qty) <= 1e-6:
+            log.info("开仓对冲完成！")
+            self.active_order_id = None
+            self.leg1_filled_qty = 0.0
+            self.leg2_filled_qty = 0.0
+            self.chase_retry_count = 0
+            self.update_state(StrategyState.CloseCondition)
+
+    def _h_open_leg2_partial(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 部分成交且撤单：继续追单"""
+        self._continue_leg2_chase("SELL", StrategyState.OpenLeg2Chasing, filled_qty)
+
+    def _h_open_leg2_canceled(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 被撤销或被拒，继续追"""
+        self._continue_leg2_chase("SELL", StrategyState.OpenLeg2Chasing)
+
+    # 二、平仓流程 (Hyper Sell -> Binance Buy) [修正后]
+
+    def _h_close_leg1_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 挂单中 (Sell)，完全成交"""
+        self.leg1_filled_qty = filled_qty  # 使用累计量
+        self.current_position -= incremental_qty  # 持仓减少
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2
+        self._start_leg2_close(initial=True, qty=self.leg1_filled_qty)
+
+    def _h_close_leg1_partial(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 挂单中，部分成交且撤单：立即平掉已成交部分"""
+        self.leg1_filled_qty = filled_qty  # 使用累计量
+        self.current_position -= incremental_qty
+        self.update_state(StrategyState.CloseLeg1Canceling)
+        self._cancel_q.put((EXCHANGE_HYPER, order_id))
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2
+        self._start_leg2_close(initial=True, qty=filled_qty)
+
+    def _h_close_leg1_cancel_done(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 撤单中，撤单成功"""
+        if self.current_position <= 1e-5:
+            # 已经平完了
+            self.update_state(StrategyState.OpenCondition)
+        else:
+            # 没平完，回到 CloseCondition 继续等待
+            self.update_state(StrategyState.CloseCondition)
+        self.active_order_id = None
+
+    def _h_close_leg1_cancel_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 1] Hyper 撤单中，撤单失败全成了（2秒窗口内收到FILLED）"""
+        self.leg1_filled_qty = filled_qty
+        self.current_position -= incremental_qty
+        self.active_order_id = None  # 先清 Leg1 单，再起 Leg2
+        self._start_leg2_close(initial=False, qty=filled_qty)
+
+    def _h_close_leg2_traded(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 平仓/追单中 (Buy)，完全成交"""
+        self.leg2_filled_qty = filled_qty
+        if abs(self.leg1_filled_qty - self.leg2_filled_qty) <= 1e-6:
+            log.info("平仓对冲完成！")
+            self.active_order_id = None
+            self.leg1_filled_qty = 0.0
+            self.leg2_filled_qty = 0.0
+            self.chase_retry_count = 0
+            # 检查总仓位
+            if self.current_position <= 1e-5:
+                self.update_state(StrategyState.OpenCondition)
+            else:
+                # 极少情况：分批平仓中
+                self.update_state(StrategyState.CloseCondition)
+
+    def _h_close_leg2_partial(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 部分成交且撤单：继续追单"""
+        self._continue_leg2_chase("BUY", StrategyState.CloseLeg2Chasing, filled_qty)
+
+    def _h_close_leg2_canceled(self, order_id, filled_qty, incremental_qty):
+        """[Leg 2] Binance 被撤销或被拒，继续追"""
+        self._continue_leg2_chase("BUY", StrategyState.CloseLeg2Chasing)
+
+    # ==================== 动作执行：追单逻辑 ====================
+
+    def _continue_leg2_chase(self, side, chasing_state, filled_qty=None):
+        """
+        Leg2 被撤/部成后继续追单（持锁状态下调用）
+
+        开/平仓 × 部成/被撤 四个分支共用同一条路径，
+        热路径只温一份字节码的内联缓存
+        """
+        if filled_qty is not None:
+            self.leg2_filled_qty = filled_qty
+        self.update_state(chasing_state)
+        remaining = self.leg1_filled_qty - self.leg2_filled_qty
+        if remaining > 1e-6:
+            self._execute_leg2_chase_step(exchange=EXCHANGE_BINANCE, side=side, qty=remaining)
+
+    def _start_leg2_open(self, initial, qty):
+        """开始 Leg 2 开仓 (Binance Sell)"""
+        if initial:
+            self.chase_retry_count = 0
+            self.leg2_filled_qty = 0 
+            self.update_state(StrategyState.OpenLeg2Waiting)
+        else:
+            self.update_state(StrategyState.OpenLeg2Chasing)
+        
+        self._execute_leg2_chase_step(EXCHANGE_BINANCE, "SELL", qty)
+
+    def _start_leg2_close(self, initial, qty):
+        """开始 Leg 2 平仓 (Binance Buy)"""
+        if initial:
+            self.chase_retry_count = 0
+            self.leg2_filled_qty = 0 # 重置 Leg2 进度
+            self.update_state(StrategyState.CloseLeg2Waiting)
+        else:
+            self.update_state(StrategyState.CloseLeg2Chasing)
+            
+        self._execute_leg2_chase_step(EXCHANGE_BINANCE, "BUY", qty)
+
+    def _execute_leg2_chase_step(self, exchange, side, qty, replace_order_id=None):
+        """
+        通用追单 (针对 Binance) - 前3次限价单，第4次市价单
+
+        replace_order_id: 不为 None 时走 cancelReplace，一次请求撤旧单+挂新单
+        """
+        price = None
+        
+        # 每次追单前重新取顶档价：get_bid/get_ask 单次读价格板快照元组，
+        # 不走 get_price 的字符串分发（追单始终对 Binance）
+        if side == "SELL":
+            ticker_side = "bid"
+            market_price = price_board.get_bid(EX_BIN)
+        else:
+            ticker_side = "ask"
+            market_price = price_board.get_ask(EX_BIN)
+        
+        # 精度处理：数量和价格
+        qty_rounded = self._round_qty(qty, exchange)
+        if qty_rounded is None or qty_rounded <= 0:
+            log.error("[追单] 数量无效: %s", qty)
+            return
+        
+        if market_price is None:
+            log.error("[追单] 无法获取 %s %s 价格，使用市价单", exchange, ticker_side)
+            price = None  # 市价单
+        elif self.chase_retry_count < self.max_chase_retries:
+            # 前3次：限价单，每次价格调整 0.1%（查预计算因子表）
+            price_raw = market_price * self._chase_factors[side][self.chase_retry_count]
+            price = self._round_price(price_raw, exchange)  # 精度处理
+            log.info("[追单] %s %s Limit 第%d次 | 价格: %s (基准: %.4f), 数量: %s",
+                     exchange, side, self.chase_retry_count + 1, price, market_price, qty_rounded)
+        else:
+            # 第4次及以后：市价单
+            price = None
+            log.info("[追单] %s %s Market (第%d次), 数量: %s",
+                     exchange, side, self.chase_retry_count + 1, qty_rounded)
+
+        if replace_order_id is not None:
+            # 超时改单：cancelReplace 单次往返完成撤旧+挂新。
+            # 本分支由 _handle_order_timeout 持锁调用，不能在锁内跑整个
+            # HTTPS 往返（会拖停所有 WS 回报和开平仓检查的入锁路径），
+            # 与普通追单一样经线程池异步提交：占坑 _order_inflight，
+            # 在途期间的回报暂存、完成回调里登记新单ID后重放
+            self._order_inflight = True
+            future = self.executor.cancel_replace_order(
+                exchange=exchange,
+                symbol=cfg.BINANCE_SYMBOL,
+                cancel_order_id=replace_order_id,
+                side=side,
+                quantity=qty_rounded,
+                price=price,
+                async_exec=True
+            )
+            if future is None:
+                self._order_inflight = False
+                log.error("[改单] cancelReplace 提交失败：执行器未就绪")
+                return
+            future.add_done_callback(
+                lambda f, ex=exchange, oid=replace_order_id: self._on_cancel_replace_done(f, ex, oid))
+        else:
+            # 异步下单：提交线程池后立即返回，不在持锁状态下阻塞整个
+            # HTTPS 往返（10-50ms），完成回调里再持锁登记订单ID；
+            # 在途期间到达的新单回报由 on_order_update_logic 暂存，
+            # 登记后重放，保证不丢成交
+            self._order_inflight = True
+            future = self.executor.place_order(
+                exchange=exchange,
+                symbol=cfg.BINANCE_SYMBOL,
+                side=side,
+                quantity=qty_rounded,  # 使用精度处理后的数量
+                price=price,  # price=None 表示市价单，已做精度处理
+                async_exec=True
+            )
+            if future is None:
+                self._order_inflight = False
+                log.error("[追单] 下单提交失败：执行器未就绪")
+                return
+            future.add_done_callback(
+                lambda f, ex=exchange: self._on_place_order_done(f, ex))
+
+    def _register_chase_response(self, raw_res, exchange):
+        """登记追单下单响应（持锁状态下调用）"""
+        order_id, success = self._extract_order_id(raw_res, exchange)
+        if success and order_id:
+            self.active_order_id = order_id  # 已经是字符串
+            self.active_order_time = _now()
+            self.chase_retry_count += 1
+            self._track_order(order_id)  # 初始化累计量
+            self._arm_deadline(order_id)
+            log.info("[追单] 下单成功，订单ID: %s", order_id)
+        else:
+            error_msg = raw_res.get("error", "未知错误") if raw_res else "无响应"
+            log.error("[追单] 下单失败或无法提取订单ID: %s", error_msg)
+
+    def _on_cancel_replace_done(self, future, exchange, replace_order_id):
+        """异步 cancelReplace 完成回调：持锁登记新单ID，再重放暂存回报"""
+        try:
+            raw_res = future.result()
+        except Exception as e:
+            raw_res = {"error": str(e)}
+        with self.lock:
+            self._order_inflight = False
+            if raw_res and "error" not in raw_res:
+                cancel_resp = raw_res.get("cancelResponse") or {}
+                old_cum = float(cancel_resp.get("executedQty", 0) or 0)
+                if old_cum > self.last_cum_filled_qty.get(replace_order_id, 0.0):
+                    log.warning("[改单] 旧单 %s 撤前有未入账成交 %s，可能产生超额对冲", replace_order_id, old_cum)
+                # 新订单信息在 newOrderResponse；退回「先撤后下」时就是普通下单响应
+                self._register_chase_response(raw_res.get("newOrderResponse") or raw_res, exchange)
+            else:
+                # 撤单失败（STOP_ON_FAILURE 未挂新单）：旧单可能已成交，
+                # 保持 active_order_id 不变，等 WS 回报驱动后续流程
+                error_msg = raw_res.get("error", "无响应") if raw_res else "无响应"
+                log.warning("[改单] cancelReplace 失败，等待旧单回报: %s", error_msg)
+        self._drain_pending_events()
+
+    def _on_place_order_done(self, future, exchange):
+        """异步下单完成回调：持锁登记订单ID，再重放在途期间暂存的回报"""
+        try:
+            raw_res = future.result()
+        except Exception as e:
+            raw_res = {"error": str(e)}
+        with self.lock:
+            self._order_inflight = False
+            self._register_chase_response(raw_res, exchange)
+        self._drain_pending_events()
+
+    def _drain_pending_events(self):
+        """取走在途期间暂存的回报并重放（调用时不得持锁；ID 不匹配的由分发过滤）"""
+        with self.lock:
+            pending, self._pending_events = self._pending_events, []
+        for ev_exchange, ev_type, ev_order_id, ev_filled_qty in pending:
+            self.on_order_update_logic(ev_exchange, ev_type, ev_order_id, ev_filled_qty)
+
+    def _cancel_late_hyper_order(self, future):
+        """迟到的 Leg1 下单响应：订单已不再需要，提取ID后直接撤掉"""
+        try:
+            raw_res = future.result()
+        except Exception:
+            return
+        order_id, success = self._extract_order_id(raw_res, EXCHANGE_HYPER)
+        if success and order_id:
+            log.warning("[下单] 迟到响应，撤掉订单 %s", order_id)
+            self._cancel_q.put((EXCHANGE_HYPER, order_id))
+
+    def _submit_leg1_order(self, tag, side, qty, price, waiting_state):
+        """
+        Leg1 (Hyper Maker) 下单：submit-and-poll —— 提交线程池后在锁外等待
+        HTTPS 往返，等待期间其它回报可正常进入状态机；调用前须已在锁内
+        置位 _order_inflight 占坑，防止重复触发
+        """
+        future = self.executor.place_order(
+            exchange=EXCHANGE_HYPER,
+            symbol=cfg.HYPER_SYMBOL,
+            side=side,
+            quantity=qty,   # 精度处理后的数量
+            price=price,    # 精度处理后的价格
+            async_exec=True
+        )
+        try:
+            raw_res = future.result(timeout=self.place_order_timeout_sec) if future is not None else None
+        except _FutureTimeout:
+            log.error("[%s] Leg1 下单响应超时(>%.1fs)，放弃本次并撤掉迟到订单",
+                      tag, self.place_order_timeout_sec)
+            future.add_done_callback(self._cancel_late_hyper_order)
+            with self.lock:
+                self._order_inflight = False
+            self._drain_pending_events()
+            return
+        except Exception as e:
+            raw_res = {"error": str(e)}
+
+        with self.lock:
+            self._order_inflight = False
+            order_id, success = self._extract_order_id(raw_res, EXCHANGE_HYPER)
+            if success and order_id:
+                self.active_order_id = order_id  # 已经是字符串
+                self.active_order_time = _now()
+                self._track_order(order_id)
+                self._arm_deadline(order_id)
+                self.update_state(waiting_state)
+                log.info("[%s] Leg1 下单成功，订单ID: %s, 价格: %s, 数量: %s", tag, order_id, price, qty)
+            else:
+                error_msg = raw_res.get("error", "未知错误") if raw_res else "无响应"
+                log.error("[%s] Leg1 下单失败或无法提取订单ID: %s", tag, error_msg)
+        self._drain_pending_events()
+
+    def _cancel_worker(self):
+        """常驻撤单线程：顺序消费 (exchange, order_id) 任务"""
+        while True:
+            exchange, order_id = self._cancel_q.get()
+            try:
+                self._send_cancel(exchange, order_id)
+            except Exception as e:
+                log.error("[撤单线程] 撤单异常: %s", e)
+
+    def _send_cancel(self, exchange, order_id):
+        """撤单（根据交易所类型传递正确参数）"""
+        if exchange != EXCHANGE_BINANCE and exchange != EXCHANGE_HYPER:
+            exchange = EXCHANGE_BINANCE if exchange.lower() == "binance" else EXCHANGE_HYPER
+        if exchange is EXCHANGE_BINANCE:
+            self.executor.cancel_order(
+                exchange=exchange,
+                symbol=cfg.BINANCE_SYMBOL,
+                order_id=order_id,
+                async_exec=False
+            )
+        else:
+            self.executor.cancel_order(
+                exchange=exchange,
+                order_ids=[order_id],
+                async_exec=False
+            )
+
+    # ==================== 外部接口 ====================
+    def check_and_execute_open(self, signal_func):
+        # 无锁快路径：current_state 为单属性读，GIL 下加载本身原子，
+        # 行情速率的信号回调不必为只读门禁抢锁；要动手时再持锁复查
+        if self.current_state != StrategyState.OpenCondition:
+            return
+        if signal_func():
+            with self.lock:
+                if self.current_state != StrategyState.OpenCondition: 
+                    return
+                if self._order_inflight:
+                    return
+                log.info(">>> 触发开仓信号 (Hyper Long) <<<")
+                
+                # Leg 1: Hyper Buy (Maker) - 限价单
+                price_raw = price_board.get_bid(EX_HYP)  # 快照直读，免字符串分发
+                if price_raw is None:
+                    log.error("[开仓] 无法获取 Hyperliquid bid 价格，取消开仓")
+                    return
+                
+                # 精度处理
+                price = self._round_price(price_raw, EXCHANGE_HYPER)
+                qty = self._round_qty(self.base_quantity, EXCHANGE_HYPER)
+                
+                if qty is None or qty <= 0:
+                    log.error("[开仓] 数量无效: %s", self.base_quantity)
+                    return
+
+                # 占坑：锁释放期间由 _order_inflight 阻止信号重复触发
+                self._order_inflight = True
+                self.leg1_filled_qty = 0.0
+
+            # 锁外提交并等待下单响应（submit-and-poll）
+            self._submit_leg1_order("开仓", "BUY", qty, price, StrategyState.OpenLeg1Waiting)
+
+    def check_and_execute_close(self, signal_func):
+        # 无锁快路径：同 check_and_execute_open
+        if self.current_state != StrategyState.CloseCondition:
+            return
+        if signal_func():
+            with self.lock:
+                if self.current_state != StrategyState.CloseCondition: 
+                    return
+                if self.current_position <= 1e-5: 
+                    return
+                if self._order_inflight:
+                    return
+
+                log.info(">>> 触发平仓信号 (Hyper Short) <<<")
+                
+                # Leg 1: Hyper Sell (Maker) - 限价单
+                price_raw = price_board.get_ask(EX_HYP)  # 快照直读，免字符串分发
+                if price_raw is None:
+                    log.error("[平仓] 无法获取 Hyperliquid ask 价格，取消平仓")
+                    return
+                
+                # 精度处理
+                price = self._round_price(price_raw, EXCHANGE_HYPER)
+                qty = self._round_qty(self.current_position, EXCHANGE_HYPER)  # 平掉所有
+                
+                if qty is None or qty <= 0:
+                    log.error("[平仓] 数量无效: %s", self.current_position)
+                    return
+
+                # 占坑：锁释放期间由 _order_inflight 阻止信号重复触发
+                self._order_inflight = True
+                self.leg1_filled_qty = 0.0  # 重置，成交回调时累加
+
+            # 锁外提交并等待下单响应（submit-and-poll）
+            self._submit_leg1_order("平仓", "SELL", qty, price, StrategyState.CloseLeg1Waiting)
\ No newline at end of file
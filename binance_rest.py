@@ -0,0 +1,123 @@
+"""
+Binance 直连 REST 客户端（热路径精简版）
+
+python-binance 的 Client 每次调用要过好几层封装（参数整理、限频头
+解析、异常包装），对套利热路径只用到的四五个端点来说是纯开销。
+这里手写一个最小发送器：长连接 requests.Session + 预编译 HMAC 模板
++ 手拼查询串，方法名与 SDK 对齐，trade_engine 可按配置开关切换。
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 可选依赖 orjson：解析响应正文比标准库快数倍，没装则回退 json
+try:
+    import orjson
+    _loads = orjson.loads
+    HAVE_ORJSON = True
+except ImportError:
+    _loads = json.loads
+    HAVE_ORJSON = False
+
+
+class BinanceFut:
+    """
+    覆盖热路径端点的最小 Binance 客户端：
+    现货下单/撤单（/api/v3/order）+ 合约账户/持仓查询（/fapi/v2/*）。
+
+    与 SDK 的差异：出错不抛 BinanceAPIException，统一返回带 "error"
+    键的 dict，与 Rsp_orderInsert / Rsp_orderCancel 的错误约定对齐。
+    """
+
+    SPOT_MAIN_URL = "https://api.binance.com"
+    SPOT_TEST_URL = "https://testnet.binance.vision"
+    FUT_MAIN_URL = "https://fapi.binance.com"
+    FUT_TEST_URL = "https://testnet.binancefuture.com"
+
+    def __init__(self, api_key, secret_key, testnet=True, recv_window=5000):
+        self._spot_base = self.SPOT_TEST_URL if testnet else self.SPOT_MAIN_URL
+        self._fut_base = self.FUT_TEST_URL if testnet else self.FUT_MAIN_URL
+        self.recv_window = recv_window
+
+        self.session = requests.Session()
+        # max_retries=0：下单非幂等，宁可快失败交给上层熔断/追单
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "X-MBX-APIKEY": api_key,
+            "Connection": "keep-alive",
+        })
+        # HMAC 模板：启动时做一次密钥调度，每次请求 copy() 后只喂查询串
+        self._hmac = hmac.new(secret_key.encode("utf-8"), b"", hashlib.sha256)
+
+    # ---------- 内部 ----------
+
+    def _signed_query(self, params):
+        """手拼查询串并签名（参数值由调用方保证已是 URL 安全的标量）"""
+        parts = [f"{k}={v}" for k, v in params.items() if v is not None]
+        parts.append(f"recvWindow={self.recv_window}")
+        parts.append(f"timestamp={int(time.time() * 1000)}")
+        query = "&".join(parts)
+        h = self._hmac.copy()
+        h.update(query.encode("utf-8"))
+        return query + "&signature=" + h.hexdigest()
+
+    def _request(self, method, base, path, params=None, signed=True, timeout=(0.3, 1.0)):
+        if signed:
+            url = f"{base}{path}?{self._signed_query(params or {})}"
+        elif params:
+            qs = "&".join(f"{k}={v}" for k, v in params.items() if v is not None)
+            url = f"{base}{path}?{qs}"
+        else:
+            url = f"{base}{path}"
+        try:
+            resp = self.session.request(method, url, timeout=timeout)
+        except requests.RequestException as e:
+            logging.error(f"[BinanceFut] 请求失败 {method} {path}: {e}")
+            return {"error": str(e)}
+
+        body = {}
+        if resp.content:
+            try:
+                body = _loads(resp.content)
+            except Exception:
+                return {"error": f"HTTP {resp.status_code}: 非 JSON 响应"}
+        if resp.status_code >= 400:
+            # Binance 错误体形如 {"code": -1013, "msg": "..."}
+            msg = body.get("msg", resp.text) if isinstance(body, dict) else resp.text
+            logging.error(f"[BinanceFut] HTTP {resp.status_code} {method} {path}: {msg}")
+            return {"error": msg, "code": body.get("code") if isinstance(body, dict) else None}
+        return body
+
+    # ---------- 与 SDK 同名的热路径接口 ----------
+
+    def ping(self):
+        """连接预热（现货 /api/v3/ping，不签名）"""
+        return self._request("GET", self._spot_base, "/api/v3/ping", signed=False)
+
+    def create_order(self, **params):
+        """下单。参数与 SDK create_order 同名（symbol/side/type/...）"""
+        return self._request("POST", self._spot_base, "/api/v3/order", params)
+
+    def cancel_order(self, **params):
+        """撤单。支持 orderId 或 origClientOrderId"""
+        return self._request("DELETE", self._spot_base, "/api/v3/order", params)
+
+    def futures_account(self):
+        """合约账户信息（余额检查用，查询放宽读超时）"""
+        return self._request("GET", self._fut_base, "/fapi/v2/account", timeout=(0.3, 3.0))
+
+    def futures_position_information(self, **params):
+        """合约持仓信息（初始状态检查用，查询放宽读超时）"""
+        return self._request("GET", self._fut_base, "/fapi/v2/positionRisk", params, timeout=(0.3, 3.0))
+
+    def close(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
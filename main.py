@@ -1,4 +1,6 @@
 import json
+import signal
+import sys
 import threading
 import time
 import logging
@@ -8,9 +10,10 @@ from datetime import datetime
 import pandas as pd
 import requests
 import hmac
+import functools
 import asyncio
 import hashlib
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 import config as cfg
 from DataBuffer import Level, L2Book, Ticker, PriceBoard, price_board, DataBuffer
 from Market_data import Depth_Marketdata
@@ -32,6 +35,37 @@ try:
 except Exception:
     HAVE_NACL = False
 
+# NumPy/Numba 可选依赖：Hyperliquid orderUpdates 大批量帧走向量化分类路径
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:
+    np = None
+    HAVE_NUMPY = False
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Numba 未安装时的空装饰器，保持纯 Python 路径可用"""
+        if args and callable(args[0]):
+            return args[0]
+        def wrapper(func):
+            return func
+        return wrapper
+
+try:
+    # 可选加速：装有 SHA-NI 后端的 sha256 实现时优先使用（签名热路径）；
+    # 未安装则退回 hashlib —— OpenSSL>=1.1.1 本身会按 CPU 在运行时分发 SHA-NI
+    from pysha256ni import sha256 as _sha256
+    HAVE_SHANI = True
+except ImportError:
+    _sha256 = hashlib.sha256
+    HAVE_SHANI = False
+
 # Hyperliquid SDK 导入（根据实际安装的包名调整）
 try:
     from hyperliquid.info import Info
@@ -53,6 +87,7 @@ except ImportError:
 # ==================== 配置区 ====================
 # 全局常量移至 config.py，通过 cfg.<VAR> 引用
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 # ================================================
 
 # ==================== 策略状态机 ====================
@@ -71,12 +106,48 @@ strategy_machine = None
 #=======================订单状态管理=================
 # 注意：订单状态处理已集成到回调函数中，直接调用状态机的 on_order_update_logic()
 # ==================== 下单/撤单 ====================
+# 预置 HMAC 模板缓存：密钥进程内不变，ipad/opad 派生只做一次，
+# 每次签名 copy() 模板即可，省掉两个 SHA-256 初始块
+_HMAC_CACHE: Dict[str, hmac.HMAC] = {}
+
+# 无需转义即可直接进查询串的字符集（Binance 参数值几乎全落在这里面，
+# quote_plus 只在出现保留字符时才调用）
+_QUERY_SAFE = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.-_~")
+
+
+def _binance_sign_query(secret_key: str, params: Dict[str, Any]) -> str:
+    """对Binance参数签名，直接返回含 signature 的查询串（可直接进 URL/data）"""
+    # 手工拼接代替 urlencode：按插入顺序保持与下游发送一致，
+    # 省掉中间 dict 与通用 quoter 的逐项分发
+    parts = []
+    for k, v in params.items():
+        if v is None:
+            continue
+        if type(v) is str:
+            if not _QUERY_SAFE.issuperset(v):
+                v = quote_plus(v)
+            parts.append(k + "=" + v)
+        else:
+            # 数值参数（quantity/price/timestamp 等）str() 输出必然落在
+            # 安全字符集内，跳过逐字符扫描
+            parts.append(k + "=" + str(v))
+    query = "&".join(parts)
+    mac = _HMAC_CACHE.get(secret_key)
+    if mac is None:
+        mac = hmac.new(secret_key.encode("utf-8"), digestmod=_sha256)
+        _HMAC_CACHE[secret_key] = mac
+    h = mac.copy()
+    h.update(query.encode("utf-8"))
+    return query + "&signature=" + h.hexdigest()
+
+
 def _binance_sign(secret_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
-    """对Binance参数进行签名并返回带签名的参数"""
-    query = urlencode({k: v for k, v in params.items() if v is not None})
-    signature = hmac.new(secret_key.encode("utf-8"), query.encode("utf-8"), hashlib.sha256).hexdigest()
+    """对Binance参数进行签名并返回带签名的参数（兼容入口，热路径用
+    _binance_sign_query 直接拿查询串，省一次 dict 拷贝和下游重编码）"""
+    signed_query = _binance_sign_query(secret_key, params)
     signed = dict(params)
-    signed["signature"] = signature
+    signed["signature"] = signed_query.rsplit("signature=", 1)[1]
     return signed
 
 """关于下单函数的一些说明：
@@ -102,127 +173,317 @@ POST {api_url}/exchange，body 为 {"action": {...}, "nonce": timestamp, "signat
 
 
 # ===================== Binance 用户流回调处理 =====================
+# 事件类型常量：sys.intern 驻留后，== 比较可走指针相等的快速路径
+# （解码出的字段串未必驻留，不能直接用 is，交给 str == 的恒等短路）
+# 动作名常量同样驻留：状态机 _dispatch 以 (状态, 事件) 为键，
+# 传入驻留串后键比较走恒等短路
+_ACT_ALL_TRADED = sys.intern("ALL_traded")
+_ACT_PARTIAL = sys.intern("PARTIAL_filled_canceled")
+_ACT_ALL_CANCELED = sys.intern("ALL_canceled")
+
+_E_OTU = sys.intern("ORDER_TRADE_UPDATE")
+_E_EXEC = sys.intern("executionReport")
+_E_ACCT = sys.intern("ACCOUNT_UPDATE")
+_CH_ORDER_UPDATES = sys.intern("orderUpdates")
+_CH_USER = sys.intern("user")
+
+# orjson 解码时 JSON 数值已是 float/int，直接透传；交易所把数量字段
+# 编码成字符串时才真正走一次 float()，空值归零
+def _to_float(x):
+    return x if type(x) is float else float(x or 0)
+
+
+# 状态串 -> 整数编码：单次哈希查表替代链式字符串比较
+# 1=成交完结 2=撤单/过期(看累计成交量分流) 3=拒单
+_BINANCE_STATUS = {"FILLED": 1, "CANCELED": 2, "EXPIRED": 2, "REJECTED": 3}
+
+
+def _feed_position_cache(strategy_machine, msg):
+    """ACCOUNT_UPDATE -> TradeExecutor 持仓缓存（状态检查免 REST 轮询）"""
+    executor = getattr(strategy_machine, "executor", None)
+    if executor is not None:
+        executor.update_position_cache(msg)
+
+
+def _on_binance_otu(strategy_machine, msg):
+    """合约用户流特化路径: {"e": "ORDER_TRADE_UPDATE", "o": {...}}"""
+    event_type = msg.get("e")
+    if event_type == _E_ACCT:
+        # 同一路合约流会混发账户更新，特化后仍要喂持仓缓存
+        _feed_position_cache(strategy_machine, msg)
+        return
+    if event_type == _E_OTU:
+        o = msg.get("o", {})
+        status_raw = o.get("X", "")  # 订单状态
+        cum_filled_qty = _to_float(o.get("z"))  # 累计成交数量 (z: cumQty)
+        order_id = o.get("i")  # 订单ID
+        if order_id is not None:
+            order_id = str(order_id)  # 入口统一转字符串，状态机内不再重复转换
+        client_order_id = o.get("c")  # 客户端订单ID
+        
+        code = _BINANCE_STATUS.get(status_raw, 0)
+        if code == 1:
+            strategy_machine.on_order_update_logic("Binance", _ACT_ALL_TRADED, filled_qty=cum_filled_qty, order_id=order_id)
+        
+        elif code == 2:
+            if cum_filled_qty > 0:
+                # 关键点：如果撤单时成交量 > 0，则是部分成交撤单
+                strategy_machine.on_order_update_logic("Binance", _ACT_PARTIAL, filled_qty=cum_filled_qty, order_id=order_id)
+            else:
+                strategy_machine.on_order_update_logic("Binance", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+        
+        elif code == 3:
+            strategy_machine.on_order_update_logic("Binance", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+        
+        else:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[Binance 用户流] 订单 %s 状态: %s (未最终状态)",
+                             client_order_id or order_id, status_raw)
+
+
+def _on_binance_exec(strategy_machine, msg):
+    """现货用户流特化路径: {"e": "executionReport", "i": order_id, "X": status, ...}"""
+    if msg.get("e") == _E_EXEC:
+        order_id = msg.get("i")
+        if order_id is not None:
+            order_id = str(order_id)  # 入口统一转字符串
+        client_order_id = msg.get("c")
+        status = msg.get("X")
+        cum_filled_qty = _to_float(msg.get("z"))  # 累计成交数量
+
+        code = _BINANCE_STATUS.get(status, 0)
+        if code == 1:
+            strategy_machine.on_order_update_logic("Binance", _ACT_ALL_TRADED, filled_qty=cum_filled_qty, order_id=order_id)
+        elif code == 2:
+            if cum_filled_qty > 0:
+                strategy_machine.on_order_update_logic("Binance", _ACT_PARTIAL, filled_qty=cum_filled_qty, order_id=order_id)
+            else:
+                strategy_machine.on_order_update_logic("Binance", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+        elif code == 3:
+            strategy_machine.on_order_update_logic("Binance", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+        else:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[Binance 用户流] 订单 %s 状态: %s (未最终状态)",
+                             client_order_id or order_id, status)
+
+
+class _BinanceUserDispatch:
+    """
+    用户流消息分发器：首帧探测消息格式后自特化
+
+    同一路订阅只会产生一种格式（合约 ORDER_TRADE_UPDATE 或现货
+    executionReport），确定后把 _impl 换成对应特化函数，后续消息
+    跳过格式双分支判断
+    """
+    __slots__ = ("_strategy", "_impl")
+
+    def __init__(self, strategy_machine):
+        self._strategy = strategy_machine
+        self._impl = None
+
+    def __call__(self, msg):
+        impl = self._impl
+        if impl is not None:
+            return impl(msg)
+        event_type = msg.get("e")
+        if event_type == _E_OTU:
+            self._impl = functools.partial(_on_binance_otu, self._strategy)
+        elif event_type == _E_EXEC:
+            self._impl = functools.partial(_on_binance_exec, self._strategy)
+        elif event_type == _E_ACCT:
+            # 账户更新喂持仓缓存；非订单事件不决定流格式，不做特化
+            _feed_position_cache(self._strategy, msg)
+            return
+        else:
+            # 其他非订单事件，格式尚未确定，不做特化
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[Binance 用户流] 收到事件: %s", event_type)
+            return
+        return self._impl(msg)
+
+
 def create_binance_user_callback(strategy_machine):
     """创建 Binance 用户流回调函数"""
-    def on_binance_user_message(msg):
-        """
-        处理 Binance 用户流消息
-        支持两种格式：
-        1. 合约用户流: {"e": "ORDER_TRADE_UPDATE", "o": {...}}
-        2. 现货用户流: {"e": "executionReport", "i": order_id, "X": status, ...}
-        """
-        # 格式1: 合约用户流 (ORDER_TRADE_UPDATE)
-        if msg.get("e") == "ORDER_TRADE_UPDATE":
-            o = msg.get("o", {})
-            status_raw = o.get("X", "")  # 订单状态
-            cum_filled_qty = float(o.get("z", 0))  # 累计成交数量 (z: cumQty)
-            order_id = o.get("i")  # 订单ID
-            client_order_id = o.get("c")  # 客户端订单ID
-            
-            if status_raw == "FILLED":
-                strategy_machine.on_order_update_logic("Binance", "ALL_traded", filled_qty=cum_filled_qty, order_id=order_id)
-            
-            elif status_raw in ("CANCELED", "EXPIRED"):
-                if cum_filled_qty > 0:
-                    # 关键点：如果撤单时成交量 > 0，则是部分成交撤单
-                    strategy_machine.on_order_update_logic("Binance", "PARTIAL_filled_canceled", filled_qty=cum_filled_qty, order_id=order_id)
+    # 首帧自特化分发器：确定格式后直达特化路径（特化函数自带格式守卫）
+    return _BinanceUserDispatch(strategy_machine)
+
+# ===================== Hyperliquid 用户流回调处理 =====================
+# 状态串 -> 整数编码（供批量分类内核使用）：1=filled 2=canceled 3=rejected/expired
+_HL_STATUS_CODE = {"filled": 1, "canceled": 2, "cancelled": 2,
+                   "rejected": 3, "expired": 3}
+
+# 批量帧达到该条数才切向量化路径；小帧走逐条解析，省掉数组搭建开销
+_VECTOR_BATCH_MIN = 8
+
+
+@njit(cache=True)
+def _classify_updates(cum_sz, sz, status, filled_mask, out):
+    """
+    批量订单更新分类内核（Numba JIT，逐元素原生分支）
+
+    filled_mask: 全部成交判定，由调用方用 numpy 一次向量化算好
+    out[i]: 1=ALL_traded 2=PARTIAL_filled_canceled 3=ALL_canceled
+            4=filled但未全部成交(仅告警) 0=未知状态
+    """
+    for i in range(status.shape[0]):
+        st = status[i]
+        if st == 1:
+            if filled_mask[i]:
+                out[i] = 1
+            else:
+                out[i] = 4
+        elif st == 2:
+            if cum_sz[i] > 0:
+                out[i] = 2
+            else:
+                out[i] = 3
+        elif st == 3:
+            out[i] = 3
+        else:
+            out[i] = 0
+
+
+# 抽列缓冲（SoA）：帧间复用、按历史最大帧长只增不减，避免每帧重新
+# 分配四个数组；用户流回调由单一 WS 线程驱动，无需加锁
+_soa_cum = None
+_soa_sz = None
+_soa_status = None
+_soa_out = None
+
+
+def _dispatch_updates_vectorized(strategy_machine, updates):
+    """大批量 orderUpdates：抽列成数组 -> JIT 分类 -> 小循环分发"""
+    global _soa_cum, _soa_sz, _soa_status, _soa_out
+    n = len(updates)
+    if _soa_cum is None or _soa_cum.shape[0] < n:
+        cap = max(n, 64)
+        _soa_cum = np.empty(cap, dtype=np.float64)
+        _soa_sz = np.empty(cap, dtype=np.float64)
+        _soa_status = np.empty(cap, dtype=np.int8)
+        _soa_out = np.empty(cap, dtype=np.int8)
+    cum_sz = _soa_cum[:n]
+    sz = _soa_sz[:n]
+    status = _soa_status[:n]
+    out = _soa_out[:n]
+    order_ids = []
+    for i, item in enumerate(updates):
+        order = item.get("order", {})
+        cum_sz[i] = _to_float(order.get("cumSz"))
+        sz[i] = _to_float(order.get("sz"))
+        st_raw = order.get("status", "")
+        status[i] = _HL_STATUS_CODE.get(st_raw) or _HL_STATUS_CODE.get(st_raw.lower(), 0)
+        oid = order.get("oid")
+        order_id = oid if oid is not None else order.get("cloid")
+        order_ids.append(str(order_id) if order_id is not None else None)
+
+    # 全部成交判定整列一次算完（含浮点容差），纯 Python 退化路径
+    # 也只付一趟向量化的代价
+    filled_mask = (cum_sz >= sz) | (np.abs(cum_sz - sz) < 1e-8)
+    _classify_updates(cum_sz, sz, status, filled_mask, out)
+
+    events = []
+    for i in range(n):
+        action = out[i]
+        if action == 1:
+            events.append((_ACT_ALL_TRADED, cum_sz[i], order_ids[i]))
+        elif action == 2:
+            events.append((_ACT_PARTIAL, cum_sz[i], order_ids[i]))
+        elif action == 3:
+            events.append((_ACT_ALL_CANCELED, 0.0, order_ids[i]))
+        elif action == 4:
+            logger.warning("[Hyperliquid] 订单 %s 部分成交: %s/%s",
+                           order_ids[i], cum_sz[i], sz[i])
+    if events:
+        # 整帧一次持锁回放，替代逐条加锁
+        strategy_machine.on_order_update_batch("Hyperliquid", events)
+
+
+def _on_hyper_user_message(strategy_machine, message):
+    """
+    Hyperliquid 用户流回调解析
+    message 格式: {"channel": "user", "data": {...}} 或 {"channel": "orderUpdates", "data": [...]}
+    """
+    # 格式1: orderUpdates 频道（批量订单更新）
+    channel = message.get("channel")
+    if channel == _CH_ORDER_UPDATES:
+        updates = message.get("data", [])
+        if HAVE_NUMPY and len(updates) >= _VECTOR_BATCH_MIN:
+            _dispatch_updates_vectorized(strategy_machine, updates)
+            return
+        events = []
+        for item in updates:
+            order = item.get("order", {})
+            status_raw = order.get("status", "")  # 'filled' 或 'canceled'
+            # HL 按 schema 推小写，原样查表命中即免 .lower() 分配
+            code = _HL_STATUS_CODE.get(status_raw) or _HL_STATUS_CODE.get(status_raw.lower(), 0)
+            cum_sz = _to_float(order.get("cumSz"))  # 累计成交数量
+            sz = _to_float(order.get("sz"))  # 订单总数量
+            oid = order.get("oid")  # 订单ID
+            cloid = order.get("cloid")  # 客户端订单ID
+            order_id = oid if oid is not None else cloid
+            if order_id is not None:
+                order_id = str(order_id)  # 入口统一转字符串，状态机内不再重复转换
+
+            if code == 1:
+                # 注意：HL 可能会分批推送 filled，这里建议逻辑是直到全部成交才算 ALL_traded
+                # 或者简化处理：只要状态变为 filled 且 cumSz 等于总 Sz 
+                if cum_sz >= sz or abs(cum_sz - sz) < 1e-8:  # 考虑浮点误差
+                    events.append((_ACT_ALL_TRADED, cum_sz, order_id))
                 else:
-                    strategy_machine.on_order_update_logic("Binance", "ALL_canceled", filled_qty=0.0, order_id=order_id)
+                    logger.warning("[Hyperliquid] 订单 %s 部分成交: %s/%s", cloid or oid, cum_sz, sz)
             
-            elif status_raw == "REJECTED":
-                strategy_machine.on_order_update_logic("Binance", "ALL_canceled", filled_qty=0.0, order_id=order_id)
+            elif code == 2:
+                if cum_sz > 0:
+                    events.append((_ACT_PARTIAL, cum_sz, order_id))
+                else:
+                    events.append((_ACT_ALL_CANCELED, 0.0, order_id))
             
-            else:
-                logging.debug(f"[Binance 用户流] 订单 {client_order_id or order_id} 状态: {status_raw} (未最终状态)")
+            elif code == 3:
+                events.append((_ACT_ALL_CANCELED, 0.0, order_id))
+        if events:
+            # 整帧一次持锁回放，替代逐条加锁
+            strategy_machine.on_order_update_batch("Hyperliquid", events)
+    
+    # 格式2: user 频道（单个订单更新）- 向后兼容
+    elif channel == _CH_USER:
+        user_data = message.get("data", {})
         
-        # 格式2: 现货用户流 (executionReport) - 向后兼容
-        elif msg.get("e") == "executionReport":
-            order_id = msg.get("i")
-            client_order_id = msg.get("c")
-            status = msg.get("X")
-            cum_filled_qty = float(msg.get("z", 0))  # 累计成交数量
-
-            if status == "FILLED":
-                strategy_machine.on_order_update_logic("Binance", "ALL_traded", filled_qty=cum_filled_qty, order_id=order_id)
-            elif status in ("CANCELED", "EXPIRED"):
-                if cum_filled_qty > 0:
-                    strategy_machine.on_order_update_logic("Binance", "PARTIAL_filled_canceled", filled_qty=cum_filled_qty, order_id=order_id)
+        # Hyperliquid 用户流可能包含多种类型的事件：order, fill, cancel 等
+        if user_data.get("type") == "order":
+            order_data = user_data.get("data", {})
+            order = order_data.get("order", {})
+            oid = order.get("oid")
+            cloid = order.get("cloid")
+            order_id = oid if oid is not None else cloid
+            if order_id is not None:
+                order_id = str(order_id)  # 入口统一转字符串
+            status = order.get("status", "")
+            code = _HL_STATUS_CODE.get(status) or _HL_STATUS_CODE.get(status.lower(), 0)
+            cum_sz = _to_float(order.get("cumSz"))
+            sz = _to_float(order.get("sz"))
+
+            if code == 1:
+                if cum_sz >= sz or abs(cum_sz - sz) < 1e-8:
+                    strategy_machine.on_order_update_logic("Hyperliquid", _ACT_ALL_TRADED, filled_qty=cum_sz, order_id=order_id)
                 else:
-                    strategy_machine.on_order_update_logic("Binance", "ALL_canceled", filled_qty=0.0, order_id=order_id)
-            elif status == "REJECTED":
-                strategy_machine.on_order_update_logic("Binance", "ALL_canceled", filled_qty=0.0, order_id=order_id)
-            else:
-                logging.debug(f"[Binance 用户流] 订单 {client_order_id or order_id} 状态: {status} (未最终状态)")
-    
-    return on_binance_user_message
+                    logger.warning("[Hyperliquid] 订单 %s 部分成交: %s/%s", cloid or oid, cum_sz, sz)
+            elif code == 2:
+                if cum_sz > 0:
+                    strategy_machine.on_order_update_logic("Hyperliquid", _ACT_PARTIAL, filled_qty=cum_sz, order_id=order_id)
+                else:
+                    strategy_machine.on_order_update_logic("Hyperliquid", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+            elif code == 3:
+                strategy_machine.on_order_update_logic("Hyperliquid", _ACT_ALL_CANCELED, filled_qty=0.0, order_id=order_id)
+        else:
+            # 处理其他类型的用户事件（fill, cancel 等）
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[Hyperliquid 用户流] 收到事件: %s", user_data.get('type', 'unknown'))
+
 
-# ===================== Hyperliquid 用户流回调处理 =====================
 def create_hyper_user_callback(strategy_machine):
     """创建 Hyperliquid 用户流回调函数"""
-    def hyper_user_callback(message):
-        """
-        Hyperliquid 用户流回调解析
-        message 格式: {"channel": "user", "data": {...}} 或 {"channel": "orderUpdates", "data": [...]}
-        """
-        # 格式1: orderUpdates 频道（批量订单更新）
-        if message.get("channel") == "orderUpdates":
-            updates = message.get("data", [])
-            for item in updates:
-                order = item.get("order", {})
-                status_raw = order.get("status", "").lower()  # 'filled' 或 'canceled'
-                cum_sz = float(order.get("cumSz", 0))  # 累计成交数量
-                sz = float(order.get("sz", 0))  # 订单总数量
-                oid = order.get("oid")  # 订单ID
-                cloid = order.get("cloid")  # 客户端订单ID
-                
-                if status_raw == "filled":
-                    # 注意：HL 可能会分批推送 filled，这里建议逻辑是直到全部成交才算 ALL_traded
-                    # 或者简化处理：只要状态变为 filled 且 cumSz 等于总 Sz 
-                    if cum_sz >= sz or abs(cum_sz - sz) < 1e-8:  # 考虑浮点误差
-                        strategy_machine.on_order_update_logic("Hyperliquid", "ALL_traded", filled_qty=cum_sz, order_id=oid or cloid)
-                    else:
-                        logging.warning(f"[Hyperliquid] 订单 {cloid or oid} 部分成交: {cum_sz}/{sz}")
-                
-                elif status_raw in ("canceled", "cancelled"):
-                    if cum_sz > 0:
-                        strategy_machine.on_order_update_logic("Hyperliquid", "PARTIAL_filled_canceled", filled_qty=cum_sz, order_id=oid or cloid)
-                    else:
-                        strategy_machine.on_order_update_logic("Hyperliquid", "ALL_canceled", filled_qty=0.0, order_id=oid or cloid)
-                
-                elif status_raw in ("rejected", "expired"):
-                    strategy_machine.on_order_update_logic("Hyperliquid", "ALL_canceled", filled_qty=0.0, order_id=oid or cloid)
-        
-        # 格式2: user 频道（单个订单更新）- 向后兼容
-        elif message.get("channel") == "user":
-            user_data = message.get("data", {})
-            
-            # Hyperliquid 用户流可能包含多种类型的事件：order, fill, cancel 等
-            if user_data.get("type") == "order":
-                order_data = user_data.get("data", {})
-                order = order_data.get("order", {})
-                oid = order.get("oid")
-                cloid = order.get("cloid")
-                status = order.get("status", "").lower()
-                cum_sz = float(order.get("cumSz", 0))
-                sz = float(order.get("sz", 0))
-
-                if status == "filled":
-                    if cum_sz >= sz or abs(cum_sz - sz) < 1e-8:
-                        strategy_machine.on_order_update_logic("Hyperliquid", "ALL_traded", filled_qty=cum_sz, order_id=oid or cloid)
-                    else:
-                        logging.warning(f"[Hyperliquid] 订单 {cloid or oid} 部分成交: {cum_sz}/{sz}")
-                elif status in ("cancelled", "canceled"):
-                    if cum_sz > 0:
-                        strategy_machine.on_order_update_logic("Hyperliquid", "PARTIAL_filled_canceled", filled_qty=cum_sz, order_id=oid or cloid)
-                    else:
-                        strategy_machine.on_order_update_logic("Hyperliquid", "ALL_canceled", filled_qty=0.0, order_id=oid or cloid)
-                elif status in ("rejected", "expired"):
-                    strategy_machine.on_order_update_logic("Hyperliquid", "ALL_canceled", filled_qty=0.0, order_id=oid or cloid)
-            else:
-                # 处理其他类型的用户事件（fill, cancel 等）
-                logging.debug(f"[Hyperliquid 用户流] 收到事件: {user_data.get('type', 'unknown')}")
-    
-    return hyper_user_callback
+    # 模块级函数 + partial 绑定：参数访问快于闭包 cell，后续也可整体 AOT 编译
+    return functools.partial(_on_hyper_user_message, strategy_machine)
 
 # ===================== 启动入口 =====================
 def start_all_user_streams(strategy_machine, testnet=True):
@@ -252,31 +513,13 @@ if __name__ == "__main__":
     globals()['strategy_machine'] = StrategyStateMachine(trade_executor)
     strategy_machine = globals()['strategy_machine']
     print(f"策略状态机创建完成，初始状态: {strategy_machine.get_state()}")
-    
-    # ====================查询账户余额和持仓 ====================
-    print("正在检查账户余额和持仓状态...")
-    state_checker = InitialStateChecker(trade_executor)
-    
-    # 查询账户余额
-    balances = state_checker.get_balances()
-    print(f"Binance USDT 余额: {balances['binance']['usdt']:.2f}")
-    print(f"Hyperliquid USDC 余额: {balances['hyperliquid']['usdc']:.2f}")
-    
-    # 查询持仓并设置初始状态（传入策略状态机实例）
-    is_position_valid, initial_state = state_checker.Req_Investment_position(strategy_machine=strategy_machine)
-    
-    if not is_position_valid:
-        print("错误：持仓状态异常，程序退出！")
-        print("请检查账户持仓情况：")
-        print("  - 如果只有单边持仓，请先平仓")
-        print("  - 如果持仓组合不正确，请调整持仓")
-        exit(1)
-    
-    # 状态机状态已在 Req_Investment_position 中更新
-    if initial_state:
-        print(f"账户余额和持仓检查通过！策略状态已设置为: {initial_state}")
+
+    # 绑定到行情回调（一次性，替代每个 tick 查 sys.modules）
+    Depth_Marketdata.bind_strategy(strategy_machine, StrategyState)
     
     # ==================== 第三步：创建交易所管理器 ====================
+    # WS 连接提前启动：TLS 握手/订阅确认与下面的 REST 余额持仓检查并行，
+    # 缩短重启后到首个报价的冷启动时间（各交易所内部已是独立守护线程）
     manager = ExchangeManager()
     
     # 创建 Hyperliquid 客户端（同时支持行情流和用户流）
@@ -296,8 +539,30 @@ if __name__ == "__main__":
     # 启动所有交易所（每个交易所内部已有独立线程）
     print("启动所有交易所连接...")
     manager.start_all()
+
+    # ====================查询账户余额和持仓 ====================
+    # 与上面的 WS 握手并行进行
+    print("正在检查账户余额和持仓状态...")
+    state_checker = InitialStateChecker(trade_executor)
     
-    # 等待连接就绪
+    # 并行刷新余额 + 持仓：三个端点同时在途，HL user_state 只查一次
+    balances, is_position_valid, initial_state = state_checker.refresh_state(
+        strategy_machine=strategy_machine)
+    print(f"Binance USDT 余额: {balances.bn_usdt:.2f}")
+    print(f"Hyperliquid USDC 余额: {balances.hl_usdc:.2f}")
+    
+    if not is_position_valid:
+        print("错误：持仓状态异常，程序退出！")
+        print("请检查账户持仓情况：")
+        print("  - 如果只有单边持仓，请先平仓")
+        print("  - 如果持仓组合不正确，请调整持仓")
+        exit(1)
+    
+    # 状态机状态已在 Req_Investment_position 中更新
+    if initial_state:
+        print(f"账户余额和持仓检查通过！策略状态已设置为: {initial_state}")
+    
+    # 等待连接就绪（握手大多已在持仓检查期间完成）
     print("等待连接建立...")
     manager.wait_all_ready(timeout=15)
 
@@ -317,14 +582,19 @@ if __name__ == "__main__":
     #=========================启用用户数据流==================
     binance_user_stream = start_all_user_streams(strategy_machine, testnet=True)
 
+    # 主线程改为单次阻塞等待：SIGINT 置位事件后才醒来，
+    # 不再每秒空转一次 sleep/唤醒
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
     try:
         print("\n套利系统运行中，按 Ctrl+C 停止...")
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
+        stop_event.wait()
+    finally:
         print("\n正在关闭所有连接...")
         binance_user_stream.stop_User_stream()  # 断开 Binance 用户流连接
         manager.stop_all()  # 断开所有行情连接（包括 Hyperliquid 的行情流和用户流）
+        trade_executor.close()  # 释放下单线程池与 HTTP 会话
 
         time.sleep(2)
         print("已关闭")
\ No newline at end of file
@@ -1,715 +1,1370 @@
-"""
-不同交易所下单的管理
-交易执行模块 (优化版)
-"""
-from concurrent.futures import ThreadPoolExecutor
-from binance.client import Client
-from binance.exceptions import BinanceAPIException
-import logging
-from typing import Dict, Optional, Any
-import config as cfg
-
-# Hyperliquid 依赖
-try:
-    from hyperliquid.exchange import Exchange as HyperExchange
-    from hyperliquid.info import Info
-    from hyperliquid.utils import constants
-    import eth_account
-    HAVE_HYPER_SDK = True
-except ImportError:
-    HAVE_HYPER_SDK = False
-
-class TradeExecutor:
-    def __init__(self):
-        self.binance_client = None
-        self.hyper_exchange = None
-        self.hyper_info = None  # Hyperliquid Info 客户端，用于查询账户信息
-        self.executor = ThreadPoolExecutor(max_workers=4) # 4个线程够用了
-        self.is_ready = False
-
-    def init_clients(self, testnet=True):
-        """
-        程序启动时调用一次，建立长连接
-        """
-        logging.info("正在初始化交易接口连接...")
-        
-        # 1. 初始化 Binance REST Client
-        try:
-            api_key = cfg.BINANCE_TEST_APIKEY if testnet else cfg.BINANCE_MAIN_APIKEY
-            secret = cfg.BINANCE_TEST_SECRETKEY if testnet else cfg.BINANCE_MAIN_SECRETKEY
-            
-            self.binance_client = Client(api_key, secret, testnet=testnet)
-            # 这里的 ping 是为了预热连接
-            self.binance_client.ping()
-            logging.info("[TradeExecutor] Binance REST Client 就绪")
-        except Exception as e:
-            logging.error(f"[TradeExecutor] Binance 初始化失败: {e}")
-
-        # 2. 初始化 Hyperliquid Exchange
-        if HAVE_HYPER_SDK:
-            try:
-                base_url = constants.TESTNET_API_URL if testnet else constants.MAINNET_API_URL
-                wallet_key = cfg.HYPERTEST_WALLETKEY if testnet else cfg.HYPER_MAIN_WALLETKEY
-                wallet_address = cfg.HYPERTEST_WALLET if testnet else cfg.HYPER_MAIN_WALLET
-                
-                # 创建 Account 对象 (本地钱包)
-                account = eth_account.Account.from_key(wallet_key)
-                
-                # 初始化 Exchange (这一步通常会拉取一次 info，比较耗时，所以必须预加载)
-                self.hyper_exchange = HyperExchange(account, base_url)
-                
-                # 初始化 Info 客户端（用于查询账户信息，不需要签名）
-                self.hyper_info = Info(base_url, skip_ws=True)
-                
-                # 保存钱包地址供后续使用
-                self.hyper_wallet_address = wallet_address
-                
-                logging.info("[TradeExecutor] Hyperliquid Exchange 就绪")
-            except Exception as e:
-                logging.error(f"[TradeExecutor] Hyperliquid 初始化失败: {e}")
-        
-        self.is_ready = True
-
-    def _execute_binance(self, symbol, side, quantity, price=None, usdt_amount=None):
-        """Binance 具体执行逻辑"""
-        try:
-            # 这里的 symbol 需要大写，例如 "BTCUSDT"
-            symbol = symbol.upper()
-            side = side.upper()
-            
-            if price: # 限价单
-                return self.binance_client.create_order(
-                    symbol=symbol,
-                    side=side,
-                    type='LIMIT',
-                    timeInForce='GTC',
-                    quantity=str(quantity),
-                    price=str(price)
-                )
-            else: # 市价单
-                if usdt_amount:
-                    return self.binance_client.create_order(
-                        symbol=symbol,
-                        side=side,
-                        type='MARKET',
-                        quoteOrderQty=str(round(usdt_amount, 2))
-                    )
-                else:
-                    return self.binance_client.create_order(
-                        symbol=symbol,
-                        side=side,
-                        type='MARKET',
-                        quantity=str(quantity)
-                    )
-        except BinanceAPIException as e:
-            logging.error(f"[Binance下单失败] {e}")
-            return {"error": str(e)}
-
-    def _execute_hyper(self, symbol, side, quantity, price=None):
-        """Hyperliquid 具体执行逻辑"""
-        try:
-            # Hyperliquid SDK 的 symbol 不需要 "USDT" 后缀，例如 "BTC"
-            # 注意：side 在 Hyper SDK 里是布尔值 is_buy
-            is_buy = (side.lower() == 'buy')
-            
-            if price:
-                # 限价单
-                return self.hyper_exchange.order(
-                    name=symbol,
-                    is_buy=is_buy,
-                    sz=quantity,
-                    limit_px=price,
-                    order_type={"limit": {"tif": "Gtc"}}
-                )
-            else:
-                # 市价单 (注意：Hyperliquid SDK 的 market_open 自带滑点设置)
-                return self.hyper_exchange.market_open(
-                    name=symbol,
-                    is_buy=is_buy,
-                    sz=quantity,
-                    slippage=0.02 # 允许 2% 滑点，防止市价单失败
-                )
-        except Exception as e:
-            logging.error(f"[Hyperliquid下单失败] {e}")
-            return {"error": str(e)}
-
-    def place_order(self, exchange, symbol, side, quantity, price=None, usdt_amount=None, async_exec=False):
-        """
-        统一对外接口
-        :param async_exec: 是否异步执行（放入线程池，不阻塞当前线程）
-        """
-        if not self.is_ready:
-            logging.error("交易执行器未初始化！")
-            return None
-
-        task = None
-        if exchange.lower() == 'binance':
-            if async_exec:
-                task = self.executor.submit(self._execute_binance, symbol, side, quantity, price, usdt_amount)
-            else:
-                return self._execute_binance(symbol, side, quantity, price, usdt_amount)
-        
-        elif exchange.lower() == 'hyperliquid':
-            if async_exec:
-                task = self.executor.submit(self._execute_hyper, symbol, side, quantity, price)
-            else:
-                return self._execute_hyper(symbol, side, quantity, price)
-        
-        return task # 如果是异步，返回 Future 对象
-
-    def _cancel_binance(self, symbol, order_id=None, client_order_id=None):
-        """Binance 撤单具体执行逻辑"""
-        try:
-            # 这里的 symbol 需要大写，例如 "BTCUSDT"
-            symbol = symbol.upper()
-            
-            # Binance 支持通过 orderId 或 origClientOrderId 撤单
-            if client_order_id:
-                return self.binance_client.cancel_order(
-                    symbol=symbol,
-                    origClientOrderId=client_order_id
-                )
-            elif order_id:
-                return self.binance_client.cancel_order(
-                    symbol=symbol,
-                    orderId=int(order_id)  # Binance 的 orderId 是整数
-                )
-            else:
-                return {"error": "order_id 或 client_order_id 必须提供其中一个"}
-        except BinanceAPIException as e:
-            logging.error(f"[Binance撤单失败] {e}")
-            return {"error": str(e)}
-        except Exception as e:
-            logging.error(f"[Binance撤单异常] {e}")
-            return {"error": str(e)}
-
-    def _cancel_hyper(self, order_ids):
-        """
-        Hyperliquid 撤单具体执行逻辑
-        
-        参数:
-            order_ids: 订单ID列表（可以是单个ID的列表）
-        """
-        try:
-            # 确保 order_ids 是列表
-            if not isinstance(order_ids, list):
-                order_ids = [order_ids]
-            
-            # Hyperliquid SDK 的 cancel 方法接受 orderIds 列表
-            return self.hyper_exchange.cancel(order_ids)
-        except Exception as e:
-            logging.error(f"[Hyperliquid撤单失败] {e}")
-            return {"error": str(e)}
-
-    def cancel_order(self, exchange, symbol=None, order_id=None, client_order_id=None, order_ids=None, async_exec=False):
-        """
-        统一撤单接口
-        
-        参数:
-            exchange: 交易所名称 ("binance" 或 "hyperliquid")
-            symbol: 交易对符号（Binance 必填，例如 "BTCUSDT"；Hyperliquid 不需要）
-            order_id: 订单ID（Binance 使用，可选）
-            client_order_id: 客户端订单ID（Binance 使用，可选）
-            order_ids: 订单ID列表（Hyperliquid 使用，可以是单个ID或列表）
-            async_exec: 是否异步执行（放入线程池，不阻塞当前线程）
-        
-        返回:
-            同步执行：返回撤单结果字典
-            异步执行：返回 Future 对象
-        
-        注意:
-            - Binance: 必须提供 symbol，以及 order_id 或 client_order_id 其中之一
-            - Hyperliquid: 必须提供 order_ids（可以是单个ID或列表），不需要 symbol
-        """
-        if not self.is_ready:
-            logging.error("交易执行器未初始化！")
-            return None
-
-        task = None
-        if exchange.lower() == 'binance':
-            if not symbol:
-                logging.error("[cancel_order] Binance 撤单需要提供 symbol 参数")
-                return {"error": "Binance 撤单需要提供 symbol 参数"}
-            
-            if not order_id and not client_order_id:
-                logging.error("[cancel_order] Binance 撤单需要提供 order_id 或 client_order_id 参数")
-                return {"error": "Binance 撤单需要提供 order_id 或 client_order_id 参数"}
-            
-            if async_exec:
-                task = self.executor.submit(self._cancel_binance, symbol, order_id, client_order_id)
-            else:
-                return self._cancel_binance(symbol, order_id, client_order_id)
-        
-        elif exchange.lower() == 'hyperliquid':
-            if not order_ids:
-                logging.error("[cancel_order] Hyperliquid 撤单需要提供 order_ids 参数")
-                return {"error": "Hyperliquid 撤单需要提供 order_ids 参数"}
-            
-            if async_exec:
-                task = self.executor.submit(self._cancel_hyper, order_ids)
-            else:
-                return self._cancel_hyper(order_ids)
-        else:
-            logging.error(f"[cancel_order] 不支持的交易所: {exchange}")
-            return {"error": f"不支持的交易所: {exchange}"}
-        
-        return task  # 如果是异步，返回 Future 对象
-
-    @staticmethod
-    def Rsp_orderInsert(response: dict, exchange: str, symbol: str) -> dict:
-        """
-        处理下单请求的 HTTP 返回值
-        :return: 标准化的结果字典 {'success': bool, 'msg': str, 'data': dict}
-        """
-        exchange = exchange.lower()
-        symbol_str = symbol or "N/A"
-        
-        # 1. 基础空值检查
-        if not response:
-            logging.error(f"[Rsp_Insert] {exchange} {symbol_str} 未收到响应")
-            return {"success": False, "msg": "No response", "data": None}
-
-        # 2. 检查通用错误标记 (TradeExecutor 中捕获异常会返回 'error')
-        if "error" in response:
-            logging.error(f"[Rsp_Insert] {exchange} {symbol_str} 请求报错: {response['error']}")
-            return {"success": False, "msg": response['error'], "data": response}
-
-        # 3. 针对不同交易所的解析逻辑
-        is_success = False
-        order_id = None
-        msg = "OK"
-
-        try:
-            if exchange == "binance":
-                # Binance 成功下单通常包含 'orderId'
-                if "orderId" in response:
-                    is_success = True
-                    order_id = response['orderId']
-                    logging.info(f"[Rsp_Insert] Binance 下单请求成功! ID: {order_id}")
-                else:
-                    msg = f"未知响应结构: {response}"
-
-            elif exchange == "hyperliquid":
-                # Hyperliquid SDK 成功通常返回 {'status': 'ok', 'response': {...}}
-                status = response.get("status")
-                if status == "ok":
-                    # 进一步检查内部状态 (Hyper可能返回status=ok但内部逻辑报错)
-                    inner_resp = response.get("response", {})
-                    if isinstance(inner_resp, dict) and inner_resp.get("type") == "order":
-                        statuses = inner_resp.get("data", {}).get("statuses", [])
-                        # 如果 statuses 里有 error，说明逻辑拒绝
-                        if statuses and "error" in statuses[0]:
-                            msg = f"Hyper 逻辑拒绝: {statuses[0]['error']}"
-                        else:
-                            is_success = True
-                            logging.info(f"[Rsp_Insert] Hyper 下单请求成功! Response: {status}")
-                    else:
-                        is_success = True # 宽容处理，只要status=ok就算发送成功
-                else:
-                    msg = f"Hyper状态异常: {status}"
-
-        except Exception as e:
-            msg = f"解析响应异常: {str(e)}"
-            logging.error(f"[Rsp_Insert] 解析异常: {e}")
-
-        # 4. 返回最终判定
-        if not is_success:
-            logging.warning(f"[Rsp_Insert] {exchange} 下单指令可能失败: {msg}")
-            
-        return {"success": is_success, "msg": msg, "data": response}
-
-    @staticmethod
-    def Rsp_orderCancel(response: dict, exchange: str, symbol: str) -> dict:
-        """
-        处理撤单请求的 HTTP 返回值
-        """
-        exchange = exchange.lower()
-        symbol_str = symbol or "N/A"
-        
-        if not response:
-            logging.error(f"[Rsp_Cancel] {exchange} {symbol_str} 未收到响应")
-            return {"success": False, "msg": "No response", "data": None}
-
-        if "error" in response:
-            logging.error(f"[Rsp_Cancel] {exchange} {symbol_str} 撤单报错: {response['error']}")
-            return {"success": False, "msg": response['error'], "data": response}
-
-        is_success = False
-        msg = "OK"
-
-        try:
-            if exchange == "binance":
-                # Binance 撤单成功也会返回 orderId 和 status
-                if "orderId" in response:
-                    is_success = True
-                    logging.info(f"[Rsp_Cancel] Binance 撤单请求已发送. ID: {response['orderId']}")
-                else:
-                    msg = str(response)
-
-            elif exchange == "hyperliquid":
-                # Hyperliquid 撤单成功通常返回 {'status': 'ok', ...}
-                if response.get("status") == "ok":
-                    is_success = True
-                    logging.info(f"[Rsp_Cancel] Hyper 撤单请求已发送.")
-                else:
-                    msg = response.get("response", "Unknown error")
-
-        except Exception as e:
-            msg = str(e)
-
-        return {"success": is_success, "msg": msg, "data": response}
-
-    @classmethod
-    def Req_orderInsert(
-        cls,
-        executor_instance: 'TradeExecutor',
-        exchange: str,
-        api_key: str = None,
-        secret_key: Optional[str] = None,
-        wallet_private_key: Optional[str] = None,
-        symbol: str = None,
-        side: Optional[str] = None,
-        order_type: Optional[str] = None,
-        quantity: Optional[float] = None,
-        price: Optional[float] = None,
-        order_id: Optional[str] = None,
-        action: str = "place",
-    ) -> Dict[str, Any]:
-        """
-        统一下单函数（使用 TradeExecutor 实例）
-        注意：api_key, secret_key, wallet_private_key 等参数已不再需要（由 TradeExecutor 管理），
-        但为了保持向后兼容，仍保留这些参数。
-        
-        参数:
-            executor_instance: TradeExecutor 实例
-            其他参数：与原 Req_orderInsert 保持一致
-        """
-        if not executor_instance.is_ready:
-            return {"success": False, "error": "交易执行器未初始化！请先调用 trade_executor.init_clients()"}
-        
-        logging.info(f"[Req_orderInsert] 开始下单: {exchange} {side} {symbol} {quantity}")
-        
-        exchange = exchange.lower()
-        
-        try:
-            # 直接调用 TradeExecutor 的下单方法
-            raw_response = executor_instance.place_order(
-                exchange=exchange,
-                symbol=symbol,
-                side=side or "buy",
-                quantity=quantity or 0.001,
-                price=price,
-                async_exec=False  # 默认同步执行
-            )
-            
-            # 使用 Rsp_orderInsert 处理响应
-            rsp_result = cls.Rsp_orderInsert(raw_response, exchange, symbol or "")
-            
-            # 转换为兼容的返回格式（保持向后兼容）
-            if rsp_result["success"]:
-                return {"success": True, "data": rsp_result["data"], "msg": rsp_result.get("msg", "OK")}
-            else:
-                return {"success": False, "error": rsp_result.get("msg", "未知错误"), "data": rsp_result.get("data")}
-                
-        except Exception as e:
-            logging.error(f"[Req_orderInsert] 下单异常: {e}")
-            return {"success": False, "error": str(e)}
-
-    @classmethod
-    def Req_orderCancel(
-        cls,
-        executor_instance: 'TradeExecutor',
-        exchange: str,
-        api_key: str = None,
-        secret_key: Optional[str] = None,
-        wallet_private_key: Optional[str] = None,
-        symbol: Optional[str] = None,
-        order_id: Optional[str] = None,
-        client_order_id: Optional[str] = None,
-        order_ids: Optional[list] = None,
-        action: str = "cancel",
-    ) -> Dict[str, Any]:
-        """
-        统一撤单函数（使用 TradeExecutor 实例）
-        注意：api_key, secret_key, wallet_private_key 等参数已不再需要（由 TradeExecutor 管理），
-        但为了保持向后兼容，仍保留这些参数。
-        
-        参数:
-            executor_instance: TradeExecutor 实例
-            exchange: 交易所名称 ("binance" 或 "hyperliquid")
-            symbol: 交易对符号（Binance 必填，例如 "BTCUSDT"；Hyperliquid 不需要）
-            order_id: 订单ID（Binance 使用，可选）
-            client_order_id: 客户端订单ID（Binance 使用，可选）
-            order_ids: 订单ID列表（Hyperliquid 使用，可以是单个ID或列表）
-            其他参数：为保持向后兼容保留，但实际不使用
-        
-        返回:
-            {"success": True/False, "data": ..., "error": ...}
-        """
-        if not executor_instance.is_ready:
-            return {"success": False, "error": "交易执行器未初始化！请先调用 trade_executor.init_clients()"}
-        
-        exchange = exchange.lower()
-        logging.info(f"[Req_orderCancel] 开始撤单: {exchange} symbol={symbol} order_id={order_id} client_order_id={client_order_id} order_ids={order_ids}")
-        
-        try:
-            # 直接调用 TradeExecutor 的撤单方法
-            raw_response = executor_instance.cancel_order(
-                exchange=exchange,
-                symbol=symbol,
-                order_id=order_id,
-                client_order_id=client_order_id,
-                order_ids=order_ids,
-                async_exec=False  # 默认同步执行
-            )
-            
-            # 使用 Rsp_orderCancel 处理响应
-            rsp_result = cls.Rsp_orderCancel(raw_response, exchange, symbol or "")
-            
-            # 转换为兼容的返回格式（保持向后兼容）
-            if rsp_result["success"]:
-                return {"success": True, "data": rsp_result["data"], "msg": rsp_result.get("msg", "OK")}
-            else:
-                return {"success": False, "error": rsp_result.get("msg", "未知错误"), "data": rsp_result.get("data")}
-                
-        except Exception as e:
-            logging.error(f"[Req_orderCancel] 撤单异常: {e}")
-            return {"success": False, "error": str(e)}
-
-
-class InitialStateChecker:
-    """
-    初始状态检查器
-    用于查询账户余额和持仓状态，确定策略的初始状态
-    """
-    def __init__(self, trade_executor: TradeExecutor):
-        """
-        :param trade_executor: TradeExecutor 实例，用于访问客户端
-        """
-        self.trade_executor = trade_executor
-    
-    def get_balances(self):
-        """
-        查询账户余额
-        返回格式:
-        {
-            "binance": {
-                "usdt": float,  # USDT 余额
-                "available": float,  # 可用余额
-                "locked": float  # 锁定余额
-            },
-            "hyperliquid": {
-                "usdc": float,  # USDC 余额
-                "available": float,  # 可用余额
-                "locked": float  # 锁定余额（保证金）
-            }
-        }
-        """
-        balances = {
-            "binance": {"usdt": 0.0, "available": 0.0, "locked": 0.0},
-            "hyperliquid": {"usdc": 0.0, "available": 0.0, "locked": 0.0}
-        }
-        
-        if not self.trade_executor.is_ready:
-            logging.error("[get_balances] 交易执行器未初始化！")
-            return balances
-        
-        # 1. 查询 Binance USDT 余额（合约账户）
-        if self.trade_executor.binance_client:
-            try:
-                # 方法1: 查询合约账户余额（推荐，因为使用的是合约交易）
-                try:
-                    futures_account = self.trade_executor.binance_client.futures_account()
-                    if futures_account and "assets" in futures_account:
-                        for asset in futures_account["assets"]:
-                            if asset.get("asset") == "USDT":
-                                available_balance = float(asset.get("availableBalance", 0))
-                                wallet_balance = float(asset.get("walletBalance", 0))
-                                locked_balance = wallet_balance - available_balance
-                                
-                                balances["binance"]["usdt"] = available_balance
-                                balances["binance"]["available"] = available_balance
-                                balances["binance"]["locked"] = max(0, locked_balance)
-                                logging.info(f"[Binance] USDT 余额: {balances['binance']['usdt']:.2f} (可用: {balances['binance']['available']:.2f}, 锁定: {balances['binance']['locked']:.2f})")
-                                break
-                except Exception as e:
-                    logging.warning(f"[Binance] 查询合约账户余额失败 (方法1): {e}")
-                    # 方法2: 尝试查询现货账户余额（备用）
-                    try:
-                        asset_balance = self.trade_executor.binance_client.get_asset_balance(asset='USDT')
-                        if asset_balance:
-                            balances["binance"]["usdt"] = float(asset_balance.get("free", 0))
-                            balances["binance"]["available"] = float(asset_balance.get("free", 0))
-                            balances["binance"]["locked"] = float(asset_balance.get("locked", 0))
-                            logging.info(f"[Binance] USDT 余额（现货）: {balances['binance']['usdt']:.2f} (可用: {balances['binance']['available']:.2f}, 锁定: {balances['binance']['locked']:.2f})")
-                    except Exception as e2:
-                        logging.error(f"[Binance] 查询现货账户余额失败 (方法2): {e2}")
-            except Exception as e:
-                logging.error(f"[Binance] 查询余额异常: {e}")
-        
-        # 2. 查询 Hyperliquid USDC 余额
-        if HAVE_HYPER_SDK and self.trade_executor.hyper_info:
-            try:
-                # 使用初始化时保存的钱包地址
-                wallet_address = getattr(self.trade_executor, 'hyper_wallet_address', None)
-                if not wallet_address:
-                    # 备用方案：从配置获取
-                    wallet_address = cfg.HYPERTEST_WALLET
-                
-                if wallet_address:
-                    # 查询用户状态（包含余额信息）
-                    user_state = self.trade_executor.hyper_info.user_state(wallet_address)
-                    
-                    if user_state and "marginSummary" in user_state:
-                        margin_summary = user_state["marginSummary"]
-                        # Hyperliquid 使用 USDC 作为保证金
-                        # 查询可用余额（减去未平仓头寸的保证金）
-                        available_balance_raw = margin_summary.get("availableMargin", 0)
-                        # 锁定余额（已使用的保证金）
-                        locked_balance_raw = margin_summary.get("totalMarginUsed", 0)
-                        # 账户总值
-                        account_value_raw = margin_summary.get("accountValue", 0)
-                        
-                        # 确保转换为 float（处理字符串类型）
-                        try:
-                            available_balance = float(available_balance_raw) if available_balance_raw else 0.0
-                            locked_balance = float(locked_balance_raw) if locked_balance_raw else 0.0
-                            account_value = float(account_value_raw) if account_value_raw else 0.0
-                        except (ValueError, TypeError):
-                            available_balance = 0.0
-                            locked_balance = 0.0
-                            account_value = 0.0
-                            logging.warning(f"[Hyperliquid] 余额数据格式异常: availableMargin={available_balance_raw}, totalMarginUsed={locked_balance_raw}, accountValue={account_value_raw}")
-                        
-                        balances["hyperliquid"]["usdc"] = available_balance
-                        balances["hyperliquid"]["available"] = available_balance
-                        balances["hyperliquid"]["locked"] = locked_balance
-                        
-                        logging.info(f"[Hyperliquid] USDC 余额: {balances['hyperliquid']['usdc']:.2f} (可用: {balances['hyperliquid']['available']:.2f}, 锁定: {balances['hyperliquid']['locked']:.2f}, 账户总值: {account_value:.2f})")
-                    else:
-                        logging.warning("[Hyperliquid] 无法从 user_state 中获取余额信息")
-                else:
-                    logging.warning("[Hyperliquid] 无法获取钱包地址")
-            except Exception as e:
-                logging.error(f"[Hyperliquid] 查询余额异常: {e}")
-                import traceback
-                logging.debug(traceback.format_exc())
-        
-        return balances
-    
-    def Req_Investment_position(self, symbol_binance: str = None, symbol_hyper: str = None, strategy_machine=None):
-        """
-        查询持仓并确定初始状态
-        
-        :param symbol_binance: Binance 交易对符号，如 "BTCUSDT"，默认从配置读取
-        :param symbol_hyper: Hyperliquid 交易对符号，如 "BTC"，默认从配置读取
-        :param strategy_machine: 策略状态机实例（必需），用于更新状态机状态
-        :return: tuple (bool, str) - (是否成功, 初始状态)
-        
-        逻辑：
-        - 如果两边都无持仓：状态设为 OpenCondition，返回 True
-        - 如果两边持有对冲仓位（Binance 空 + Hyper 多）：状态设为 CloseCondition，返回 True
-        - 如果只有单边持仓：打印警告，返回 False
-        """
-        # 从 Simple_strategy 导入状态常量
-        from Simple_strategy import StrategyState
-        
-        if strategy_machine is None:
-            logging.error("[Req_Investment_position] strategy_machine 参数不能为 None")
-            return False, None
-        
-        symbol_binance = symbol_binance or cfg.BINANCE_SYMBOL
-        symbol_hyper = symbol_hyper or cfg.HYPER_SYMBOL
-        
-        binance_position = None
-        hyper_position = None
-        
-        # 1. 查询 Binance 持仓
-        if self.trade_executor.binance_client:
-            try:
-                # 查询合约持仓信息
-                positions = self.trade_executor.binance_client.futures_position_information(symbol=symbol_binance)
-                if positions and len(positions) > 0:
-                    pos = positions[0]
-                    position_amt = float(pos.get("positionAmt", 0))
-                    if abs(position_amt) > 1e-8:  # 有持仓（考虑浮点误差）
-                        binance_position = {
-                            "amount": position_amt,
-                            "side": "long" if position_amt > 0 else "short",
-                            "entry_price": float(pos.get("entryPrice", 0)),
-                            "unrealized_pnl": float(pos.get("unRealizedProfit", 0))
-                        }
-                        logging.info(f"[Binance] 持仓: {binance_position['side']} {abs(binance_position['amount'])} @ {binance_position['entry_price']}")
-                    else:
-                        logging.info(f"[Binance] 无持仓")
-            except Exception as e:
-                logging.error(f"[Binance] 查询持仓失败: {e}")
-        
-        # 2. 查询 Hyperliquid 持仓
-        if HAVE_HYPER_SDK and self.trade_executor.hyper_info:
-            try:
-                wallet_address = getattr(self.trade_executor, 'hyper_wallet_address', None)
-                if not wallet_address:
-                    wallet_address = cfg.HYPERTEST_WALLET
-                
-                if wallet_address:
-                    user_state = self.trade_executor.hyper_info.user_state(wallet_address)
-                    if user_state and "assetPositions" in user_state:
-                        positions = user_state["assetPositions"]
-                        # 查找指定币种的持仓
-                        for pos in positions:
-                            if pos.get("position", {}).get("coin") == symbol_hyper:
-                                position_data = pos.get("position", {})
-                                size = float(position_data.get("szi", 0))  # 持仓数量
-                                if abs(size) > 1e-8:  # 有持仓
-                                    hyper_position = {
-                                        "amount": size,
-                                        "side": "long" if size > 0 else "short",
-                                        "entry_price": float(position_data.get("entryPx", 0)),
-                                        "unrealized_pnl": float(pos.get("unrealizedPnl", 0))
-                                    }
-                                    logging.info(f"[Hyperliquid] 持仓: {hyper_position['side']} {abs(hyper_position['amount'])} @ {hyper_position['entry_price']}")
-                                    break
-                        
-                        if not hyper_position:
-                            logging.info(f"[Hyperliquid] 无持仓")
-            except Exception as e:
-                logging.error(f"[Hyperliquid] 查询持仓失败: {e}")
-                import traceback
-                logging.debug(traceback.format_exc())
-        
-        # 3. 判断持仓状态并设置策略状态
-        has_binance = binance_position is not None
-        has_hyper = hyper_position is not None
-        
-        # 情况1: 两边都无持仓
-        if not has_binance and not has_hyper:
-            logging.info("[持仓检查] 两边都无持仓，状态设为 OpenCondition")
-            initial_state = StrategyState.OpenCondition
-            strategy_machine.update_state(initial_state)
-            return True, initial_state
-        
-        # 情况2: 两边都有持仓
-        if has_binance and has_hyper:
-            # 检查是否为对冲仓位：Binance 空 + Hyper 多
-            binance_side = binance_position["side"]
-            hyper_side = hyper_position["side"]
-            
-            if binance_side == "short" and hyper_side == "long":
-                initial_state = StrategyState.CloseCondition
-                logging.info("[持仓检查] 检测到对冲仓位（Binance 空 + Hyper 多），状态设为 CloseCondition")
-                strategy_machine.update_state(initial_state)
-                return True, initial_state
-            else:
-                # 其他组合视为单边持仓
-                print(f"警告，单边持仓: Binance={binance_side}, Hyper={hyper_side}")
-                logging.warning(f"[持仓检查] 非对冲仓位组合: Binance={binance_side}, Hyper={hyper_side}")
-                return False, None
-        
-        # 情况3: 只有单边持仓
-        print("警告，单边持仓")
-        if has_binance:
-            logging.warning(f"[持仓检查] 只有 Binance 持仓: {binance_position['side']} {abs(binance_position['amount'])}")
-        if has_hyper:
-            logging.warning(f"[持仓检查] 只有 Hyperliquid 持仓: {hyper_position['side']} {abs(hyper_position['amount'])}")
+"""
+不同交易所下单的管理
+交易执行模块 (优化版)
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
+import hmac
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+import requests
+from requests.adapters import HTTPAdapter
+from binance_rest import BinanceFut
+import logging
+import json
+import threading
+import time
+from typing import Dict, Optional, Any
+import config as cfg
+
+# 可选依赖 msgspec > orjson > 标准库 json：小字典解析逐级回退，
+# msgspec 的无类型 decode 在小响应体上通常还要快于 orjson
+try:
+    import msgspec.json
+    _loads = msgspec.json.decode
+    HAVE_MSGSPEC = True
+    HAVE_ORJSON = False
+except ImportError:
+    HAVE_MSGSPEC = False
+    try:
+        import orjson
+        _loads = orjson.loads
+        HAVE_ORJSON = True
+    except ImportError:
+        _loads = json.loads
+        HAVE_ORJSON = False
+
+
+def _ensure_dict(response):
+    """
+    响应兜底解析：SDK 正常返回 dict；个别版本/错误路径会吐原始
+    str/bytes 正文，这里用 orjson（装了的话）就地解析，失败原样返回
+    交给上层按未知结构处理
+    """
+    if type(response) is dict or response is None:
+        return response
+    if isinstance(response, (bytes, bytearray, str)):
+        try:
+            return _loads(response)
+        except Exception:
+            return response
+    return response
+
+
+@lru_cache(maxsize=64)
+def _norm_symbol(symbol):
+    """symbol 规范化缓存：同一交易对只付一次 upper() 分配"""
+    return symbol.upper()
+
+
+@lru_cache(maxsize=8)
+def _is_buy_side(side):
+    """side -> is_buy 布尔缓存（Hyper SDK 用布尔方向）"""
+    return side.lower() == 'buy'
+
+
+@dataclass(slots=True)
+class BalancesSnapshot:
+    """
+    余额快照：扁平六字段结构，替代每次查询都重新分配的嵌套 dict。
+    bn_* 为 Binance（USDT 本位），hl_* 为 Hyperliquid（USDC 保证金）。
+    """
+    bn_usdt: float = 0.0
+    bn_free: float = 0.0
+    bn_locked: float = 0.0
+    hl_usdc: float = 0.0
+    hl_free: float = 0.0
+    hl_locked: float = 0.0
+
+    def to_dict(self):
+        """需要旧版嵌套 dict 形态的调用方按需转换，不默认分配"""
+        return {
+            "binance": {"usdt": self.bn_usdt, "available": self.bn_free,
+                        "locked": self.bn_locked},
+            "hyperliquid": {"usdc": self.hl_usdc, "available": self.hl_free,
+                            "locked": self.hl_locked},
+        }
+
+
+def _tune_http_session(session):
+    """
+    给 SDK 内部的 requests.Session 挂大连接池适配器
+
+    下单/撤单/查仓热路径全是 WAN 往返，冷连接的 TLS 握手（约两个 RTT）
+    占大头；加大 urllib3 连接池并显式 keep-alive，让并发请求命中已
+    握手的长连接而不是各自新建套接字
+    """
+    if session is None:
+        return
+    # max_retries=0：下单非幂等，传输层自动重试可能造成重复成交，
+    # 失败交给上层熔断/追单逻辑决策
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.setdefault("Connection", "keep-alive")
+
+# Hyperliquid 依赖
+try:
+    from hyperliquid.exchange import Exchange as HyperExchange
+    from hyperliquid.info import Info
+    from hyperliquid.utils import constants
+    import eth_account
+    HAVE_HYPER_SDK = True
+except ImportError:
+    HAVE_HYPER_SDK = False
+
+class TradeExecutor:
+    def __init__(self):
+        self.binance_client = None
+        self.binance_direct = None  # 可选的直连精简 REST（见 binance_rest.py）
+        self._bn_exec = None  # (无价格?, 无名义额?) -> 预绑定的下单闭包，init_clients 构建
+        # Binance 熔断器：连续网络失败达到阈值后短路后续下单，探活成功合闸
+        self._bn_fail_streak = 0
+        self._bn_circuit_open = False
+        # Binance 持仓缓存：用户流 ACCOUNT_UPDATE 推送维护，REST 只做兜底
+        self._bn_position_cache = {}
+        self._bn_position_ts = 0.0
+        # Hyperliquid user_state 短 TTL 缓存（见 get_hyper_user_state）
+        self._user_state = None
+        self._user_state_ts = 0.0
+        self._user_state_lock = threading.Lock()
+        self.hyper_exchange = None
+        self.hyper_info = None  # Hyperliquid Info 客户端，用于查询账户信息
+        # 8 线程：双腿并行下单 + 撤单 + 余额检查互不占位，避免排队
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="trade")
+        self.is_ready = False
+        self._asset_idx = {}  # Hyperliquid name -> 资产下标（init_clients 预载）
+        # 交易所名 -> (执行函数, 是否接受 usdt_amount)：查表替代链式 if/elif；
+        # 双写大小写键，规范名直接命中省掉 .lower() 分配（与策略层约定一致）
+        self._place_dispatch = {
+            "Binance": (self._execute_binance, True),
+            "binance": (self._execute_binance, True),
+            "Hyperliquid": (self._execute_hyper, False),
+            "hyperliquid": (self._execute_hyper, False),
+        }
+
+    def close(self):
+        """
+        退出时调用：释放线程池与 HTTP 会话。
+
+        cancel_futures=True 丢弃排队中的任务、wait=False 不等在途请求，
+        保证 Ctrl+C 后进程立刻退出而不是卡在解释器的线程 join 上
+        （3.9+ 的 ThreadPoolExecutor 工作线程默认非 daemon）。
+        """
+        try:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+        if self.binance_direct is not None:
+            self.binance_direct.close()
+        session = getattr(self.binance_client, "session", None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+    def _install_fast_signer(self, secret):
+        """
+        预编译 Binance HMAC 签名上下文并挂到 SDK 实例上。
+
+        hmac.new 每次重做内外 pad 的密钥调度；这里启动时算一次模板，
+        每单 copy() 后只喂查询串（SHA 压缩走 OpenSSL，机器支持时自动
+        用 SHA-NI）。只在 SDK 是 HMAC 签名模式、且 _generate_signature
+        / _order_params 两个钩子都在时才替换，任何探测失败都原样保留
+        SDK 自带签名，不影响正确性。
+        """
+        self._bn_hmac_template = hmac.new(secret.encode("utf-8"), b"", hashlib.sha256)
+        client = self.binance_client
+        try:
+            if getattr(client, "PRIVATE_KEY", None) is not None:
+                return  # RSA / Ed25519 模式，不是 HMAC，不碰
+            order_params = getattr(client, "_order_params", None)
+            if order_params is None or not hasattr(client, "_generate_signature"):
+                return
+
+            template = self._bn_hmac_template
+
+            def _fast_sign(data):
+                # 复用 SDK 自己的参数排序，保证签名串与实际发出的一致
+                query = '&'.join(f"{k}={v}" for k, v in order_params(data))
+                h = template.copy()
+                h.update(query.encode("utf-8"))
+                return h.hexdigest()
+
+            client._generate_signature = _fast_sign
+            logging.info("[TradeExecutor] Binance HMAC 模板签名已启用")
+        except Exception as e:
+            logging.warning(f"[TradeExecutor] HMAC 模板签名安装失败，沿用 SDK 默认: {e}")
+
+    def init_clients(self, testnet=True):
+        """
+        程序启动时调用一次，建立长连接
+        """
+        logging.info("正在初始化交易接口连接...")
+        
+        # 1. 初始化 Binance REST Client
+        try:
+            api_key = cfg.BINANCE_TEST_APIKEY if testnet else cfg.BINANCE_MAIN_APIKEY
+            secret = cfg.BINANCE_TEST_SECRETKEY if testnet else cfg.BINANCE_MAIN_SECRETKEY
+            
+            self.binance_client = Client(api_key, secret, testnet=testnet)
+            # 快失败：1 秒不回来就让上层撤单重发，比阻塞对冲腿强
+            if hasattr(self.binance_client, "REQUEST_TIMEOUT"):
+                self.binance_client.REQUEST_TIMEOUT = 1.0
+            # 加大 SDK 会话连接池，热路径复用已握手的 TLS 长连接
+            _tune_http_session(getattr(self.binance_client, "session", None))
+            self._install_fast_signer(secret)
+            # 按配置切换到直连精简 REST：跳过 SDK 的多层封装，
+            # 下单/撤单走 binance_rest.BinanceFut（方法与 SDK 同名）
+            if getattr(cfg, "BINANCE_DIRECT_REST", False):
+                try:
+                    self.binance_direct = BinanceFut(api_key, secret, testnet=testnet)
+                    logging.info("[TradeExecutor] Binance 直连 REST 已启用")
+                except Exception as e:
+                    logging.warning(f"[TradeExecutor] 直连 REST 初始化失败，沿用 SDK: {e}")
+            self._build_binance_senders()
+            # 这里的 ping 是为了预热连接
+            self.binance_client.ping()
+            logging.info("[TradeExecutor] Binance REST Client 就绪")
+        except Exception as e:
+            logging.error(f"[TradeExecutor] Binance 初始化失败: {e}")
+
+        # 2. 初始化 Hyperliquid Exchange
+        if HAVE_HYPER_SDK:
+            try:
+                base_url = constants.TESTNET_API_URL if testnet else constants.MAINNET_API_URL
+                wallet_key = cfg.HYPERTEST_WALLETKEY if testnet else cfg.HYPER_MAIN_WALLETKEY
+                wallet_address = cfg.HYPERTEST_WALLET if testnet else cfg.HYPER_MAIN_WALLET
+                
+                # 创建 Account 对象 (本地钱包)
+                account = eth_account.Account.from_key(wallet_key)
+                
+                # 初始化 Exchange (这一步通常会拉取一次 info，比较耗时，所以必须预加载)
+                self.hyper_exchange = HyperExchange(account, base_url)
+                
+                # 初始化 Info 客户端（用于查询账户信息，不需要签名）
+                self.hyper_info = Info(base_url, skip_ws=True)
+
+                # Hyperliquid SDK 同样基于 requests.Session，一并调大连接池
+                _tune_http_session(getattr(self.hyper_exchange, "session", None))
+                _tune_http_session(getattr(self.hyper_info, "session", None))
+                
+                # 保存钱包地址供后续使用
+                self.hyper_wallet_address = wallet_address
+                self._install_nonce_generator()
+                
+                logging.info("[TradeExecutor] Hyperliquid Exchange 就绪")
+            except Exception as e:
+                logging.error(f"[TradeExecutor] Hyperliquid 初始化失败: {e}")
+
+        # 3. 并行预热交易时真正会碰的热端点：ping 只暖了一条基础连接，
+        # 首笔套利还会冷启动 /fapi/v2/account、HL 的 meta/user_state
+        # （顺带填充 SDK 的资产索引缓存）。预算 3 秒，超时不阻塞启动
+        warmups = []
+        fut_meta = None
+        if self.binance_client is not None:
+            warmups.append(self.executor.submit(self.binance_client.futures_account))
+            warmups.append(self.executor.submit(self.binance_client.futures_exchange_info))
+        if HAVE_HYPER_SDK and self.hyper_info is not None:
+            fut_meta = self.executor.submit(self.hyper_info.meta)
+            warmups.append(fut_meta)
+            wallet = getattr(self, 'hyper_wallet_address', None)
+            if wallet:
+                warmups.append(self.executor.submit(self.hyper_info.user_state, wallet))
+        if warmups:
+            done, not_done = wait(warmups, timeout=3.0)
+            for f in done:
+                exc = f.exception()
+                if exc is not None:
+                    logging.warning(f"[TradeExecutor] 预热调用失败(忽略): {exc}")
+            if not_done:
+                logging.warning(f"[TradeExecutor] {len(not_done)} 个预热调用超时(后台继续)")
+            # 复用预热拉回的 meta 构建资产索引缓存：交易币种固定，
+            # 提前解析 name -> 下标，免得 SDK 在首单时懒解析
+            if fut_meta is not None and fut_meta in done and fut_meta.exception() is None:
+                self._load_asset_index(fut_meta.result())
+
+        self.is_ready = True
+
+    def _install_nonce_generator(self):
+        """
+        给 Hyperliquid SDK 换上严格递增的 nonce 生成器。
+
+        SDK 每次签名动作用 int(time.time()*1000) 当 nonce，突发批量
+        下单会落在同一毫秒产生重复 nonce 被服务端拒单。替换为
+        max(墙钟, 上个+1)：同毫秒内自动 +1 保证严格递增，平时跟着
+        墙钟走不会漂出服务端的 nonce 时间窗。get_timestamp_ms 在
+        signing 和 exchange 两个模块里都有绑定，存在才替换。
+        """
+        lock = threading.Lock()
+        last = [int(time.time() * 1000)]
+
+        def _next_nonce():
+            now = int(time.time() * 1000)
+            with lock:
+                nxt = last[0] + 1
+                if now > nxt:
+                    nxt = now
+                last[0] = nxt
+                return nxt
+
+        try:
+            import hyperliquid.exchange as _hl_exchange_mod
+            from hyperliquid.utils import signing as _hl_signing
+            patched = 0
+            for mod in (_hl_signing, _hl_exchange_mod):
+                if getattr(mod, "get_timestamp_ms", None) is not None:
+                    mod.get_timestamp_ms = _next_nonce
+                    patched += 1
+            if patched:
+                logging.info("[TradeExecutor] Hyper nonce 生成器已替换为严格递增时钟")
+        except Exception as e:
+            logging.warning(f"[TradeExecutor] nonce 生成器安装失败，沿用 SDK 默认: {e}")
+
+    def _load_asset_index(self, meta):
+        """从 /info meta 构建 name -> 资产下标映射，并预填 SDK 内部缓存"""
+        try:
+            self._asset_idx = {u["name"]: i for i, u in enumerate(meta.get("universe", []))}
+        except (TypeError, KeyError, AttributeError) as e:
+            logging.warning(f"[TradeExecutor] 资产索引预载失败(不影响下单): {e}")
+            return
+        # 不同 SDK 版本把映射放在 exchange 或 info 上，存在才补，
+        # 这样 order()/cancel() 的 name 解析直接命中 dict，不再触发网络
+        for obj in (self.hyper_exchange, self.hyper_info):
+            mapping = getattr(obj, "coin_to_asset", None)
+            if isinstance(mapping, dict):
+                for name, idx in self._asset_idx.items():
+                    mapping.setdefault(name, idx)
+        logging.info(f"[TradeExecutor] 资产索引已预载: {len(self._asset_idx)} 个币种")
+
+    def update_position_cache(self, msg):
+        """
+        用合约用户流的 ACCOUNT_UPDATE 事件维护持仓缓存。
+
+        推送体 a.P = [{s, pa, ep, up, ...}] 是该 symbol 的最新全量值，
+        直接覆盖；字段名映射成 REST positionRisk 的同名键，下游解析
+        逻辑对两种来源无感。
+        """
+        try:
+            positions = msg["a"]["P"]
+        except (KeyError, TypeError):
+            return
+        cache = self._bn_position_cache
+        for p in positions:
+            sym = p.get("s")
+            if sym:
+                cache[sym] = {
+                    "positionAmt": p.get("pa", "0"),
+                    "entryPrice": p.get("ep", "0"),
+                    "unRealizedProfit": p.get("up", "0"),
+                }
+        self._bn_position_ts = time.monotonic()
+
+    def get_cached_position(self, symbol, max_age=30.0):
+        """
+        读持仓缓存。超过 max_age 秒没有任何推送视为过期返回 None，
+        由调用方走 REST 兜底；缓存命中时状态检查零网络往返。
+        """
+        if self._bn_position_ts == 0.0 or time.monotonic() - self._bn_position_ts > max_age:
+            return None
+        return self._bn_position_cache.get(symbol)
+
+    def get_hyper_user_state(self, wallet_address=None, max_age=1.0):
+        """
+        带短 TTL 缓存的 user_state 查询。
+
+        同一份响应里同时有 marginSummary（余额）和 assetPositions
+        （持仓），余额检查和持仓检查各查一次等于白跑一个 WAN 往返；
+        1 秒内的重复调用直接返回缓存。拿不到客户端或请求失败返回
+        None，由调用方按原有空值逻辑处理。
+        """
+        if not HAVE_HYPER_SDK or not self.hyper_info:
+            return None
+        if wallet_address is None:
+            wallet_address = getattr(self, 'hyper_wallet_address', None)
+            if not wallet_address:
+                return None
+        now = time.monotonic()
+        with self._user_state_lock:
+            if self._user_state is not None and now - self._user_state_ts < max_age:
+                return self._user_state
+        try:
+            state = self.hyper_info.user_state(wallet_address)
+        except Exception as e:
+            logging.error(f"[TradeExecutor] user_state 查询失败: {e}")
+            return None
+        with self._user_state_lock:
+            self._user_state = state
+            self._user_state_ts = time.monotonic()
+        return state
+
+    def _build_binance_senders(self):
+        """
+        按单型预绑定 Binance 下单闭包。
+
+        限价/市价(按量)/市价(按名义额) 三种单型的字段模板各构建一次，
+        客户端引用在闭包默认参里绑死；_execute_binance 的每单分支判断
+        退化成 (无价格?, 无名义额?) 二元组查表。
+        """
+        client = self.binance_direct or self.binance_client
+
+        def send_limit(symbol, side, quantity, price, usdt_amount, _c=client):
+            return _c.create_order(
+                symbol=symbol, side=side, type='LIMIT', timeInForce='GTC',
+                quantity=str(quantity), price=str(price))
+
+        def send_market_qty(symbol, side, quantity, price, usdt_amount, _c=client):
+            return _c.create_order(
+                symbol=symbol, side=side, type='MARKET', quantity=str(quantity))
+
+        def send_market_notional(symbol, side, quantity, price, usdt_amount, _c=client):
+            return _c.create_order(
+                symbol=symbol, side=side, type='MARKET',
+                quoteOrderQty=str(round(usdt_amount, 2)))
+
+        # 键与原 if 链的真值语义一致：有价格必为限价，无价格看名义额
+        self._bn_exec = {
+            (False, False): send_limit,
+            (False, True): send_limit,
+            (True, False): send_market_notional,
+            (True, True): send_market_qty,
+        }
+
+    _BN_FAIL_TRIP = 3  # 连续网络失败达到该次数即熔断
+
+    def _note_bn_failure(self):
+        """记一次 Binance 网络失败，连续失败到阈值就拉闸"""
+        self._bn_fail_streak += 1
+        if self._bn_fail_streak >= self._BN_FAIL_TRIP and not self._bn_circuit_open:
+            self._bn_circuit_open = True
+            logging.error(f"[TradeExecutor] Binance 连续 {self._bn_fail_streak} 次网络失败，熔断开启")
+
+    def _bn_probe(self):
+        """熔断后的健康探测：ping 通了才合闸恢复下单"""
+        client = self.binance_direct or self.binance_client
+        try:
+            r = client.ping()
+        except Exception:
+            return False
+        if type(r) is dict and "error" in r:
+            return False
+        self._bn_circuit_open = False
+        self._bn_fail_streak = 0
+        logging.info("[TradeExecutor] Binance 熔断恢复")
+        return True
+
+    def _execute_binance(self, symbol, side, quantity, price=None, usdt_amount=None):
+        """Binance 具体执行逻辑"""
+        if self._bn_circuit_open and not self._bn_probe():
+            return {"error": "Binance 熔断中（连续网络失败），本次下单跳过"}
+        try:
+            # 这里的 symbol 需要大写，例如 "BTCUSDT"（lru 缓存，免每单分配）
+            symbol = _norm_symbol(symbol)
+            side = side.upper()
+            sender = self._bn_exec[(not price, not usdt_amount)]
+            result = sender(symbol, side, quantity, price, usdt_amount)
+        except BinanceAPIException as e:
+            # API 层拒绝（参数/余额等）不是网络问题，不计入熔断
+            logging.error(f"[Binance下单失败] {e}")
+            return {"error": str(e)}
+        except requests.RequestException as e:
+            self._note_bn_failure()
+            logging.error(f"[Binance下单网络异常] {e}")
+            return {"error": str(e)}
+        # 直连客户端的网络失败以 error dict 返回（无 code 键），同样计数
+        if type(result) is dict and "error" in result and result.get("code") is None                 and self.binance_direct is not None:
+            self._note_bn_failure()
+        else:
+            self._bn_fail_streak = 0
+        return result
+
+    def _execute_hyper(self, symbol, side, quantity, price=None):
+        """Hyperliquid 具体执行逻辑"""
+        try:
+            # Hyperliquid SDK 的 symbol 不需要 "USDT" 后缀，例如 "BTC"
+            # 注意：side 在 Hyper SDK 里是布尔值 is_buy
+            is_buy = _is_buy_side(side)
+            
+            if price:
+                # 限价单
+                return self.hyper_exchange.order(
+                    name=symbol,
+                    is_buy=is_buy,
+                    sz=quantity,
+                    limit_px=price,
+                    order_type={"limit": {"tif": "Gtc"}}
+                )
+            else:
+                # 市价单 (注意：Hyperliquid SDK 的 market_open 自带滑点设置)
+                return self.hyper_exchange.market_open(
+                    name=symbol,
+                    is_buy=is_buy,
+                    sz=quantity,
+                    slippage=0.02 # 允许 2% 滑点，防止市价单失败
+                )
+        except Exception as e:
+            logging.error(f"[Hyperliquid下单失败] {e}")
+            return {"error": str(e)}
+
+    def place_order(self, exchange, symbol, side, quantity, price=None, usdt_amount=None, async_exec=False):
+        """
+        统一对外接口
+        :param async_exec: 是否异步执行（放入线程池，不阻塞当前线程）
+        """
+        if not self.is_ready:
+            logging.error("交易执行器未初始化！")
+            return None
+
+        entry = self._place_dispatch.get(exchange) or self._place_dispatch.get(exchange.lower())
+        if entry is None:
+            logging.error(f"[place_order] 不支持的交易所: {exchange}")
+            return None
+
+        func, takes_usdt = entry
+        if takes_usdt:
+            args = (symbol, side, quantity, price, usdt_amount)
+        else:
+            args = (symbol, side, quantity, price)
+        if async_exec:
+            return self.executor.submit(func, *args)  # 异步返回 Future 对象
+        return func(*args)
+
+    def _dispatch_leg(self, leg):
+        """单腿分发：按 leg["exchange"] 调对应交易所的执行函数"""
+        exchange = leg["exchange"].lower()
+        if exchange == 'binance':
+            return self._execute_binance(leg["symbol"], leg["side"], leg["quantity"],
+                                         leg.get("price"), leg.get("usdt_amount"))
+        if exchange == 'hyperliquid':
+            return self._execute_hyper(leg["symbol"], leg["side"], leg["quantity"], leg.get("price"))
+        return {"error": f"不支持的交易所: {leg['exchange']}"}
+
+    def place_orders_parallel(self, legs, timeout=5.0):
+        """
+        多腿并行下单：各腿同时进线程池，墙钟耗时从各腿 RTT 之和降到最大值
+        （对冲对是典型场景：Binance 腿 + Hyper 腿同时在途）
+
+        参数:
+            legs: [{"exchange":..., "symbol":..., "side":..., "quantity":...,
+                    "price":...(可选), "usdt_amount":...(可选)}, ...]
+
+        返回:
+            与 legs 等长的结果列表，超时腿记为 {"error": "timeout"}
+        """
+        if not self.is_ready:
+            logging.error("交易执行器未初始化！")
+            return None
+
+        futs = [self.executor.submit(self._dispatch_leg, leg) for leg in legs]
+        wait(futs, timeout=timeout)
+        results = []
+        for f in futs:
+            if f.done():
+                try:
+                    results.append(f.result())
+                except Exception as e:
+                    results.append({"error": str(e)})
+            else:
+                results.append({"error": "timeout"})
+        return results
+
+    def _cancel_binance(self, symbol, order_id=None, client_order_id=None):
+        """Binance 撤单具体执行逻辑"""
+        try:
+            # 这里的 symbol 需要大写，例如 "BTCUSDT"
+            symbol = _norm_symbol(symbol)
+            client = self.binance_direct or self.binance_client
+            
+            # Binance 支持通过 orderId 或 origClientOrderId 撤单
+            if client_order_id:
+                return client.cancel_order(
+                    symbol=symbol,
+                    origClientOrderId=client_order_id
+                )
+            elif order_id:
+                return client.cancel_order(
+                    symbol=symbol,
+                    orderId=int(order_id)  # Binance 的 orderId 是整数
+                )
+            else:
+                return {"error": "order_id 或 client_order_id 必须提供其中一个"}
+        except BinanceAPIException as e:
+            logging.error(f"[Binance撤单失败] {e}")
+            return {"error": str(e)}
+        except Exception as e:
+            logging.error(f"[Binance撤单异常] {e}")
+            return {"error": str(e)}
+
+    def _cancel_replace_binance(self, symbol, cancel_order_id, side, quantity, price=None):
+        """Binance 撤单+下单合并执行（单次请求原子完成，省一次网络往返）"""
+        try:
+            symbol = _norm_symbol(symbol)
+            side = side.upper()
+
+            # 新版 SDK 提供 cancelReplace 接口（POST /api/v3/order/cancelReplace），
+            # 旧版没有该方法时退回「先撤后下」两次往返
+            cancel_replace = getattr(self.binance_client, "cancel_replace_order", None)
+            if cancel_replace is None:
+                cancel_res = self._cancel_binance(symbol, order_id=cancel_order_id)
+                if isinstance(cancel_res, dict) and "error" in cancel_res:
+                    # 撤单失败（可能已成交/已撤销），不下新单，避免重复对冲
+                    return {"error": f"撤单失败，放弃改单: {cancel_res['error']}"}
+                return self._execute_binance(symbol, side, quantity, price)
+
+            params = {
+                "symbol": symbol,
+                "side": side,
+                "cancelReplaceMode": "STOP_ON_FAILURE",  # 撤单失败则不挂新单
+                "cancelOrderId": int(cancel_order_id),
+                "quantity": str(quantity),
+            }
+            if price:  # 限价单
+                params.update(type="LIMIT", timeInForce="GTC", price=str(price))
+            else:  # 市价单
+                params["type"] = "MARKET"
+            return cancel_replace(**params)
+        except BinanceAPIException as e:
+            logging.error(f"[Binance撤换单失败] {e}")
+            return {"error": str(e)}
+        except Exception as e:
+            logging.error(f"[Binance撤换单异常] {e}")
+            return {"error": str(e)}
+
+    def cancel_replace_order(self, exchange, symbol, cancel_order_id, side, quantity, price=None, async_exec=False):
+        """
+        统一撤单改单接口：一次请求撤掉旧单并挂出新单（目前仅 Binance 支持）
+
+        参数:
+            cancel_order_id: 需要撤销的旧订单ID
+            其余参数与 place_order 一致
+
+        返回:
+            cancelReplace 原始响应（新订单信息在 newOrderResponse 字段），
+            失败时返回 {"error": ...}；async_exec=True 时返回 Future
+        """
+        if not self.is_ready:
+            logging.error("交易执行器未初始化！")
+            return None
+
+        if exchange.lower() != 'binance':
+            logging.error(f"[cancel_replace_order] 不支持的交易所: {exchange}")
+            return {"error": f"不支持的交易所: {exchange}"}
+
+        if async_exec:
+            return self.executor.submit(self._cancel_replace_binance, symbol, cancel_order_id, side, quantity, price)
+        return self._cancel_replace_binance(symbol, cancel_order_id, side, quantity, price)
+
+    def _execute_hyper_batch(self, orders):
+        """
+        Hyperliquid 批量下单：N 笔限价单合成一次签名动作 + 一次往返
+
+        参数:
+            orders: [{"symbol":..., "side":..., "quantity":..., "price":...}, ...]
+                    批量通道只接限价单（对冲腿/网格重挂都是限价场景）
+
+        返回:
+            SDK bulk_orders 原始响应；旧版 SDK 无批量接口或有市价腿时
+            退化为逐笔下单，返回逐笔响应列表
+        """
+        try:
+            bulk = getattr(self.hyper_exchange, "bulk_orders", None)
+            if bulk is None or any(not o.get("price") for o in orders):
+                return [self._execute_hyper(o["symbol"], o["side"], o["quantity"], o.get("price"))
+                        for o in orders]
+
+            order_requests = [{
+                "coin": o["symbol"],
+                "is_buy": o["side"].lower() == "buy",
+                "sz": o["quantity"],
+                "limit_px": o["price"],
+                "order_type": {"limit": {"tif": "Gtc"}},
+                "reduce_only": False,
+            } for o in orders]
+            return bulk(order_requests)
+        except Exception as e:
+            logging.error(f"[Hyperliquid批量下单失败] {e}")
+            return {"error": str(e)}
+
+    def _cancel_hyper_batch(self, cancels):
+        """
+        Hyperliquid 批量撤单：一次签名动作撤掉多笔
+
+        参数:
+            cancels: [{"coin":..., "oid":...}, ...]
+        """
+        try:
+            bulk = getattr(self.hyper_exchange, "bulk_cancel", None)
+            if bulk is None:
+                return self._cancel_hyper([c["oid"] for c in cancels])
+            return bulk(cancels)
+        except Exception as e:
+            logging.error(f"[Hyperliquid批量撤单失败] {e}")
+            return {"error": str(e)}
+
+    def place_orders(self, exchange, orders, async_exec=False):
+        """
+        批量下单统一入口（目前仅 Hyperliquid 有原生原子批量通道）
+
+        参数:
+            orders: 订单 dict 列表，字段同 place_order（symbol/side/quantity/price）
+            async_exec: True 时返回 Future
+        """
+        if not self.is_ready:
+            logging.error("交易执行器未初始化！")
+            return None
+
+        if exchange.lower() != 'hyperliquid':
+            logging.error(f"[place_orders] 不支持的交易所: {exchange}")
+            return {"error": f"不支持的交易所: {exchange}"}
+
+        if async_exec:
+            return self.executor.submit(self._execute_hyper_batch, orders)
+        return self._execute_hyper_batch(orders)
+
+    def _cancel_hyper(self, order_ids):
+        """
+        Hyperliquid 撤单具体执行逻辑
+        
+        参数:
+            order_ids: 订单ID列表（可以是单个ID的列表）
+        """
+        try:
+            # 确保 order_ids 是列表
+            if not isinstance(order_ids, list):
+                order_ids = [order_ids]
+            
+            # Hyperliquid SDK 的 cancel 方法接受 orderIds 列表
+            return self.hyper_exchange.cancel(order_ids)
+        except Exception as e:
+            logging.error(f"[Hyperliquid撤单失败] {e}")
+            return {"error": str(e)}
+
+    def cancel_order(self, exchange, symbol=None, order_id=None, client_order_id=None, order_ids=None, async_exec=False):
+        """
+        统一撤单接口
+        
+        参数:
+            exchange: 交易所名称 ("binance" 或 "hyperliquid")
+            symbol: 交易对符号（Binance 必填，例如 "BTCUSDT"；Hyperliquid 不需要）
+            order_id: 订单ID（Binance 使用，可选）
+            client_order_id: 客户端订单ID（Binance 使用，可选）
+            order_ids: 订单ID列表（Hyperliquid 使用，可以是单个ID或列表）
+            async_exec: 是否异步执行（放入线程池，不阻塞当前线程）
+        
+        返回:
+            同步执行：返回撤单结果字典
+            异步执行：返回 Future 对象
+        
+        注意:
+            - Binance: 必须提供 symbol，以及 order_id 或 client_order_id 其中之一
+            - Hyperliquid: 必须提供 order_ids（可以是单个ID或列表），不需要 symbol
+        """
+        if not self.is_ready:
+            logging.error("交易执行器未初始化！")
+            return None
+
+        task = None
+        exchange = exchange.lower()  # 只规范化一次，下面直接比较
+        if exchange == 'binance':
+            if not symbol:
+                logging.error("[cancel_order] Binance 撤单需要提供 symbol 参数")
+                return {"error": "Binance 撤单需要提供 symbol 参数"}
+            
+            if not order_id and not client_order_id:
+                logging.error("[cancel_order] Binance 撤单需要提供 order_id 或 client_order_id 参数")
+                return {"error": "Binance 撤单需要提供 order_id 或 client_order_id 参数"}
+            
+            if async_exec:
+                task = self.executor.submit(self._cancel_binance, symbol, order_id, client_order_id)
+            else:
+                return self._cancel_binance(symbol, order_id, client_order_id)
+        
+        elif exchange == 'hyperliquid':
+            if not order_ids:
+                logging.error("[cancel_order] Hyperliquid 撤单需要提供 order_ids 参数")
+                return {"error": "Hyperliquid 撤单需要提供 order_ids 参数"}
+            
+            if async_exec:
+                task = self.executor.submit(self._cancel_hyper, order_ids)
+            else:
+                return self._cancel_hyper(order_ids)
+        else:
+            logging.error(f"[cancel_order] 不支持的交易所: {exchange}")
+            return {"error": f"不支持的交易所: {exchange}"}
+        
+        return task  # 如果是异步，返回 Future 对象
+
+    @staticmethod
+    def Rsp_orderInsert(response: dict, exchange: str, symbol: str) -> dict:
+        """
+        处理下单请求的 HTTP 返回值
+        :return: 标准化的结果字典 {'success': bool, 'msg': str, 'data': dict}
+
+        成功是绝对主流（≥95%），按早返回阶梯组织：成功路径只做判定
+        所需的最少 dict 查找就直接返回，空响应/error 键/未知结构等
+        冷分支全部落到 _rsp_insert_slow 慢路径里做诊断。
+        """
+        exchange = exchange.lower()
+        response = _ensure_dict(response)
+
+        if type(response) is dict and "error" not in response:
+            if exchange == "binance":
+                # Binance 成功下单通常包含 'orderId'
+                order_id = response.get("orderId")
+                if order_id is not None:
+                    logging.info(f"[Rsp_Insert] Binance 下单请求成功! ID: {order_id}")
+                    return {"success": True, "msg": "OK", "data": response}
+
+            elif exchange == "hyperliquid" and response.get("status") == "ok":
+                # Hyper 可能 status=ok 但内部逻辑报错，须看 statuses[0]
+                inner_resp = response.get("response")
+                if type(inner_resp) is dict and inner_resp.get("type") == "order":
+                    try:
+                        statuses = inner_resp["data"]["statuses"]
+                    except (KeyError, TypeError):
+                        statuses = None
+                    if not statuses or "error" not in statuses[0]:
+                        logging.info("[Rsp_Insert] Hyper 下单请求成功! Response: ok")
+                        return {"success": True, "msg": "OK", "data": response}
+                else:
+                    # 宽容处理，只要 status=ok 就算发送成功
+                    return {"success": True, "msg": "OK", "data": response}
+
+        return TradeExecutor._rsp_insert_slow(response, exchange, symbol)
+
+    @staticmethod
+    def _rsp_insert_slow(response, exchange, symbol):
+        """Rsp_orderInsert 的诊断慢路径：空响应 / error 键 / 未知结构 / 逻辑拒绝"""
+        symbol_str = symbol or "N/A"
+
+        if not response:
+            logging.error(f"[Rsp_Insert] {exchange} {symbol_str} 未收到响应")
+            return {"success": False, "msg": "No response", "data": None}
+
+        # TradeExecutor 中捕获异常会返回 'error'
+        if isinstance(response, dict) and "error" in response:
+            logging.error(f"[Rsp_Insert] {exchange} {symbol_str} 请求报错: {response['error']}")
+            return {"success": False, "msg": response['error'], "data": response}
+
+        msg = f"未知响应结构: {response}"
+        try:
+            if exchange == "hyperliquid":
+                status = response.get("status")
+                if status == "ok":
+                    statuses = response["response"]["data"]["statuses"]
+                    msg = f"Hyper 逻辑拒绝: {statuses[0]['error']}"
+                else:
+                    msg = f"Hyper状态异常: {status}"
+        except (KeyError, TypeError, IndexError, AttributeError) as e:
+            msg = f"解析响应异常: {str(e)}"
+            logging.error(f"[Rsp_Insert] 解析异常: {e}")
+
+        logging.warning(f"[Rsp_Insert] {exchange} 下单指令可能失败: {msg}")
+        return {"success": False, "msg": msg, "data": response}
+
+    @staticmethod
+    def Rsp_orderCancel(response: dict, exchange: str, symbol: str) -> dict:
+        """
+        处理撤单请求的 HTTP 返回值
+        """
+        exchange = exchange.lower()
+        symbol_str = symbol or "N/A"
+        response = _ensure_dict(response)
+        
+        if not response:
+            logging.error(f"[Rsp_Cancel] {exchange} {symbol_str} 未收到响应")
+            return {"success": False, "msg": "No response", "data": None}
+
+        if "error" in response:
+            logging.error(f"[Rsp_Cancel] {exchange} {symbol_str} 撤单报错: {response['error']}")
+            return {"success": False, "msg": response['error'], "data": response}
+
+        is_success = False
+        msg = "OK"
+
+        try:
+            if exchange == "binance":
+                # Binance 撤单成功也会返回 orderId 和 status
+                if "orderId" in response:
+                    is_success = True
+                    logging.info(f"[Rsp_Cancel] Binance 撤单请求已发送. ID: {response['orderId']}")
+                else:
+                    msg = str(response)
+
+            elif exchange == "hyperliquid":
+                # Hyperliquid 撤单成功通常返回 {'status': 'ok', ...}
+                if response.get("status") == "ok":
+                    is_success = True
+                    logging.info(f"[Rsp_Cancel] Hyper 撤单请求已发送.")
+                else:
+                    msg = response.get("response", "Unknown error")
+
+        except Exception as e:
+            msg = str(e)
+
+        return {"success": is_success, "msg": msg, "data": response}
+
+    @classmethod
+    def Req_orderInsert(
+        cls,
+        executor_instance: 'TradeExecutor',
+        exchange: str,
+        api_key: str = None,
+        secret_key: Optional[str] = None,
+        wallet_private_key: Optional[str] = None,
+        symbol: str = None,
+        side: Optional[str] = None,
+        order_type: Optional[str] = None,
+        quantity: Optional[float] = None,
+        price: Optional[float] = None,
+        order_id: Optional[str] = None,
+        action: str = "place",
+    ) -> Dict[str, Any]:
+        """
+        统一下单函数（使用 TradeExecutor 实例）
+        注意：api_key, secret_key, wallet_private_key 等参数已不再需要（由 TradeExecutor 管理），
+        但为了保持向后兼容，仍保留这些参数。
+        
+        参数:
+            executor_instance: TradeExecutor 实例
+            其他参数：与原 Req_orderInsert 保持一致
+        """
+        if not executor_instance.is_ready:
+            return {"success": False, "error": "交易执行器未初始化！请先调用 trade_executor.init_clients()"}
+        
+        logging.info(f"[Req_orderInsert] 开始下单: {exchange} {side} {symbol} {quantity}")
+        
+        exchange = exchange.lower()
+        
+        try:
+            # 直接调用 TradeExecutor 的下单方法
+            raw_response = executor_instance.place_order(
+                exchange=exchange,
+                symbol=symbol,
+                side=side or "buy",
+                quantity=quantity or 0.001,
+                price=price,
+                async_exec=False  # 默认同步执行
+            )
+            
+            # 使用 Rsp_orderInsert 处理响应
+            rsp_result = cls.Rsp_orderInsert(raw_response, exchange, symbol or "")
+            
+            # 转换为兼容的返回格式（保持向后兼容）
+            if rsp_result["success"]:
+                return {"success": True, "data": rsp_result["data"], "msg": rsp_result.get("msg", "OK")}
+            else:
+                return {"success": False, "error": rsp_result.get("msg", "未知错误"), "data": rsp_result.get("data")}
+                
+        except Exception as e:
+            logging.error(f"[Req_orderInsert] 下单异常: {e}")
+            return {"success": False, "error": str(e)}
+
+    @classmethod
+    def Req_orderCancel(
+        cls,
+        executor_instance: 'TradeExecutor',
+        exchange: str,
+        api_key: str = None,
+        secret_key: Optional[str] = None,
+        wallet_private_key: Optional[str] = None,
+        symbol: Optional[str] = None,
+        order_id: Optional[str] = None,
+        client_order_id: Optional[str] = None,
+        order_ids: Optional[list] = None,
+        action: str = "cancel",
+    ) -> Dict[str, Any]:
+        """
+        统一撤单函数（使用 TradeExecutor 实例）
+        注意：api_key, secret_key, wallet_private_key 等参数已不再需要（由 TradeExecutor 管理），
+        但为了保持向后兼容，仍保留这些参数。
+        
+        参数:
+            executor_instance: TradeExecutor 实例
+            exchange: 交易所名称 ("binance" 或 "hyperliquid")
+            symbol: 交易对符号（Binance 必填，例如 "BTCUSDT"；Hyperliquid 不需要）
+            order_id: 订单ID（Binance 使用，可选）
+            client_order_id: 客户端订单ID（Binance 使用，可选）
+            order_ids: 订单ID列表（Hyperliquid 使用，可以是单个ID或列表）
+            其他参数：为保持向后兼容保留，但实际不使用
+        
+        返回:
+            {"success": True/False, "data": ..., "error": ...}
+        """
+        if not executor_instance.is_ready:
+            return {"success": False, "error": "交易执行器未初始化！请先调用 trade_executor.init_clients()"}
+        
+        exchange = exchange.lower()
+        logging.info(f"[Req_orderCancel] 开始撤单: {exchange} symbol={symbol} order_id={order_id} client_order_id={client_order_id} order_ids={order_ids}")
+        
+        try:
+            # 直接调用 TradeExecutor 的撤单方法
+            raw_response = executor_instance.cancel_order(
+                exchange=exchange,
+                symbol=symbol,
+                order_id=order_id,
+                client_order_id=client_order_id,
+                order_ids=order_ids,
+                async_exec=False  # 默认同步执行
+            )
+            
+            # 使用 Rsp_orderCancel 处理响应
+            rsp_result = cls.Rsp_orderCancel(raw_response, exchange, symbol or "")
+            
+            # 转换为兼容的返回格式（保持向后兼容）
+            if rsp_result["success"]:
+                return {"success": True, "data": rsp_result["data"], "msg": rsp_result.get("msg", "OK")}
+            else:
+                return {"success": False, "error": rsp_result.get("msg", "未知错误"), "data": rsp_result.get("data")}
+                
+        except Exception as e:
+            logging.error(f"[Req_orderCancel] 撤单异常: {e}")
+            return {"success": False, "error": str(e)}
+
+
+class InitialStateChecker:
+    """
+    初始状态检查器
+    用于查询账户余额和持仓状态，确定策略的初始状态
+    """
+    def __init__(self, trade_executor: TradeExecutor):
+        """
+        :param trade_executor: TradeExecutor 实例，用于访问客户端
+        """
+        self.trade_executor = trade_executor
+        # USDT 在 futures_account()["assets"] 里的下标缓存：
+        # Binance 返回顺序稳定，首查后续直接按下标命中，失配再回退线性扫
+        self._bn_usdt_idx = None
+        # 余额查询超截止期计数（滑动一分钟窗口），超限升级告警
+        self._deadline_misses = 0
+        self._deadline_win_start = 0.0
+    
+    def _note_deadline_miss(self, what):
+        """记一次超截止期：一分钟内超过 3 次说明端点不稳，升级为 ERROR"""
+        now = time.monotonic()
+        if now - self._deadline_win_start > 60.0:
+            self._deadline_win_start = now
+            self._deadline_misses = 0
+        self._deadline_misses += 1
+        if self._deadline_misses > 3:
+            logging.error(f"[InitialStateChecker] 一分钟内第 {self._deadline_misses} 次余额查询超截止期 ({what})，端点疑似异常")
+        else:
+            logging.warning(f"[InitialStateChecker] 余额查询超截止期: {what}")
+
+    def _race_binance_balance(self, deadline=2.0):
+        """
+        合约账户（主路）与现货余额（备路）同时发出、截止期兜底。
+
+        SDK 默认超时 30 秒，主路一旦卡住整个状态检查跟着卡；这里备路
+        在主路等待期间已经在途，主路超时/失败立刻切换，整体耗时封顶
+        在 deadline 附近。返回 (futures_account, asset_balance)，
+        未取到的一侧为 None。
+        """
+        ex = self.trade_executor
+        end = time.monotonic() + deadline
+        f_fut = ex.executor.submit(ex.binance_client.futures_account)
+        f_spot = ex.executor.submit(ex.binance_client.get_asset_balance, asset='USDT')
+        try:
+            fa = f_fut.result(timeout=deadline)
+            if fa:
+                f_spot.cancel()
+                return fa, None
+        except FuturesTimeout:
+            self._note_deadline_miss("futures_account")
+            f_fut.cancel()
+        except Exception as e:
+            logging.warning(f"[Binance] 查询合约账户余额失败 (方法1): {e}")
+        try:
+            ab = f_spot.result(timeout=max(0.1, end - time.monotonic()))
+            return None, ab
+        except FuturesTimeout:
+            self._note_deadline_miss("get_asset_balance")
+            f_spot.cancel()
+        except Exception as e2:
+            logging.error(f"[Binance] 查询现货账户余额失败 (方法2): {e2}")
+        return None, None
+
+    @staticmethod
+    def _fut_result(fut, timeout=None):
+        """收割预取 Future；失败/超时返回 None，由调用方走原同步路径兜底"""
+        if fut is None:
+            return None
+        try:
+            return fut.result(timeout=timeout)
+        except Exception as e:
+            logging.warning(f"[InitialStateChecker] 预取失败，回退同步查询: {e}")
+            return None
+
+    def refresh_state(self, strategy_machine=None, symbol_binance: str = None, symbol_hyper: str = None):
+        """
+        并行刷新余额 + 持仓：三个独立端点同时在途
+
+        原 get_balances -> Req_Investment_position 串行走 4 次 WAN 往返
+        （其中 HL user_state 被查了两次）。此处一次提交
+        futures_account / futures_position_information / user_state
+        三个请求，HL 的同一份 user_state 同时喂给余额和持仓解析，
+        关键路径从 RTT 之和降到最大值。
+
+        返回:
+            (balances, is_position_valid, initial_state)
+        """
+        ex = self.trade_executor
+        fut_acct = fut_pos = fut_state = None
+        symbol_binance = symbol_binance or cfg.BINANCE_SYMBOL
+
+        if ex.binance_client:
+            fut_acct = ex.executor.submit(ex.binance_client.futures_account)
+            fut_pos = ex.executor.submit(
+                ex.binance_client.futures_position_information, symbol=symbol_binance)
+        if HAVE_HYPER_SDK and ex.hyper_info:
+            wallet_address = getattr(ex, 'hyper_wallet_address', None) or cfg.HYPERTEST_WALLET
+            if wallet_address:
+                fut_state = ex.executor.submit(ex.hyper_info.user_state, wallet_address)
+
+        user_state = self._fut_result(fut_state, timeout=5.0)
+        balances = self.get_balances(
+            futures_account_data=self._fut_result(fut_acct, timeout=5.0),
+            hyper_user_state=user_state)
+        is_valid, initial_state = self.Req_Investment_position(
+            symbol_binance=symbol_binance, symbol_hyper=symbol_hyper,
+            strategy_machine=strategy_machine,
+            positions_data=self._fut_result(fut_pos, timeout=5.0),
+            hyper_user_state=user_state)
+        return balances, is_valid, initial_state
+
+    def get_balances(self, futures_account_data=None, hyper_user_state=None):
+        """
+        查询账户余额
+
+        参数:
+            futures_account_data / hyper_user_state: refresh_state 并行
+            预取的结果，传入则跳过对应同步请求
+
+        返回:
+            BalancesSnapshot（扁平六字段；需要旧版嵌套 dict 用 .to_dict()）
+        """
+        balances = BalancesSnapshot()
+        
+        if not self.trade_executor.is_ready:
+            logging.error("[get_balances] 交易执行器未初始化！")
+            return balances
+        
+        # 1. 查询 Binance USDT 余额（合约主路 + 现货备路赛跑，截止期兜底）
+        if self.trade_executor.binance_client:
+            try:
+                futures_account = futures_account_data
+                asset_balance = None
+                if futures_account is None:
+                    futures_account, asset_balance = self._race_binance_balance()
+                if futures_account and "assets" in futures_account:
+                    assets = futures_account["assets"]
+                    # 下标缓存命中则 O(1)，失配（资产列表变动）回退线性扫并刷新
+                    idx = self._bn_usdt_idx
+                    asset = None
+                    if idx is not None and idx < len(assets) and assets[idx].get("asset") == "USDT":
+                        asset = assets[idx]
+                    else:
+                        for i, a in enumerate(assets):
+                            if a.get("asset") == "USDT":
+                                self._bn_usdt_idx = i
+                                asset = a
+                                break
+                    if asset is not None:
+                        available_balance = float(asset.get("availableBalance", 0))
+                        wallet_balance = float(asset.get("walletBalance", 0))
+                        locked_balance = wallet_balance - available_balance
+                            
+                        balances.bn_usdt = available_balance
+                        balances.bn_free = available_balance
+                        balances.bn_locked = max(0, locked_balance)
+                        logging.info(f"[Binance] USDT 余额: {balances.bn_usdt:.2f} (可用: {balances.bn_free:.2f}, 锁定: {balances.bn_locked:.2f})")
+                elif asset_balance:
+                    # 备路（现货）结果
+                    balances.bn_usdt = float(asset_balance.get("free", 0))
+                    balances.bn_free = balances.bn_usdt
+                    balances.bn_locked = float(asset_balance.get("locked", 0))
+                    logging.info(f"[Binance] USDT 余额（现货）: {balances.bn_usdt:.2f} (可用: {balances.bn_free:.2f}, 锁定: {balances.bn_locked:.2f})")
+            except Exception as e:
+                logging.error(f"[Binance] 查询余额异常: {e}")
+        
+        # 2. 查询 Hyperliquid USDC 余额
+        if HAVE_HYPER_SDK and self.trade_executor.hyper_info:
+            try:
+                # 使用初始化时保存的钱包地址
+                wallet_address = getattr(self.trade_executor, 'hyper_wallet_address', None)
+                if not wallet_address:
+                    # 备用方案：从配置获取
+                    wallet_address = cfg.HYPERTEST_WALLET
+                
+                if wallet_address:
+                    # 查询用户状态（包含余额信息）；预取结果优先
+                    user_state = hyper_user_state
+                    if user_state is None:
+                        user_state = self.trade_executor.get_hyper_user_state(wallet_address)
+                    
+                    if user_state and "marginSummary" in user_state:
+                        margin_summary = user_state["marginSummary"]
+                        # Hyperliquid 使用 USDC 作为保证金
+                        # 查询可用余额（减去未平仓头寸的保证金）
+                        available_balance_raw = margin_summary.get("availableMargin", 0)
+                        # 锁定余额（已使用的保证金）
+                        locked_balance_raw = margin_summary.get("totalMarginUsed", 0)
+                        # 账户总值
+                        account_value_raw = margin_summary.get("accountValue", 0)
+                        
+                        # 确保转换为 float（处理字符串类型）
+                        try:
+                            available_balance = float(available_balance_raw) if available_balance_raw else 0.0
+                            locked_balance = float(locked_balance_raw) if locked_balance_raw else 0.0
+                            account_value = float(account_value_raw) if account_value_raw else 0.0
+                        except (ValueError, TypeError):
+                            available_balance = 0.0
+                            locked_balance = 0.0
+                            account_value = 0.0
+                            logging.warning(f"[Hyperliquid] 余额数据格式异常: availableMargin={available_balance_raw}, totalMarginUsed={locked_balance_raw}, accountValue={account_value_raw}")
+                        
+                        balances.hl_usdc = available_balance
+                        balances.hl_free = available_balance
+                        balances.hl_locked = locked_balance
+                        
+                        logging.info(f"[Hyperliquid] USDC 余额: {balances.hl_usdc:.2f} (可用: {balances.hl_free:.2f}, 锁定: {balances.hl_locked:.2f}, 账户总值: {account_value:.2f})")
+                    else:
+                        logging.warning("[Hyperliquid] 无法从 user_state 中获取余额信息")
+                else:
+                    logging.warning("[Hyperliquid] 无法获取钱包地址")
+            except Exception as e:
+                # exc_info 把栈格式化推迟到 handler，DEBUG 未开时零开销
+                logging.error(f"[Hyperliquid] 查询余额异常: {e}")
+                logging.debug("查询余额异常堆栈", exc_info=True)
+        
+        return balances
+    
+    def Req_Investment_position(self, symbol_binance: str = None, symbol_hyper: str = None, strategy_machine=None,
+                                positions_data=None, hyper_user_state=None):
+        """
+        查询持仓并确定初始状态
+        
+        :param symbol_binance: Binance 交易对符号，如 "BTCUSDT"，默认从配置读取
+        :param symbol_hyper: Hyperliquid 交易对符号，如 "BTC"，默认从配置读取
+        :param strategy_machine: 策略状态机实例（必需），用于更新状态机状态
+        :param positions_data / hyper_user_state: refresh_state 并行预取的结果，传入则跳过对应同步请求
+        :return: tuple (bool, str) - (是否成功, 初始状态)
+        
+        逻辑：
+        - 如果两边都无持仓：状态设为 OpenCondition，返回 True
+        - 如果两边持有对冲仓位（Binance 空 + Hyper 多）：状态设为 CloseCondition，返回 True
+        - 如果只有单边持仓：打印警告，返回 False
+        """
+        # 从 Simple_strategy 导入状态常量
+        from Simple_strategy import StrategyState
+        
+        if strategy_machine is None:
+            logging.error("[Req_Investment_position] strategy_machine 参数不能为 None")
+            return False, None
+        
+        symbol_binance = symbol_binance or cfg.BINANCE_SYMBOL
+        symbol_hyper = symbol_hyper or cfg.HYPER_SYMBOL
+        
+        binance_position = None
+        hyper_position = None
+        
+        # 1. 查询 Binance 持仓
+        if self.trade_executor.binance_client:
+            try:
+                # 查询合约持仓信息；预取结果 > 用户流缓存 > REST
+                positions = positions_data
+                if positions is None:
+                    cached = self.trade_executor.get_cached_position(symbol_binance)
+                    if cached is not None:
+                        positions = [cached]
+                if positions is None:
+                    positions = self.trade_executor.binance_client.futures_position_information(symbol=symbol_binance)
+                if positions and len(positions) > 0:
+                    pos = positions[0]
+                    position_amt = float(pos.get("positionAmt", 0))
+                    if abs(position_amt) > 1e-8:  # 有持仓（考虑浮点误差）
+                        binance_position = {
+                            "amount": position_amt,
+                            "side": "long" if position_amt > 0 else "short",
+                            "entry_price": float(pos.get("entryPrice", 0)),
+                            "unrealized_pnl": float(pos.get("unRealizedProfit", 0))
+                        }
+                        logging.info(f"[Binance] 持仓: {binance_position['side']} {abs(binance_position['amount'])} @ {binance_position['entry_price']}")
+                    else:
+                        logging.info(f"[Binance] 无持仓")
+            except Exception as e:
+                logging.error(f"[Binance] 查询持仓失败: {e}")
+        
+        # 2. 查询 Hyperliquid 持仓
+        if HAVE_HYPER_SDK and self.trade_executor.hyper_info:
+            try:
+                wallet_address = getattr(self.trade_executor, 'hyper_wallet_address', None)
+                if not wallet_address:
+                    wallet_address = cfg.HYPERTEST_WALLET
+                
+                if wallet_address:
+                    user_state = hyper_user_state
+                    if user_state is None:
+                        user_state = self.trade_executor.get_hyper_user_state(wallet_address)
+                    if user_state and "assetPositions" in user_state:
+                        positions = user_state["assetPositions"]
+                        # 查找指定币种的持仓
+                        for pos in positions:
+                            if pos.get("position", {}).get("coin") == symbol_hyper:
+                                position_data = pos.get("position", {})
+                                size = float(position_data.get("szi", 0))  # 持仓数量
+                                if abs(size) > 1e-8:  # 有持仓
+                                    hyper_position = {
+                                        "amount": size,
+                                        "side": "long" if size > 0 else "short",
+                                        "entry_price": float(position_data.get("entryPx", 0)),
+                                        "unrealized_pnl": float(pos.get("unrealizedPnl", 0))
+                                    }
+                                    logging.info(f"[Hyperliquid] 持仓: {hyper_position['side']} {abs(hyper_position['amount'])} @ {hyper_position['entry_price']}")
+                                    break
+                        
+                        if not hyper_position:
+                            logging.info(f"[Hyperliquid] 无持仓")
+            except Exception as e:
+                logging.error(f"[Hyperliquid] 查询持仓失败: {e}")
+                logging.debug("查询持仓失败堆栈", exc_info=True)
+        
+        # 3. 判断持仓状态并设置策略状态
+        has_binance = binance_position is not None
+        has_hyper = hyper_position is not None
+        
+        # 情况1: 两边都无持仓
+        if not has_binance and not has_hyper:
+            logging.info("[持仓检查] 两边都无持仓，状态设为 OpenCondition")
+            initial_state = StrategyState.OpenCondition
+            strategy_machine.update_state(initial_state)
+            return True, initial_state
+        
+        # 情况2: 两边都有持仓
+        if has_binance and has_hyper:
+            # 检查是否为对冲仓位：Binance 空 + Hyper 多
+            binance_side = binance_position["side"]
+            hyper_side = hyper_position["side"]
+            
+            if binance_side == "short" and hyper_side == "long":
+                initial_state = StrategyState.CloseCondition
+                logging.info("[持仓检查] 检测到对冲仓位（Binance 空 + Hyper 多），状态设为 CloseCondition")
+                strategy_machine.update_state(initial_state)
+                return True, initial_state
+            else:
+                # 其他组合视为单边持仓
+                print(f"警告，单边持仓: Binance={binance_side}, Hyper={hyper_side}")
+                logging.warning(f"[持仓检查] 非对冲仓位组合: Binance={binance_side}, Hyper={hyper_side}")
+                return False, None
+        
+        # 情况3: 只有单边持仓
+        print("警告，单边持仓")
+        if has_binance:
+            logging.warning(f"[持仓检查] 只有 Binance 持仓: {binance_position['side']} {abs(binance_position['amount'])}")
+        if has_hyper:
+            logging.warning(f"[持仓检查] 只有 Hyperliquid 持仓: {hyper_position['side']} {abs(hyper_position['amount'])}")
         return False, None
\ No newline at end of file